@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Caché de matrices de características para el entrenamiento de EnergiApp
+Cada entrada es un directorio con la matriz en .npy (que se carga mapeada en
+memoria) cuyo nombre es un hash del contenido del dataset y de la versión
+del pipeline de características: si no cambian ni los datos ni el pipeline,
+un nuevo entrenamiento (p. ej. otros hiperparámetros) salta directamente al
+ajuste de los modelos. El tamaño total está acotado: al añadir una entrada
+se eliminan las usadas hace más tiempo.
+
+Estructura:
+    <raíz>/<clave>/          ficheros de la matriz + entry.json
+    <raíz>/hashes.json       hash de cada dataset por (tamaño, mtime)
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+
+ENTRY_FILE = 'entry.json'
+HASHES_FILE = 'hashes.json'
+
+
+class FeatureCache:
+    """Entradas direccionadas por contenido en ``root``, como mucho ``max_bytes`` en total"""
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(root, exist_ok=True)
+
+    def dataset_hash(self, path):
+        """Hash del contenido de ``path``; se recalcula solo si cambian tamaño o mtime"""
+        stat = os.stat(path)
+        signature = [stat.st_size, stat.st_mtime_ns]
+        hashes_path = os.path.join(self.root, HASHES_FILE)
+        try:
+            with open(hashes_path) as f:
+                hashes = json.load(f)
+        except (OSError, ValueError):
+            hashes = {}
+
+        known = hashes.get(os.path.abspath(path))
+        if known and known['signature'] == signature:
+            return known['digest']
+
+        digest = hashlib.blake2b(digest_size=16)
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+
+        hashes[os.path.abspath(path)] = {'signature': signature, 'digest': digest.hexdigest()}
+        tmp_path = hashes_path + f'.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(hashes, f, indent=2)
+        os.replace(tmp_path, hashes_path)
+        return digest.hexdigest()
+
+    def key(self, dataset_path, pipeline):
+        """Clave de la matriz de ``dataset_path`` con el pipeline ``pipeline``
+        (cualquier valor serializable a JSON: versión y opciones que cambien
+        las características)"""
+        content = json.dumps({'dataset': self.dataset_hash(dataset_path), 'pipeline': pipeline},
+                             sort_keys=True)
+        return hashlib.blake2b(content.encode(), digest_size=16).hexdigest()
+
+    def get(self, key):
+        """Directorio de la entrada ``key`` o None; marca la entrada como usada"""
+        path = os.path.join(self.root, key)
+        entry_path = os.path.join(path, ENTRY_FILE)
+        if not os.path.exists(entry_path):
+            return None
+        os.utime(entry_path)
+        return path
+
+    def put(self, key, write, metadata=None):
+        """Crea la entrada ``key`` llamando a ``write(directorio)`` y aplica el
+        límite de tamaño; devuelve el directorio de la entrada.
+
+        Se escribe en un directorio temporal que se renombra al final, así
+        que una entrada nunca se ve a medio escribir.
+        """
+        tmp_path = tempfile.mkdtemp(dir=self.root, prefix='.tmp-')
+        try:
+            write(tmp_path)
+            size = sum(os.path.getsize(os.path.join(tmp_path, name)) for name in os.listdir(tmp_path))
+            with open(os.path.join(tmp_path, ENTRY_FILE), 'w') as f:
+                json.dump({'key': key, 'bytes': size, 'created': time.time(), **(metadata or {})}, f, indent=2)
+
+            path = os.path.join(self.root, key)
+            try:
+                os.rename(tmp_path, path)
+            except OSError:
+                # Otro proceso creó la misma entrada a la vez: vale la suya
+                shutil.rmtree(tmp_path, ignore_errors=True)
+        except Exception:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            raise
+
+        self.evict(keep=key)
+        return path
+
+    def entries(self):
+        """[(último uso, bytes, clave)] de las entradas completas"""
+        entries = []
+        for key in os.listdir(self.root):
+            entry_path = os.path.join(self.root, key, ENTRY_FILE)
+            try:
+                with open(entry_path) as f:
+                    size = json.load(f)['bytes']
+                entries.append((os.path.getmtime(entry_path), size, key))
+            except (OSError, ValueError, KeyError):
+                continue
+        return entries
+
+    def evict(self, keep=None):
+        """Elimina las entradas usadas hace más tiempo hasta quedar por debajo
+        de ``max_bytes`` (nunca ``keep``); devuelve las claves eliminadas"""
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        evicted = []
+        for _, size, key in entries:
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            shutil.rmtree(os.path.join(self.root, key), ignore_errors=True)
+            total -= size
+            evicted.append(key)
+        return evicted
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Almacén de características por bloques para el entrenamiento de EnergiApp
+Guarda la matriz de características en un directorio: un fichero .npy por
+bloque de filas (float64, columnas en el orden de entrenamiento), los
+timestamps de cada bloque y un manifest.json con las columnas y las filas de
+cada bloque. Los entrenadores leen los bloques con memoria mapeada y solo
+las columnas que necesitan, sin cargar el CSV ni el DataFrame completo.
+
+Estructura:
+    <directorio>/manifest.json
+    <directorio>/chunk_00000.npy        (filas x columnas numéricas)
+    <directorio>/timestamp_00000.npy    (datetime64[ns])
+"""
+
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+MANIFEST = 'manifest.json'
+TIMESTAMP = 'timestamp'
+
+
+class FeatureStore:
+    """Matriz de características guardada por bloques en ``path``.
+
+    Se escribe con ``append`` (un DataFrame por bloque, siempre con las
+    mismas columnas) y ``close``; el manifiesto se escribe al final, así que
+    un directorio sin manifest.json es una escritura incompleta.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        manifest_path = os.path.join(path, MANIFEST)
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                self.manifest = json.load(f)
+        else:
+            self.manifest = None
+
+    @classmethod
+    def create(cls, path):
+        """Store vacío en ``path`` (borra lo que hubiera) listo para ``append``"""
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        os.makedirs(path)
+        store = cls(path)
+        store.manifest = {'columns': None, 'chunks': [], 'rows': 0, 'complete': False}
+        return store
+
+    @property
+    def columns(self):
+        """Columnas en el orden original (incluye 'timestamp')"""
+        return self.manifest['columns']
+
+    @property
+    def numeric_columns(self):
+        return [c for c in self.columns if c != TIMESTAMP]
+
+    @property
+    def rows(self):
+        return self.manifest['rows']
+
+    def append(self, frame):
+        """Añade un bloque de filas (en orden temporal)"""
+        if self.manifest['columns'] is None:
+            self.manifest['columns'] = list(frame.columns)
+        elif list(frame.columns) != self.manifest['columns']:
+            raise ValueError("Las columnas del bloque no coinciden con las del store")
+
+        index = len(self.manifest['chunks'])
+        chunk_file = f'chunk_{index:05d}.npy'
+        np.save(os.path.join(self.path, chunk_file),
+                frame[self.numeric_columns].to_numpy(dtype=np.float64))
+        timestamp_file = None
+        if TIMESTAMP in frame.columns:
+            timestamp_file = f'timestamp_{index:05d}.npy'
+            np.save(os.path.join(self.path, timestamp_file),
+                    frame[TIMESTAMP].to_numpy(dtype='datetime64[ns]'))
+
+        self.manifest['chunks'].append({'file': chunk_file, 'timestamp_file': timestamp_file,
+                                        'rows': len(frame)})
+        self.manifest['rows'] += len(frame)
+
+    def close(self):
+        """Escribe el manifiesto (de forma atómica) y marca el store como completo"""
+        self.manifest['complete'] = True
+        tmp_path = os.path.join(self.path, MANIFEST + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(tmp_path, os.path.join(self.path, MANIFEST))
+
+    def iter_chunks(self, columns=None):
+        """Genera (timestamps, matriz) por bloque con las ``columns`` pedidas.
+
+        Las matrices son vistas de ficheros mapeados en memoria cuando se
+        piden todas las columnas numéricas; si no, copias de las columnas.
+        """
+        if self.manifest is None or not self.manifest.get('complete'):
+            raise FileNotFoundError(f"Store de características incompleto: {self.path}")
+
+        positions = None
+        if columns is not None:
+            index = {name: j for j, name in enumerate(self.numeric_columns)}
+            positions = [index[name] for name in columns]
+
+        for chunk in self.manifest['chunks']:
+            matrix = np.load(os.path.join(self.path, chunk['file']), mmap_mode='r')
+            if positions is not None:
+                matrix = matrix[:, positions]
+            timestamps = None
+            if chunk['timestamp_file']:
+                timestamps = np.load(os.path.join(self.path, chunk['timestamp_file']))
+            yield timestamps, matrix
+
+    def to_frame(self, columns=None):
+        """DataFrame con todas las filas (columnas en el orden original)"""
+        with_timestamps = columns is None and TIMESTAMP in self.columns
+        columns = columns or self.numeric_columns
+        matrix = np.empty((self.rows, len(columns)), dtype=np.float64)
+        timestamps = np.empty(self.rows, dtype='datetime64[ns]')
+        row = 0
+        for chunk_timestamps, chunk in self.iter_chunks(columns):
+            matrix[row:row + len(chunk)] = chunk
+            if chunk_timestamps is not None:
+                timestamps[row:row + len(chunk)] = chunk_timestamps
+            row += len(chunk)
+
+        frame = pd.DataFrame(matrix, columns=columns, copy=False)
+        if with_timestamps:
+            frame.insert(self.columns.index(TIMESTAMP), TIMESTAMP, timestamps)
+        return frame
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Estadísticos suficientes de los modelos lineales de EnergiApp
+Los modelos Ridge y lineal del consumo agregado (con su StandardScaler) se
+reconstruyen a partir de sumas sobre las filas de entrenamiento: n, Σx, Σy,
+Σx·xᵀ y Σx·y. Las sumas se acumulan por bloques y se guardan junto al
+modelo, así que una actualización incremental solo recorre las filas nuevas
+y el resultado es el mismo que reentrenar con todo el histórico.
+"""
+
+import numpy as np
+from sklearn.linear_model import LinearRegression, Ridge
+from sklearn.preprocessing import StandardScaler
+
+# Filas que se convierten a float64 a la vez al acumular
+CHUNK_ROWS = 65536
+
+
+class LinearStatistics:
+    """Sumas acumuladas de un problema de regresión lineal con ``n_features`` columnas"""
+
+    def __init__(self, n_features):
+        self.n = 0
+        self.sum_x = np.zeros(n_features)
+        self.sum_y = 0.0
+        self.xtx = np.zeros((n_features, n_features))
+        self.xty = np.zeros(n_features)
+
+    @classmethod
+    def from_rows(cls, X, y):
+        stats = cls(X.shape[1])
+        stats.update(X, y)
+        return stats
+
+    def update(self, X, y):
+        """Añade las filas de ``X`` (cualquier dtype, p. ej. float32 mapeado) e ``y``"""
+        for start in range(0, len(X), CHUNK_ROWS):
+            X_chunk = np.asarray(X[start:start + CHUNK_ROWS], dtype=np.float64)
+            y_chunk = np.asarray(y[start:start + CHUNK_ROWS], dtype=np.float64)
+            self.n += len(X_chunk)
+            self.sum_x += X_chunk.sum(axis=0)
+            self.sum_y += y_chunk.sum()
+            self.xtx += X_chunk.T @ X_chunk
+            self.xty += X_chunk.T @ y_chunk
+
+    def save(self, path):
+        np.savez(path, n=self.n, sum_x=self.sum_x, sum_y=self.sum_y, xtx=self.xtx, xty=self.xty)
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        stats = cls(len(data['sum_x']))
+        stats.n = int(data['n'])
+        stats.sum_x = data['sum_x']
+        stats.sum_y = float(data['sum_y'])
+        stats.xtx = data['xtx']
+        stats.xty = data['xty']
+        return stats
+
+    def scaler(self):
+        """StandardScaler equivalente a ``fit`` sobre las filas acumuladas"""
+        mean = self.sum_x / self.n
+        var = np.maximum(np.diag(self.xtx) / self.n - mean ** 2, 0.0)
+        scaler = StandardScaler()
+        scaler.mean_ = mean
+        scaler.var_ = var
+        # Como scikit-learn: las columnas constantes no se escalan
+        scaler.scale_ = np.where(var > np.finfo(np.float64).eps, np.sqrt(var), 1.0)
+        scaler.n_samples_seen_ = self.n
+        scaler.n_features_in_ = len(mean)
+        return scaler
+
+    def fit(self, model_type, alpha=1.0):
+        """(modelo, scaler) 'ridge' o 'linear' sobre las filas escaladas.
+
+        Con las columnas centradas y escaladas, Ridge resuelve
+        (XᵀX + αI) w = Xᵀy y la regresión lineal el mismo sistema sin α; la
+        intersección es la media de y porque X escalada tiene media 0.
+        
+        Ridge coincide con scikit-learn (salvo redondeo). La regresión lineal
+        solo coincide si X tiene rango completo: con columnas colineales
+        (calendario, lags) ``lstsq`` sobre XᵀX descarta los valores singulares
+        de X por debajo de sqrt(columnas·eps) veces el mayor y da la solución de norma
+        mínima, mientras que ``LinearRegression`` conserva direcciones casi
+        nulas y da coeficientes enormes. Es deliberado: la solución es estable
+        entre actualizaciones, pero sus predicciones pueden diferir de un
+        reentrenamiento completo con scikit-learn (del orden de 10 W con los
+        datos de UK-DALE).
+        """
+        scaler = self.scaler()
+        mean_x = scaler.mean_
+        mean_y = self.sum_y / self.n
+
+        # Momentos centrados y escalados
+        gram = self.xtx - self.n * np.outer(mean_x, mean_x)
+        cross = self.xty - self.n * mean_x * mean_y
+        gram /= np.outer(scaler.scale_, scaler.scale_)
+        cross /= scaler.scale_
+
+        if model_type == 'ridge':
+            model = Ridge(alpha=alpha)
+            coef = np.linalg.solve(gram + alpha * np.eye(len(gram)), cross)
+        elif model_type == 'linear':
+            model = LinearRegression()
+            coef = np.linalg.lstsq(gram, cross, rcond=None)[0]
+        else:
+            raise ValueError(f"Modelo lineal desconocido: {model_type}")
+
+        model.coef_ = coef
+        model.intercept_ = mean_y
+        model.n_features_in_ = len(coef)
+        return model, scaler
@@ -15,7 +15,13 @@ import sys
 import joblib
 import json
 from datetime import datetime, timedelta
+from functools import partial
 import logging
+import resource
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -28,15 +34,164 @@ from sklearn.model_selection import train_test_split, cross_val_score, TimeSerie
 from sklearn.preprocessing import StandardScaler, LabelEncoder
 from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score, mean_absolute_percentage_error
 
+# Registro de modelos y tabla de calendario compartidos con el servicio de predicción
+sys.path.insert(0, '../../ml-models')
+from model_registry import ModelRegistry
+from calendar_table import CALENDAR, CALENDAR_FEATURES, HOLIDAY_FEATURES
+from feature_cache import FeatureCache
+from feature_store import FeatureStore
+from linear_statistics import LinearStatistics
+from process_memory import process_memory_mb
+
 # Crear directorio de modelos
-os.makedirs('../../ml-models/models', exist_ok=True)
+MODELS_DIR = '../../ml-models/models'
+os.makedirs(MODELS_DIR, exist_ok=True)
+
+# Con FEATURE_CHUNK_ROWS > 0 las características se crean por bloques y se
+# guardan en FEATURE_STORE_DIR en lugar de construirse en memoria
+FEATURE_CHUNK_ROWS = int(os.getenv('FEATURE_CHUNK_ROWS', 0))
+FEATURE_STORE_DIR = os.getenv('FEATURE_STORE_DIR', 'features')
+
+# Filas de historia que necesita cada fila (lag y ventana móvil de 1 día)
+FEATURE_HISTORY_ROWS = 14400
+
+DATASET_PATH = 'uk_dale_synthetic.csv'
+
+# Caché de matrices de características por hash del dataset y del pipeline
+# (FEATURE_CACHE_DIR vacío la desactiva). Incrementar FEATURE_PIPELINE_VERSION
+# al cambiar cómo se calculan las características
+FEATURE_PIPELINE_VERSION = 1
+FEATURE_CACHE_DIR = os.getenv('FEATURE_CACHE_DIR', 'feature_cache')
+FEATURE_CACHE_MAX_MB = int(os.getenv('FEATURE_CACHE_MAX_MB', 2048))
+
+# TRAINING_MODE=incremental actualiza la versión activa solo con las filas
+# posteriores a su marca de agua (data_watermark) en lugar de reentrenar:
+# los bosques añaden INCREMENTAL_TREES árboles (y descartan los más antiguos
+# por encima de INCREMENTAL_MAX_TREES) y los modelos lineales se recalculan
+# desde sus estadísticos suficientes
+TRAINING_MODE = os.getenv('TRAINING_MODE', 'full').lower()
+INCREMENTAL_TREES = int(os.getenv('INCREMENTAL_TREES', 10))
+INCREMENTAL_MAX_TREES = int(os.getenv('INCREMENTAL_MAX_TREES', 200))
+
+# Núcleos para entrenar: los ajustes independientes se reparten en un pool de
+# procesos y cada bosque usa los núcleos que le tocan
+TRAINING_CORES = int(os.getenv('TRAINING_CORES', os.cpu_count() or 1))
+# Medir además la ejecución en serie (un trabajo tras otro con todos los
+# núcleos) para dar la aceleración real del pool; duplica el entrenamiento
+TRAINING_SERIAL_BASELINE = os.getenv('TRAINING_SERIAL_BASELINE', 'false').lower() == 'true'
+
+APPLIANCES = ['fridge', 'washing_machine', 'dishwasher', 'kettle', 'microwave', 'toaster', 'television', 'lighting']
+TARGETS = ['aggregate'] + APPLIANCES
+
+class FeatureMatrix:
+    """Matriz de características float32 preasignada con índice de columnas.
+    
+    Se reserva una vez y las columnas se escriben en su sitio; en orden
+    Fortran cada columna es contigua y un rango de columnas o de filas es una
+    vista, sin copias. Los árboles de scikit-learn entrenan en float32 de
+    todos modos; los objetivos (``targets``) se guardan aparte en float64
+    para que las métricas no cambien.
+    """
+    
+    def __init__(self, columns, data, targets):
+        self.columns = list(columns)
+        self.index = {name: j for j, name in enumerate(self.columns)}
+        self.data = data
+        self.targets = targets
+        # Último timestamp (ISO) de los datos de la matriz
+        self.watermark = None
+        # Directorio de los .npy si la matriz está mapeada desde disco
+        self.path = None
+    
+    def __len__(self):
+        return len(self.data)
+    
+    @classmethod
+    def empty(cls, columns, rows):
+        """Matriz sin inicializar de ``rows`` filas"""
+        data = np.empty((rows, len(columns)), dtype=np.float32, order='F')
+        targets = {name: np.empty(rows) for name in columns if name in TARGETS}
+        return cls(columns, data, targets)
+    
+    @classmethod
+    def from_store(cls, store):
+        """Rellena la matriz bloque a bloque desde un FeatureStore"""
+        matrix = cls.empty(store.numeric_columns, store.rows)
+        row = 0
+        for timestamps, chunk in store.iter_chunks():
+            rows = slice(row, row + len(chunk))
+            matrix.data[rows] = chunk
+            for name, target in matrix.targets.items():
+                target[rows] = chunk[:, matrix.index[name]]
+            row += len(chunk)
+            if timestamps is not None and len(timestamps):
+                matrix.watermark = pd.Timestamp(timestamps[-1]).isoformat()
+        return matrix
+    
+    def tail(self, start):
+        """Vista de las filas desde ``start`` (p. ej. sin las filas de historia)"""
+        tail = FeatureMatrix(self.columns, self.data[start:],
+                             {name: target[start:] for name, target in self.targets.items()})
+        tail.watermark = self.watermark
+        return tail
+    
+    def save(self, path):
+        """Guarda la matriz y los objetivos como .npy en el directorio ``path``"""
+        np.save(os.path.join(path, 'features.npy'), self.data)
+        for name, target in self.targets.items():
+            np.save(os.path.join(path, f'target_{name}.npy'), target)
+        with open(os.path.join(path, 'columns.json'), 'w') as f:
+            json.dump({'columns': self.columns, 'watermark': self.watermark}, f)
+    
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        """Matriz guardada con ``save``, mapeada en memoria (compartida entre procesos)"""
+        with open(os.path.join(path, 'columns.json')) as f:
+            meta = json.load(f)
+        columns = meta['columns']
+        data = np.load(os.path.join(path, 'features.npy'), mmap_mode=mmap_mode)
+        targets = {
+            name: np.load(os.path.join(path, f'target_{name}.npy'), mmap_mode=mmap_mode)
+            for name in columns if name in TARGETS
+        }
+        matrix = cls(columns, data, targets)
+        matrix.watermark = meta['watermark']
+        matrix.path = path if mmap_mode else None
+        return matrix
+    
+    def set(self, name, values):
+        """Escribe una columna en su sitio"""
+        self.data[:, self.index[name]] = values
+        if name in self.targets:
+            self.targets[name][:] = values
+    
+    def select(self, columns, out=None):
+        """Columnas ``columns`` en ese orden: una vista si son consecutivas;
+        si no, una copia en ``out`` (un buffer reutilizable) o en uno nuevo"""
+        positions = [self.index[name] for name in columns]
+        if positions == list(range(positions[0], positions[0] + len(positions))):
+            return self.data[:, positions[0]:positions[-1] + 1]
+        if out is None:
+            out = np.empty((len(self), len(columns)), dtype=np.float32, order='F')
+        return np.take(self.data, positions, axis=1, out=out)
+
+def log_memory(stage):
+    """Registra la memoria residente actual y el pico del proceso (MB)"""
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    message = f"💾 {stage}: RSS {process_memory_mb()['rss_mb']} MB, pico {peak_mb:.1f} MB"
+    # Pico del mayor proceso hijo (p. ej. del pool de entrenamiento), si lo hubo
+    children_peak_mb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    if children_peak_mb:
+        message += f" (procesos hijos: pico {children_peak_mb:.1f} MB)"
+    logger.info(message)
+    return peak_mb
 
 def load_ukdale_data():
     """Carga y preprocesa el dataset UK-DALE"""
     logger.info("🔄 Cargando dataset UK-DALE...")
     
     # Cargar datos
-    df = pd.read_csv('uk_dale_synthetic.csv')
+    df = pd.read_csv(DATASET_PATH)
     df['timestamp'] = pd.to_datetime(df['timestamp'])
     
     logger.info(f"📊 Dataset cargado: {len(df)} muestras, {len(df.columns)} columnas")
@@ -47,48 +202,56 @@ def load_ukdale_data():
     
     return df, metadata
 
+def feature_pipeline():
+    """Lo que, además de los datos, determina la matriz de características"""
+    return {
+        'version': FEATURE_PIPELINE_VERSION,
+        'chunked': FEATURE_CHUNK_ROWS > 0,
+        'holidays': CALENDAR.holidays_available,
+        'dtype': 'float32',
+    }
+
+def build_features():
+    """FeatureMatrix del dataset: desde la caché si ya se calculó con el mismo
+    dataset y pipeline; si no, se crea (en memoria o por bloques) y se guarda.
+    
+    La matriz de la caché se devuelve mapeada en memoria: la carga es casi
+    inmediata y el pool de entrenamiento mapea los mismos ficheros.
+    """
+    cache = None
+    if FEATURE_CACHE_DIR:
+        cache = FeatureCache(FEATURE_CACHE_DIR, FEATURE_CACHE_MAX_MB * 1024 * 1024)
+        key = cache.key(DATASET_PATH, feature_pipeline())
+        path = cache.get(key)
+        if path is not None:
+            logger.info(f"⚡ Características desde la caché: {path}")
+            return FeatureMatrix.load(path)
+    
+    if FEATURE_CHUNK_ROWS > 0:
+        # Crear características por bloques directamente desde el CSV
+        store = create_features_chunked(DATASET_PATH, FEATURE_STORE_DIR, FEATURE_CHUNK_ROWS)
+        features = FeatureMatrix.from_store(store)
+    else:
+        # Cargar datos y crear características (una matriz float32; el CSV se libera)
+        df, metadata = load_ukdale_data()
+        features = create_feature_matrix(df)
+        del df
+    
+    if cache is not None:
+        path = cache.put(key, features.save, {'dataset': os.path.abspath(DATASET_PATH),
+                                              'pipeline': feature_pipeline()})
+        logger.info(f"💾 Características guardadas en la caché: {path}")
+        # Se sigue con la copia mapeada y se libera la de memoria
+        features = FeatureMatrix.load(path)
+    
+    return features
+
 def create_features(df):
     """Crea características para machine learning"""
     logger.info("🔧 Creando características para ML...")
     
     df_features = df.copy()
-    
-    # Características temporales
-    df_features['hour'] = df_features['timestamp'].dt.hour
-    df_features['day_of_week'] = df_features['timestamp'].dt.dayofweek
-    df_features['month'] = df_features['timestamp'].dt.month
-    df_features['quarter'] = df_features['timestamp'].dt.quarter
-    df_features['is_weekend'] = (df_features['timestamp'].dt.dayofweek >= 5).astype(int)
-    
-    # Características cíclicas (mejor para capturar patrones temporales)
-    df_features['hour_sin'] = np.sin(2 * np.pi * df_features['hour'] / 24)
-    df_features['hour_cos'] = np.cos(2 * np.pi * df_features['hour'] / 24)
-    df_features['day_sin'] = np.sin(2 * np.pi * df_features['day_of_week'] / 7)
-    df_features['day_cos'] = np.cos(2 * np.pi * df_features['day_of_week'] / 7)
-    
-    # Variables externas
-    if 'temperature' in df_features.columns:
-        df_features['temp_squared'] = df_features['temperature'] ** 2
-    if 'humidity' in df_features.columns:
-        df_features['humidity_normalized'] = df_features['humidity'] / 100
-    
-    # Lag features para capturar dependencia temporal
-    appliances = ['fridge', 'washing_machine', 'dishwasher', 'kettle', 'microwave', 'toaster', 'television', 'lighting']
-    
-    for appliance in appliances:
-        if appliance in df_features.columns:
-            # Lags de diferentes períodos
-            df_features[f'{appliance}_lag_1'] = df_features[appliance].shift(1)  # 6 segundos antes
-            df_features[f'{appliance}_lag_10'] = df_features[appliance].shift(10)  # 1 minuto antes
-            df_features[f'{appliance}_lag_600'] = df_features[appliance].shift(600)  # 1 hora antes
-            df_features[f'{appliance}_lag_14400'] = df_features[appliance].shift(14400)  # 1 día antes
-    
-    # Rolling features (medias móviles)
-    for appliance in appliances:
-        if appliance in df_features.columns:
-            df_features[f'{appliance}_rolling_mean_1h'] = df_features[appliance].rolling(600, min_periods=1).mean()
-            df_features[f'{appliance}_rolling_std_1h'] = df_features[appliance].rolling(600, min_periods=1).std()
-            df_features[f'{appliance}_rolling_mean_24h'] = df_features[appliance].rolling(14400, min_periods=1).mean()
+    add_features(df_features)
     
     # Eliminar filas con NaN creadas por los lags
     df_features = df_features.fillna(method='ffill').fillna(0)
@@ -97,44 +260,175 @@ def create_features(df):
     
     return df_features
 
-def train_aggregate_predictor(df_features):
-    """Entrena modelo para predecir consumo agregado total"""
-    logger.info("🧠 Entrenando modelo para consumo agregado...")
+def create_features_chunked(csv_path, store_dir, chunk_rows=FEATURE_CHUNK_ROWS):
+    """Crea las características por bloques y las guarda en un FeatureStore.
+    
+    Lee el CSV en bloques de ``chunk_rows`` filas en orden temporal y arrastra
+    entre bloques las últimas FEATURE_HISTORY_ROWS filas crudas (el lag y la
+    ventana más largos), de modo que la memoria depende del tamaño de bloque
+    y no del dataset. Lags, calendario y relleno de NaN coinciden exactamente
+    con ``create_features``; las medias y desviaciones móviles, salvo el
+    redondeo de las sumas acumuladas de pandas (del orden de 1e-12).
+    """
+    logger.info(f"🔧 Creando características por bloques de {chunk_rows} filas...")
+    
+    store = FeatureStore.create(store_dir)
+    history = None
+    last_row = None
+    
+    for chunk in pd.read_csv(csv_path, chunksize=chunk_rows):
+        chunk['timestamp'] = pd.to_datetime(chunk['timestamp'])
+        raw_columns = list(chunk.columns)
+        
+        frame = chunk if history is None else pd.concat([history, chunk], ignore_index=True)
+        history = frame[raw_columns].iloc[-FEATURE_HISTORY_ROWS:]
+        add_features(frame)
+        features = frame.iloc[len(frame) - len(chunk):]
+        
+        # El relleno hacia delante continúa desde la última fila ya rellenada
+        if last_row is not None:
+            features = pd.concat([last_row, features]).ffill().iloc[1:]
+        features = features.ffill().fillna(0)
+        last_row = features.iloc[-1:]
+        
+        store.append(features)
     
-    # Preparar datos
-    feature_columns = [col for col in df_features.columns if col not in ['timestamp', 'aggregate']]
-    X = df_features[feature_columns]
-    y = df_features['aggregate']
+    store.close()
+    logger.info(f"✅ Características creadas: {store.rows} filas, {len(store.columns)} columnas "
+                f"en {len(store.manifest['chunks'])} bloques ({store_dir})")
+    
+    return store
+
+def create_feature_matrix(df):
+    """Crea las mismas características que ``create_features`` directamente
+    en una FeatureMatrix float32: una columna cada vez, sin copiar el
+    DataFrame ni crear columnas float64 intermedias para todo el conjunto"""
+    logger.info("🔧 Creando matriz de características (float32)...")
+    
+    definitions = feature_definitions(df)
+    raw_columns = [col for col in df.columns if col != 'timestamp']
+    matrix = FeatureMatrix.empty(raw_columns + [name for name, _ in definitions], len(df))
+    
+    for name in raw_columns:
+        matrix.set(name, fill_missing(df[name]))
+    for name, compute in definitions:
+        matrix.set(name, fill_missing(compute()))
+    if len(df):
+        matrix.watermark = pd.Timestamp(df['timestamp'].iloc[-1]).isoformat()
+    
+    logger.info(f"✅ Características creadas: {len(matrix.columns)} columnas, "
+                f"{matrix.data.nbytes / 1e6:.1f} MB")
+    
+    return matrix
+
+def fill_missing(values):
+    """Rellena NaN hacia delante y con 0 al principio (como ``create_features``)"""
+    return pd.Series(values).ffill().fillna(0).to_numpy(dtype=np.float64)
+
+def add_features(df_features):
+    """Añade a ``df_features`` (en orden temporal) las columnas de características, sin rellenar NaN"""
+    for name, compute in feature_definitions(df_features):
+        df_features[name] = compute()
+
+def feature_definitions(df):
+    """(nombre, función) de cada característica derivada de ``df``, en orden
+    de columnas; cada función calcula su columna (sin rellenar NaN) al llamarla"""
+    definitions = []
+    
+    # Características temporales, cíclicas y festivos desde la tabla de
+    # calendario que también usa el servicio (mismos valores al predecir)
+    calendar = {}
+    
+    def calendar_feature(name):
+        if not calendar:
+            calendar.update(CALENDAR.for_timestamps(df['timestamp'].values))
+        return calendar[name]
+    
+    for name in CALENDAR_FEATURES + HOLIDAY_FEATURES:
+        definitions.append((name, partial(calendar_feature, name)))
+    
+    # Variables externas
+    if 'temperature' in df.columns:
+        definitions.append(('temp_squared', lambda: df['temperature'] ** 2))
+    if 'humidity' in df.columns:
+        definitions.append(('humidity_normalized', lambda: df['humidity'] / 100))
+    
+    # Lag features para capturar dependencia temporal: 6 segundos, 1 minuto,
+    # 1 hora y 1 día antes
+    for appliance in APPLIANCES:
+        if appliance in df.columns:
+            for lag in (1, 10, 600, 14400):
+                definitions.append((f'{appliance}_lag_{lag}', partial(df[appliance].shift, lag)))
+    
+    # Rolling features (medias móviles)
+    for appliance in APPLIANCES:
+        if appliance in df.columns:
+            rolling_1h = partial(df[appliance].rolling, 600, min_periods=1)
+            rolling_24h = partial(df[appliance].rolling, 14400, min_periods=1)
+            definitions.append((f'{appliance}_rolling_mean_1h', lambda r=rolling_1h: r().mean()))
+            definitions.append((f'{appliance}_rolling_std_1h', lambda r=rolling_1h: r().std()))
+            definitions.append((f'{appliance}_rolling_mean_24h', lambda r=rolling_24h: r().mean()))
+    
+    return definitions
+
+def aggregate_candidate(name, n_jobs=-1):
+    """Modelo candidato ``name`` para el consumo agregado"""
+    models = {
+        'random_forest': lambda: RandomForestRegressor(n_estimators=100, max_depth=15, random_state=42, n_jobs=n_jobs),
+        'gradient_boosting': lambda: GradientBoostingRegressor(n_estimators=100, max_depth=8, learning_rate=0.1, random_state=42),
+        'ridge': lambda: Ridge(alpha=1.0),
+        'linear': lambda: LinearRegression()
+    }
+    return models[name]()
+
+# Modelos a probar, en orden de preferencia ante empates; los lineales
+# comparten trabajo (y la copia escalada de X)
+AGGREGATE_CANDIDATES = ['random_forest', 'gradient_boosting', 'ridge', 'linear']
+AGGREGATE_JOBS = [('random_forest',), ('gradient_boosting',), ('ridge', 'linear')]
+LINEAR_MODELS = ('ridge', 'linear')
+LINEAR_STATISTICS_FILE = 'aggregate_linear_stats.npz'
+
+def aggregate_jobs():
+    """Trabajos de entrenamiento de los candidatos del modelo agregado"""
+    return [(f"aggregate/{'+'.join(names)}", fit_aggregate_candidates, (names,)) for names in AGGREGATE_JOBS]
+
+def appliance_jobs(features):
+    """Un trabajo de entrenamiento por electrodoméstico presente"""
+    return [(f'appliance/{appliance}', fit_appliance_predictor, (appliance,))
+            for appliance in APPLIANCES if appliance in features.columns]
+
+def fit_aggregate_candidates(features, names, n_jobs=-1):
+    """Entrena y evalúa los candidatos ``names`` del modelo agregado.
+    
+    Devuelve {nombre: {'mae', 'rmse', 'r2', 'mape', 'model', 'scaler'}}.
+    """
+    # Preparar datos (vistas de la FeatureMatrix, sin copias)
+    feature_columns = [col for col in features.columns if col != 'aggregate']
+    X = features.select(feature_columns)
+    y = features.targets['aggregate']
     
     # División temporal (importante para series temporales)
-    split_idx = int(len(df_features) * 0.8)
+    split_idx = int(len(features) * 0.8)
     X_train, X_test = X[:split_idx], X[split_idx:]
     y_train, y_test = y[:split_idx], y[split_idx:]
     
-    # Escalado
+    # Escalado para los modelos lineales: una copia float64 escalada en su sitio
     scaler = StandardScaler()
-    X_train_scaled = scaler.fit_transform(X_train)
-    X_test_scaled = scaler.transform(X_test)
-    
-    # Modelos a probar
-    models = {
-        'random_forest': RandomForestRegressor(n_estimators=100, max_depth=15, random_state=42, n_jobs=-1),
-        'gradient_boosting': GradientBoostingRegressor(n_estimators=100, max_depth=8, learning_rate=0.1, random_state=42),
-        'ridge': Ridge(alpha=1.0),
-        'linear': LinearRegression()
-    }
+    X_scaled = None
     
     results = {}
-    best_model = None
-    best_score = float('inf')
-    
-    for name, model in models.items():
+    for name in names:
         logger.info(f"  🔄 Entrenando {name}...")
+        model = aggregate_candidate(name, n_jobs)
         
         # Entrenar
         if name in ['ridge', 'linear']:
-            model.fit(X_train_scaled, y_train)
-            y_pred = model.predict(X_test_scaled)
+            if X_scaled is None:
+                X_scaled = np.array(X, dtype=np.float64)
+                scaler.fit(X_scaled[:split_idx])
+                scaler.transform(X_scaled, copy=False)
+            model.fit(X_scaled[:split_idx], y_train)
+            y_pred = model.predict(X_scaled[split_idx:])
         else:
             model.fit(X_train, y_train)
             y_pred = model.predict(X_test)
@@ -150,215 +444,432 @@ def train_aggregate_predictor(df_features):
             'rmse': rmse,
             'r2': r2,
             'mape': mape,
-            'model': model
+            'model': model,
+            'scaler': scaler if name in ['ridge', 'linear'] else None
         }
         
-        logger.info(f"    MAE: {mae:.2f}W, RMSE: {rmse:.2f}W, R²: {r2:.3f}, MAPE: {mape:.1f}%")
-        
-        if mae < best_score:
-            best_score = mae
-            best_model = model
-            best_model_name = name
-            best_scaler = scaler if name in ['ridge', 'linear'] else None
+        logger.info(f"    {name}: MAE: {mae:.2f}W, RMSE: {rmse:.2f}W, R²: {r2:.3f}, MAPE: {mape:.1f}%")
+    
+    return results
+
+# Buffer float32 de X que reutilizan los modelos de electrodomésticos que
+# se entrenan en el mismo proceso (todos tienen el mismo número de columnas)
+_appliance_buffer = None
+
+def appliance_buffer(rows, columns):
+    """Buffer (rows x columns) del proceso; se crea de nuevo si cambia la forma"""
+    global _appliance_buffer
+    if _appliance_buffer is None or _appliance_buffer.shape != (rows, columns):
+        _appliance_buffer = None
+        _appliance_buffer = np.empty((rows, columns), dtype=np.float32, order='F')
+    return _appliance_buffer
+
+def fit_appliance_predictor(features, appliance, n_jobs=-1):
+    """Entrena y evalúa el modelo de un electrodoméstico"""
+    logger.info(f"  🔧 Entrenando modelo para: {appliance}")
+    
+    # Características específicas para este aparato
+    feature_columns = [col for col in features.columns 
+                      if col not in ['timestamp'] + APPLIANCES]
+    
+    # Añadir características específicas de otros aparatos (como contexto)
+    other_appliances = [app for app in APPLIANCES if app != appliance and app in features.columns]
+    feature_columns.extend(other_appliances)
+    
+    # Todas las columnas menos el aparato objetivo (copiadas al buffer del proceso)
+    X = features.select(feature_columns, out=appliance_buffer(len(features), len(feature_columns)))
+    y = features.targets[appliance]
+    
+    # División temporal
+    split_idx = int(len(features) * 0.8)
+    X_train, X_test = X[:split_idx], X[split_idx:]
+    y_train, y_test = y[:split_idx], y[split_idx:]
+    
+    # Modelo Random Forest (mejor para este tipo de datos)
+    model = RandomForestRegressor(n_estimators=50, max_depth=10, random_state=42, n_jobs=n_jobs)
+    model.fit(X_train, y_train)
+    
+    # Evaluar
+    y_pred = model.predict(X_test)
+    mae = mean_absolute_error(y_test, y_pred)
+    r2 = r2_score(y_test, y_pred)
+    
+    logger.info(f"    {appliance}: MAE={mae:.2f}W, R²={r2:.3f}")
+    
+    return {
+        'model': model,
+        'mae': mae,
+        'r2': r2,
+        'feature_columns': feature_columns
+    }
+
+# FeatureMatrix mapeada por cada proceso del pool de entrenamiento
+_worker_features = None
+
+def _init_training_worker(path):
+    """Inicializador del pool: mapea la matriz compartida (solo lectura)"""
+    global _worker_features
+    _worker_features = FeatureMatrix.load(path)
+
+def _run_training_job(function, args, n_jobs, features=None):
+    """Ejecuta un trabajo; devuelve (resultado, segundos de reloj, segundos de CPU)"""
+    started = time.perf_counter()
+    cpu_started = time.process_time()
+    result = function(features if features is not None else _worker_features, *args, n_jobs=n_jobs)
+    return result, time.perf_counter() - started, time.process_time() - cpu_started
+
+def run_training_jobs(features, jobs, cores=TRAINING_CORES, serial_baseline=TRAINING_SERIAL_BASELINE):
+    """Ejecuta ajustes independientes [(nombre, función, args)]; {nombre: resultado}.
+    
+    Con más de un núcleo los trabajos se reparten en un pool de procesos
+    (como mucho uno por trabajo) y cada bosque usa ``cores // procesos``
+    hilos, sin pasar del presupuesto. La matriz se guarda una vez en .npy y
+    cada proceso la mapea en memoria en lugar de recibirla serializada.
+    Registra la duración de cada trabajo y la aceleración del pool: frente
+    a la suma de los tiempos de reloj de los trabajos (estimación) o, con
+    ``serial_baseline``, frente a una ejecución en serie medida con todos los
+    núcleos por trabajo. El tiempo de CPU (de todos los hilos) se registra
+    aparte: no es una medida de la ejecución en serie.
+    """
+    global _appliance_buffer
+    processes = max(1, min(cores, len(jobs)))
+    n_jobs = max(1, cores // processes)
+    logger.info(f"⚙️ {len(jobs)} trabajos de entrenamiento en {processes} procesos ({n_jobs} hilos por modelo)")
+    
+    started = time.perf_counter()
+    results = {}
+    job_seconds = {}
+    cpu_seconds = {}
+    
+    if processes == 1:
+        for name, function, args in jobs:
+            results[name], job_seconds[name], cpu_seconds[name] = _run_training_job(function, args, n_jobs, features)
+            logger.info(f"  ⏱️ {name}: {job_seconds[name]:.1f}s ({cpu_seconds[name]:.1f}s de CPU)")
+        # El buffer de X ya no hace falta en este proceso
+        _appliance_buffer = None
+    else:
+        # Si la matriz ya está mapeada desde disco (caché), se comparten esos ficheros
+        shared_dir = features.path or tempfile.mkdtemp(prefix='energiapp-features-')
+        try:
+            if features.path is None:
+                features.save(shared_dir)
+            with ProcessPoolExecutor(max_workers=processes, initializer=_init_training_worker,
+                                     initargs=(shared_dir,)) as pool:
+                futures = {
+                    pool.submit(_run_training_job, function, args, n_jobs): name
+                    for name, function, args in jobs
+                }
+                for future in as_completed(futures):
+                    name = futures[future]
+                    results[name], job_seconds[name], cpu_seconds[name] = future.result()
+                    logger.info(f"  ⏱️ {name}: {job_seconds[name]:.1f}s ({cpu_seconds[name]:.1f}s de CPU, "
+                                f"terminado a los {time.perf_counter() - started:.1f}s)")
+        finally:
+            if features.path is None:
+                shutil.rmtree(shared_dir, ignore_errors=True)
+    
+    wall = time.perf_counter() - started
+    cpu = sum(cpu_seconds.values())
+    if processes == 1:
+        logger.info(f"⏱️ Entrenamiento en serie en {wall:.1f}s ({cpu:.1f}s de CPU en trabajos)")
+        return results
+    
+    # Los trabajos del pool comparten núcleos: la suma de sus tiempos de
+    # reloj solo aproxima lo que tardarían uno detrás de otro
+    serial = sum(job_seconds.values())
+    baseline = "suma de los trabajos, estimación"
+    if serial_baseline:
+        serial_started = time.perf_counter()
+        for name, function, args in jobs:
+            _run_training_job(function, args, cores, features)
+        _appliance_buffer = None
+        serial = time.perf_counter() - serial_started
+        baseline = f"medido en serie con {cores} hilos por modelo"
+    
+    logger.info(f"⏱️ Entrenamiento en {wall:.1f}s frente a {serial:.1f}s en serie ({baseline}): "
+                f"aceleración x{serial / wall:.2f}; {cpu:.1f}s de CPU en trabajos")
+    
+    return results
+
+def train_aggregate_predictor(features, output_dir=MODELS_DIR, fitted=None):
+    """Entrena modelo para predecir consumo agregado total.
     
-    logger.info(f"🏆 Mejor modelo: {best_model_name} (MAE: {best_score:.2f}W)")
+    ``fitted`` son los resultados de ``run_training_jobs`` si los candidatos
+    ya se entrenaron (p. ej. en el mismo pool que los electrodomésticos).
+    """
+    logger.info("🧠 Entrenando modelo para consumo agregado...")
+    
+    jobs = aggregate_jobs()
+    if fitted is None:
+        fitted = run_training_jobs(features, jobs)
+    
+    candidates = {}
+    for name, _, _ in jobs:
+        candidates.update(fitted[name])
+    results = {name: candidates[name] for name in AGGREGATE_CANDIDATES}
+    
+    # El primero con menor MAE (en caso de empate, el de AGGREGATE_CANDIDATES)
+    best_model_name = min(results, key=lambda name: results[name]['mae'])
+    best_model = results[best_model_name]['model']
+    best_scaler = results[best_model_name]['scaler']
+    logger.info(f"🏆 Mejor modelo: {best_model_name} (MAE: {results[best_model_name]['mae']:.2f}W)")
     
     # Guardar mejor modelo
-    model_path = '../../ml-models/models/aggregate_predictor.pkl'
+    model_path = os.path.join(output_dir, 'aggregate_predictor.pkl')
     joblib.dump(best_model, model_path)
     
     if best_scaler:
-        scaler_path = '../../ml-models/models/aggregate_scaler.pkl'
+        scaler_path = os.path.join(output_dir, 'aggregate_scaler.pkl')
         joblib.dump(best_scaler, scaler_path)
     
+    # Estadísticos suficientes para las actualizaciones incrementales de los
+    # modelos lineales: de las mismas filas de entrenamiento que el modelo
+    # guardado (las de test no se usaron al ajustarlo)
+    feature_columns = [col for col in features.columns if col != 'aggregate']
+    split_idx = int(len(features) * 0.8)
+    if best_model_name in LINEAR_MODELS:
+        stats = LinearStatistics.from_rows(features.select(feature_columns)[:split_idx],
+                                           features.targets['aggregate'][:split_idx])
+        stats.save(os.path.join(output_dir, LINEAR_STATISTICS_FILE))
+    
     # Guardar información del modelo
     model_info = {
         'model_type': best_model_name,
         'feature_columns': feature_columns,
-        'metrics': {k: v for k, v in results[best_model_name].items() if k != 'model'},
+        'metrics': {k: v for k, v in results[best_model_name].items() if k not in ('model', 'scaler')},
         'trained_on': datetime.now().isoformat(),
-        'training_samples': len(X_train),
-        'test_samples': len(X_test),
-        'uses_scaler': best_scaler is not None
+        'training_samples': split_idx,
+        'test_samples': len(features) - split_idx,
+        'uses_scaler': best_scaler is not None,
+        'training_mode': 'full',
+        'data_watermark': features.watermark
     }
     
-    with open('../../ml-models/models/aggregate_model_info.json', 'w') as f:
+    with open(os.path.join(output_dir, 'aggregate_model_info.json'), 'w') as f:
         json.dump(model_info, f, indent=2)
     
     return best_model, results
 
-def train_appliance_predictors(df_features):
-    """Entrena modelos individuales para cada electrodoméstico"""
+def train_appliance_predictors(features, output_dir=MODELS_DIR, fitted=None):
+    """Entrena modelos individuales para cada electrodoméstico.
+    
+    ``fitted`` son los resultados de ``run_training_jobs`` si los modelos ya
+    se entrenaron.
+    """
     logger.info("🏠 Entrenando modelos para electrodomésticos individuales...")
     
-    appliances = ['fridge', 'washing_machine', 'dishwasher', 'kettle', 'microwave', 'toaster', 'television', 'lighting']
+    jobs = appliance_jobs(features)
+    if fitted is None:
+        fitted = run_training_jobs(features, jobs)
+    
+    split_idx = int(len(features) * 0.8)
     appliance_models = {}
     
-    for appliance in appliances:
-        if appliance not in df_features.columns:
-            continue
-            
-        logger.info(f"  🔧 Entrenando modelo para: {appliance}")
-        
-        # Características específicas para este aparato
-        feature_columns = [col for col in df_features.columns 
-                          if col not in ['timestamp'] + appliances]
-        
-        # Añadir características específicas de otros aparatos (como contexto)
-        other_appliances = [app for app in appliances if app != appliance and app in df_features.columns]
-        feature_columns.extend(other_appliances)
-        
-        X = df_features[feature_columns]
-        y = df_features[appliance]
-        
-        # División temporal
-        split_idx = int(len(df_features) * 0.8)
-        X_train, X_test = X[:split_idx], X[split_idx:]
-        y_train, y_test = y[:split_idx], y[split_idx:]
-        
-        # Modelo Random Forest (mejor para este tipo de datos)
-        model = RandomForestRegressor(n_estimators=50, max_depth=10, random_state=42, n_jobs=-1)
-        model.fit(X_train, y_train)
-        
-        # Evaluar
-        y_pred = model.predict(X_test)
-        mae = mean_absolute_error(y_test, y_pred)
-        r2 = r2_score(y_test, y_pred)
-        
-        logger.info(f"    {appliance}: MAE={mae:.2f}W, R²={r2:.3f}")
+    for name, _, (appliance,) in jobs:
+        result = fitted[name]
         
         # Guardar modelo
-        model_path = f'../../ml-models/models/{appliance}_predictor.pkl'
-        joblib.dump(model, model_path)
+        model_path = os.path.join(output_dir, f'{appliance}_predictor.pkl')
+        joblib.dump(result['model'], model_path)
         
-        appliance_models[appliance] = {
-            'model': model,
-            'mae': mae,
-            'r2': r2,
-            'feature_columns': feature_columns
+        # Guardar información del modelo (el servicio compila su esquema de columnas)
+        model_info = {
+            'model_type': 'random_forest',
+            'feature_columns': result['feature_columns'],
+            'metrics': {'mae': result['mae'], 'r2': result['r2']},
+            'trained_on': datetime.now().isoformat(),
+            'training_samples': split_idx,
+            'test_samples': len(features) - split_idx,
+            'uses_scaler': False,
+            'training_mode': 'full',
+            'data_watermark': features.watermark
         }
+        
+        with open(os.path.join(output_dir, f'{appliance}_model_info.json'), 'w') as f:
+            json.dump(model_info, f, indent=2)
+        
+        appliance_models[appliance] = result
     
     return appliance_models
 
-def create_prediction_service():
-    """Crea el servicio de predicción integrado"""
-    logger.info("🚀 Creando servicio de predicción...")
+def load_new_data(csv_path, watermark, chunk_rows=100000):
+    """Filas del CSV posteriores a ``watermark`` precedidas de hasta
+    FEATURE_HISTORY_ROWS filas anteriores (para lags y medias móviles).
+    
+    Lee el CSV por bloques y solo conserva esas filas; devuelve
+    (DataFrame, número de filas de historia).
+    """
+    watermark = pd.Timestamp(watermark)
+    history = None
+    new_chunks = []
+    
+    for chunk in pd.read_csv(csv_path, chunksize=chunk_rows):
+        chunk['timestamp'] = pd.to_datetime(chunk['timestamp'])
+        is_new = chunk['timestamp'] > watermark
+        if not is_new.all():
+            old = chunk[~is_new]
+            history = old if history is None else pd.concat([history, old])
+            history = history.iloc[-FEATURE_HISTORY_ROWS:]
+        if is_new.any():
+            new_chunks.append(chunk[is_new])
+    
+    frames = ([history] if history is not None else []) + new_chunks
+    if not frames:
+        return pd.DataFrame(), 0
+    return pd.concat(frames, ignore_index=True), 0 if history is None else len(history)
+
+def regression_metrics(y_true, y_pred):
+    """MAE, RMSE, R² y MAPE (como en el entrenamiento completo)"""
+    return {
+        'mae': mean_absolute_error(y_true, y_pred),
+        'rmse': np.sqrt(mean_squared_error(y_true, y_pred)),
+        'r2': r2_score(y_true, y_pred),
+        'mape': mean_absolute_percentage_error(y_true, y_pred) * 100
+    }
+
+def grow_forest(model, X, y, trees=INCREMENTAL_TREES, max_trees=INCREMENTAL_MAX_TREES):
+    """Añade ``trees`` árboles entrenados con las filas nuevas (warm_start) y
+    descarta los más antiguos por encima de ``max_trees``"""
+    model.set_params(warm_start=True, n_estimators=len(model.estimators_) + trees, n_jobs=TRAINING_CORES)
+    model.fit(X, y)
+    if len(model.estimators_) > max_trees:
+        model.estimators_ = model.estimators_[-max_trees:]
+    model.set_params(warm_start=False, n_estimators=len(model.estimators_))
+    return model
+
+def update_model(target, model_dir, output_dir, features):
+    """Actualiza un modelo con las filas nuevas de ``features`` y lo guarda en ``output_dir``.
+    
+    Las métricas son de tipo "test-then-train": el modelo anterior predice
+    las filas nuevas antes de aprender de ellas. Devuelve la información
+    actualizada del modelo.
+    """
+    with open(os.path.join(model_dir, f'{target}_model_info.json')) as f:
+        model_info = json.load(f)
+    model = joblib.load(os.path.join(model_dir, f'{target}_predictor.pkl'))
+    model_type = model_info['model_type']
+    
+    X = features.select(model_info['feature_columns'])
+    y = features.targets[target]
+    scaler = None
+    
+    if model_type in LINEAR_MODELS:
+        stats_path = os.path.join(model_dir, LINEAR_STATISTICS_FILE)
+        if not os.path.exists(stats_path):
+            raise FileNotFoundError(f"{target}: faltan los estadísticos suficientes; hace falta un entrenamiento completo")
+        scaler = joblib.load(os.path.join(model_dir, f'{target}_scaler.pkl'))
+        X_scaled = scaler.transform(np.asarray(X, dtype=np.float64))
+        metrics = regression_metrics(y, model.predict(X_scaled))
+        
+        stats = LinearStatistics.load(stats_path)
+        stats.update(X, y)
+        model, scaler = stats.fit(model_type)
+        stats.save(os.path.join(output_dir, LINEAR_STATISTICS_FILE))
+    else:
+        metrics = regression_metrics(y, model.predict(X))
+        if model_type == 'random_forest':
+            model = grow_forest(model, X, y)
+        elif model_type == 'gradient_boosting':
+            # Nuevas etapas ajustadas a los residuos del modelo actual en las filas nuevas
+            model.set_params(warm_start=True, n_estimators=model.n_estimators_ + INCREMENTAL_TREES)
+            model.fit(X, y)
+            model.set_params(warm_start=False)
+        else:
+            raise ValueError(f"{target}: el modelo {model_type} no admite actualización incremental")
     
-    service_code = '''#!/usr/bin/env python3
-"""
-Servicio de Predicción ML para EnergiApp
-Modelos entrenados con datos UK-DALE reales
-"""
+    joblib.dump(model, os.path.join(output_dir, f'{target}_predictor.pkl'))
+    if scaler is not None:
+        joblib.dump(scaler, os.path.join(output_dir, f'{target}_scaler.pkl'))
+    
+    # Las mismas métricas que guardó el entrenamiento completo
+    previous_metrics = model_info.get('metrics') or metrics
+    metrics = {k: v for k, v in metrics.items() if k in previous_metrics}
+    
+    model_info.update({
+        'metrics': metrics,
+        'evaluation': 'test_then_train',
+        'trained_on': datetime.now().isoformat(),
+        'training_samples': model_info.get('training_samples', 0) + len(features),
+        'incremental_samples': len(features),
+        'training_mode': 'incremental',
+        'previous_watermark': model_info.get('data_watermark'),
+        'data_watermark': features.watermark
+    })
+    if hasattr(model, 'estimators_'):
+        model_info['n_estimators'] = len(model.estimators_)
+    
+    with open(os.path.join(output_dir, f'{target}_model_info.json'), 'w') as f:
+        json.dump(model_info, f, indent=2)
+    
+    logger.info(f"  🔁 {target} ({model_type}): MAE={metrics['mae']:.2f}W en {len(features)} filas nuevas")
+    return model_info
 
-import joblib
-import pandas as pd
-import numpy as np
-import json
-from datetime import datetime, timedelta
-import os
+def update_models_incremental(model_dir, output_dir, csv_path=DATASET_PATH):
+    """Actualiza todos los modelos de ``model_dir`` con las filas posteriores a
+    su marca de agua; el coste depende de las filas nuevas, no del histórico.
+    Devuelve {modelo: información} o None si no hay datos nuevos.
+    """
+    targets = [target for target in TARGETS
+               if os.path.exists(os.path.join(model_dir, f'{target}_predictor.pkl'))]
+    watermarks = set()
+    for target in targets:
+        with open(os.path.join(model_dir, f'{target}_model_info.json')) as f:
+            watermarks.add(json.load(f).get('data_watermark'))
+    
+    if not targets or None in watermarks or len(watermarks) != 1:
+        raise ValueError("Los modelos activos no tienen una marca de agua común; hace falta un entrenamiento completo")
+    watermark = watermarks.pop()
+    
+    logger.info(f"🔄 Cargando datos posteriores a {watermark}...")
+    df, history_rows = load_new_data(csv_path, watermark)
+    if len(df) <= history_rows:
+        logger.info("✅ No hay datos nuevos desde la última actualización")
+        return None
+    
+    features = create_feature_matrix(df).tail(history_rows)
+    del df
+    logger.info(f"📊 {len(features)} filas nuevas ({watermark} → {features.watermark})")
+    
+    return {target: update_model(target, model_dir, output_dir, features) for target in targets}
 
-class EnergiaPredictionService:
-    def __init__(self):
-        self.models = {}
-        self.scalers = {}
-        self.model_info = {}
-        self.load_models()
+def main_incremental():
+    """Actualización incremental de la versión activa del registro"""
+    registry = ModelRegistry(MODELS_DIR)
+    model_dir, current_version = registry.resolve()
     
-    def load_models(self):
-        """Carga todos los modelos entrenados"""
-        model_dir = 'models'
-        
-        try:
-            # Modelo agregado principal
-            if os.path.exists(f'{model_dir}/aggregate_predictor.pkl'):
-                self.models['aggregate'] = joblib.load(f'{model_dir}/aggregate_predictor.pkl')
-                
-                if os.path.exists(f'{model_dir}/aggregate_scaler.pkl'):
-                    self.scalers['aggregate'] = joblib.load(f'{model_dir}/aggregate_scaler.pkl')
-                
-                if os.path.exists(f'{model_dir}/aggregate_model_info.json'):
-                    with open(f'{model_dir}/aggregate_model_info.json', 'r') as f:
-                        self.model_info['aggregate'] = json.load(f)
-            
-            # Modelos de electrodomésticos
-            appliances = ['fridge', 'washing_machine', 'dishwasher', 'kettle', 
-                         'microwave', 'toaster', 'television', 'lighting']
-            
-            for appliance in appliances:
-                model_path = f'{model_dir}/{appliance}_predictor.pkl'
-                if os.path.exists(model_path):
-                    self.models[appliance] = joblib.load(model_path)
-            
-            print(f"✅ Modelos cargados: {list(self.models.keys())}")
-            
-        except Exception as e:
-            print(f"❌ Error cargando modelos: {e}")
+    staging_dir = registry.new_staging_dir()
+    try:
+        started = time.perf_counter()
+        updated = update_models_incremental(model_dir, staging_dir)
+    except Exception:
+        registry.discard_staging(staging_dir)
+        raise
     
-    def predict_consumption(self, features_dict, target='aggregate', hours_ahead=24):
-        """Predice consumo energético"""
-        if target not in self.models:
-            raise ValueError(f"Modelo {target} no disponible")
-        
-        # Preparar características
-        df_input = pd.DataFrame([features_dict])
-        
-        # Características temporales básicas
-        now = datetime.now()
-        for i in range(hours_ahead):
-            future_time = now + timedelta(hours=i)
-            hour_features = {
-                'hour': future_time.hour,
-                'day_of_week': future_time.weekday(),
-                'month': future_time.month,
-                'is_weekend': 1 if future_time.weekday() >= 5 else 0,
-                'hour_sin': np.sin(2 * np.pi * future_time.hour / 24),
-                'hour_cos': np.cos(2 * np.pi * future_time.hour / 24),
-                'day_sin': np.sin(2 * np.pi * future_time.weekday() / 7),
-                'day_cos': np.cos(2 * np.pi * future_time.weekday() / 7),
-            }
-            
-            # Combinar con características base
-            prediction_features = {**features_dict, **hour_features}
-            
-            # Completar características faltantes con valores por defecto
-            if target == 'aggregate' and 'aggregate' in self.model_info:
-                required_features = self.model_info['aggregate']['feature_columns']
-                for feature in required_features:
-                    if feature not in prediction_features:
-                        prediction_features[feature] = 0
-        
-        model = self.models[target]
-        
-        # Hacer predicción
-        try:
-            # Preparar datos para predicción
-            feature_df = pd.DataFrame([prediction_features])
-            
-            # Aplicar scaler si existe
-            if target in self.scalers:
-                feature_values = self.scalers[target].transform(feature_df)
-                prediction = model.predict(feature_values)[0]
-            else:
-                prediction = model.predict(feature_df)[0]
-            
-            return max(0, float(prediction))  # No valores negativos
-            
-        except Exception as e:
-            print(f"Error en predicción: {e}")
-            return 0.0
+    if updated is None:
+        registry.discard_staging(staging_dir)
+        return
     
-    def get_model_metrics(self):
-        """Retorna métricas de los modelos"""
-        return {name: info.get('metrics', {}) for name, info in self.model_info.items()}
+    version = registry.publish(staging_dir)
+    logger.info("=" * 60)
+    logger.info(f"🎉 ACTUALIZACIÓN INCREMENTAL COMPLETADA en {time.perf_counter() - started:.1f}s")
+    logger.info(f"📁 Versión {current_version} → {version} "
+                f"(marca de agua {next(iter(updated.values()))['data_watermark']})")
 
-# Instancia global
-prediction_service = EnergiaPredictionService()
-'''
+def create_prediction_service():
+    """Comprueba que el servicio de predicción puede usar los modelos entrenados.
+    
+    El servicio (ml-models/prediction_service.py) se mantiene en el repositorio
+    y carga la versión activa del registro de ml-models/models/ (recargándola
+    en caliente al publicarse una nueva), por lo que ya no se regenera aquí:
+    reescribirlo perdería la ruta de predicción vectorizada.
+    """
+    logger.info("🚀 Verificando servicio de predicción...")
     
-    with open('../../ml-models/prediction_service.py', 'w', encoding='utf-8') as f:
-        f.write(service_code)
+    service_path = '../../ml-models/prediction_service.py'
+    if not os.path.exists(service_path):
+        raise FileNotFoundError(f"Servicio de predicción no encontrado: {service_path}")
     
-    logger.info("✅ Servicio de predicción creado")
+    logger.info("✅ Servicio de predicción listo")
 
 def main():
     """Función principal de entrenamiento"""
@@ -366,17 +877,34 @@ def main():
     logger.info("=" * 60)
     
     try:
-        # 1. Cargar datos
-        df, metadata = load_ukdale_data()
+        if TRAINING_MODE == 'incremental':
+            main_incremental()
+            return
         
-        # 2. Crear características
-        df_features = create_features(df)
+        # 1-2. Cargar datos y crear características (o leerlas de la caché)
+        features = build_features()
+        log_memory("Características")
         
-        # 3. Entrenar modelo principal (agregado)
-        best_model, results = train_aggregate_predictor(df_features)
+        # 3-4. Entrenar en un directorio temporal: el servicio no ve la nueva
+        # versión hasta que está completa y se publica en el registro
+        registry = ModelRegistry(MODELS_DIR)
+        staging_dir = registry.new_staging_dir()
+        try:
+            # Los candidatos del modelo agregado y los electrodomésticos son
+            # independientes: se entrenan juntos en el pool
+            fitted = run_training_jobs(features, aggregate_jobs() + appliance_jobs(features))
+            peak_mb = log_memory("Entrenamiento")
+            
+            # 3. Guardar modelo principal (agregado)
+            best_model, results = train_aggregate_predictor(features, staging_dir, fitted)
+            
+            # 4. Guardar modelos de electrodomésticos
+            appliance_models = train_appliance_predictors(features, staging_dir, fitted)
+        except Exception:
+            registry.discard_staging(staging_dir)
+            raise
         
-        # 4. Entrenar modelos de electrodomésticos
-        appliance_models = train_appliance_predictors(df_features)
+        version = registry.publish(staging_dir)
         
         # 5. Crear servicio de predicción
         create_prediction_service()
@@ -384,8 +912,9 @@ def main():
         logger.info("=" * 60)
         logger.info("🎉 ENTRENAMIENTO COMPLETADO EXITOSAMENTE")
         logger.info(f"📊 Modelos entrenados: {1 + len(appliance_models)}")
-        logger.info(f"📁 Modelos guardados en: ml-models/models/")
+        logger.info(f"📁 Modelos guardados en: ml-models/models/versions/{version}/")
         logger.info("🔮 Servicio de predicción listo para usar")
+        logger.info(f"💾 Pico de memoria del entrenamiento: {peak_mb:.1f} MB")
         
         # Resumen de rendimiento
         logger.info("\n📈 RESUMEN DE RENDIMIENTO:")
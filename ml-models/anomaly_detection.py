@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+Detección de picos y anomalías de consumo para EnergiApp
+Combina tres detectores sobre la serie, en una sola pasada vectorizada o
+bloque a bloque en modo streaming (con estado entre bloques):
+
+- z-score sobre una ventana móvil de las ``window`` muestras anteriores
+- línea base estacional por hora del día (media y desviación por hora)
+- límites de control EWMA (media y varianza exponenciales)
+
+Una muestra es pico cuando al menos ``min_votes`` detectores la marcan, y
+las muestras consecutivas se agrupan en intervalos de pico.
+"""
+
+import numpy as np
+from scipy.signal import lfilter
+
+DEFAULT_PARAMS = {
+    'window': 600,          # 1 hora a 6 s por muestra (UK-DALE)
+    'z_threshold': 4.0,
+    'ewma_alpha': 0.01,
+    'ewma_limit': 4.0,
+    'min_votes': 2,
+    'max_intervals': 1000,
+}
+
+
+def _zscore(values, mean, std):
+    """(values - mean) / std con 0 donde la desviación es nula o indefinida"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = (values - mean) / std
+    return np.where(np.isfinite(z), z, 0.0)
+
+
+class PeakDetector:
+    """Detector de picos incremental; ``update`` por bloque y ``result`` al final"""
+
+    def __init__(self, window=600, z_threshold=4.0, ewma_alpha=0.01, ewma_limit=4.0,
+                 min_votes=2, max_intervals=1000):
+        if window < 2:
+            raise ValueError("window debe ser al menos 2 muestras")
+        if not 0 < ewma_alpha < 1:
+            raise ValueError("ewma_alpha debe estar entre 0 y 1")
+
+        self.window = int(window)
+        self.z_threshold = float(z_threshold)
+        self.ewma_alpha = float(ewma_alpha)
+        self.ewma_limit = float(ewma_limit)
+        self.min_votes = int(min_votes)
+        self.max_intervals = int(max_intervals)
+
+        self.processed = 0
+        self.shift = None
+        self.tail = np.empty(0, dtype=np.float64)
+        self.ewma_mean = None
+        self.ewma_var = 0.0
+        self.has_hours = False
+        self.hour_count = np.zeros(24, dtype=np.int64)
+        self.hour_mean = np.zeros(24, dtype=np.float64)
+        self.hour_m2 = np.zeros(24, dtype=np.float64)
+
+        self.intervals = []
+        self.open_interval = None
+        self.num_intervals = 0
+        self.anomalous_samples = 0
+
+    @classmethod
+    def from_params(cls, params):
+        """Detector con los parámetros de una petición (dict o query string)"""
+        params = params or {}
+        kwargs = {}
+        for name, default in DEFAULT_PARAMS.items():
+            value = params.get(name)
+            kwargs[name] = type(default)(value) if value is not None else default
+        return cls(**kwargs)
+
+    def params(self):
+        return {
+            'window': self.window,
+            'z_threshold': self.z_threshold,
+            'ewma_alpha': self.ewma_alpha,
+            'ewma_limit': self.ewma_limit,
+            'min_votes': self.min_votes,
+        }
+
+    def _rolling_z(self, values):
+        """z-score de cada muestra frente a las ``window`` anteriores (sumas acumuladas)"""
+        n = len(values)
+        extended = np.concatenate([self.tail, values]) - self.shift
+        sums = np.concatenate([[0.0], np.cumsum(extended)])
+        squares = np.concatenate([[0.0], np.cumsum(extended * extended)])
+
+        positions = np.arange(len(self.tail), len(self.tail) + n)
+        lower = np.maximum(positions - self.window, 0)
+        count = positions - lower
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean = (sums[positions] - sums[lower]) / count
+            variance = (squares[positions] - squares[lower] - count * mean * mean) / (count - 1)
+        z = _zscore(extended[positions], mean, np.sqrt(np.maximum(variance, 0.0)))
+
+        # Solo hay ventana completa a partir de la muestra ``window`` de la serie
+        z[self.processed + np.arange(n) < self.window] = 0.0
+        self.tail = (extended[-self.window:] + self.shift).copy()
+        return z
+
+    def _ewma_z(self, values):
+        """Distancia a la media EWMA previa en desviaciones EWMA previas"""
+        alpha = self.ewma_alpha
+        if self.ewma_mean is None:
+            self.ewma_mean = float(values[0])
+
+        b, a = [alpha], [1.0, alpha - 1.0]
+        mean = lfilter(b, a, values, zi=[(1 - alpha) * self.ewma_mean])[0]
+        previous_mean = np.concatenate([[self.ewma_mean], mean[:-1]])
+
+        errors = np.square(values - previous_mean)
+        var = lfilter(b, a, errors, zi=[(1 - alpha) * self.ewma_var])[0]
+        previous_var = np.concatenate([[self.ewma_var], var[:-1]])
+
+        self.ewma_mean, self.ewma_var = float(mean[-1]), float(var[-1])
+        z = _zscore(values, previous_mean, np.sqrt(previous_var))
+        # Los límites no son fiables hasta que la varianza EWMA se estabiliza
+        z[self.processed + np.arange(len(values)) < self.window] = 0.0
+        return z
+
+    def _seasonal_z(self, values, hours):
+        """z-score frente a la media y desviación de la misma hora del día.
+
+        La línea base incluye el bloque actual (combinación de Chan por hora),
+        así que con una sola llamada equivale a la de la serie completa.
+        """
+        count = np.bincount(hours, minlength=24)
+        sums = np.bincount(hours, weights=values, minlength=24)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            chunk_mean = np.where(count > 0, sums / count, 0.0)
+        chunk_m2 = np.bincount(hours, weights=np.square(values - chunk_mean[hours]), minlength=24)
+
+        combined = self.hour_count + count
+        with np.errstate(divide='ignore', invalid='ignore'):
+            delta = chunk_mean - self.hour_mean
+            self.hour_mean = np.where(combined > 0, self.hour_mean + delta * count / combined, 0.0)
+            self.hour_m2 = self.hour_m2 + chunk_m2 + np.where(
+                combined > 0, delta * delta * self.hour_count * count / combined, 0.0)
+            std = np.sqrt(self.hour_m2 / (combined - 1))
+        self.hour_count = combined
+
+        return _zscore(values, self.hour_mean[hours], std[hours])
+
+    def update(self, values, hours=None, timestamps=None):
+        """Procesa un bloque de consumos (W) con su hora del día y timestamps opcionales"""
+        values = np.asarray(values, dtype=np.float64)
+        n = len(values)
+        if n == 0:
+            return
+        if self.shift is None:
+            # Desplazamiento para que las sumas acumuladas no pierdan precisión
+            self.shift = float(values[0])
+
+        rolling = self._rolling_z(values)
+        ewma = self._ewma_z(values)
+        votes = (rolling > self.z_threshold).astype(np.int8) + (ewma > self.ewma_limit)
+        score = np.maximum(rolling, ewma)
+        detectors = 2
+
+        if hours is not None:
+            self.has_hours = True
+            seasonal = self._seasonal_z(values, np.asarray(hours, dtype=np.int64))
+            votes += seasonal > self.z_threshold
+            score = np.maximum(score, seasonal)
+            detectors += 1
+
+        flags = votes >= min(self.min_votes, detectors)
+        self._collect_intervals(values, flags, score, timestamps)
+        self.processed += n
+
+    def _collect_intervals(self, values, flags, score, timestamps):
+        """Agrupa muestras marcadas consecutivas en intervalos (también entre bloques)"""
+        n = len(values)
+        edges = np.diff(np.concatenate([[0], flags.astype(np.int8), [0]]))
+        starts = np.flatnonzero(edges == 1)
+        ends = np.flatnonzero(edges == -1)
+
+        merges = len(starts) > 0 and starts[0] == 0 and self.open_interval is not None
+        if not merges:
+            self._close_open_interval()
+        if len(starts) == 0:
+            return
+
+        self.anomalous_samples += int(flags.sum())
+
+        # Máximo de cada tramo sobre las muestras marcadas compactadas
+        offsets = np.concatenate([[0], np.cumsum(ends - starts)[:-1]])
+        peak_values = np.maximum.reduceat(values[flags], offsets)
+        peak_scores = np.maximum.reduceat(score[flags], offsets)
+
+        def interval(i):
+            result = {
+                'start_index': self.processed + int(starts[i]),
+                'end_index': self.processed + int(ends[i]) - 1,
+                'peak_consumption': float(peak_values[i]),
+                'max_score': float(peak_scores[i]),
+            }
+            if timestamps is not None:
+                result['start'] = str(timestamps[starts[i]])
+                result['end'] = str(timestamps[ends[i] - 1])
+            return result
+
+        first = None
+        if merges:
+            first = self._merge(self.open_interval, interval(0))
+            self.open_interval = None
+
+        # El último tramo sigue abierto si llega al final del bloque
+        still_open = ends[-1] == n
+        closed = len(starts) - int(still_open)
+        capacity = max(self.max_intervals - len(self.intervals), 0)
+
+        # Solo se materializan los intervalos que caben; el resto solo se cuenta
+        for i in range(min(closed, capacity)):
+            self.intervals.append(first if i == 0 and first is not None else interval(i))
+        self.num_intervals += closed
+
+        if still_open:
+            last = len(starts) - 1
+            self.open_interval = first if last == 0 and first is not None else interval(last)
+
+    @staticmethod
+    def _merge(first, second):
+        merged = dict(second)
+        merged['start_index'] = first['start_index']
+        if 'start' in first:
+            merged['start'] = first['start']
+        merged['peak_consumption'] = max(first['peak_consumption'], second['peak_consumption'])
+        merged['max_score'] = max(first['max_score'], second['max_score'])
+        return merged
+
+    def _close_open_interval(self):
+        if self.open_interval is not None:
+            self.num_intervals += 1
+            if len(self.intervals) < self.max_intervals:
+                self.intervals.append(self.open_interval)
+            self.open_interval = None
+
+    def result(self):
+        """Intervalos de pico (índices de muestra, fechas si se dieron) y resumen"""
+        self._close_open_interval()
+
+        for interval in self.intervals:
+            interval['samples'] = interval['end_index'] - interval['start_index'] + 1
+
+        return {
+            'peak_intervals': self.intervals,
+            'num_peak_intervals': self.num_intervals,
+            'truncated': self.num_intervals > len(self.intervals),
+            'anomalous_samples': self.anomalous_samples,
+            'detectors': ['rolling_zscore', 'ewma'] + (['seasonal_hourly'] if self.has_hours else []),
+            'params': self.params(),
+        }
+
+
+def detect_peaks(values, hours=None, timestamps=None, params=None):
+    """Detección en una sola pasada de una serie ya en memoria"""
+    detector = PeakDetector.from_params(params)
+    detector.update(values, hours, timestamps)
+    return detector.result()
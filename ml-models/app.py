@@ -9,8 +9,10 @@ Fecha: Julio 2025
 
 import os
 import sys
-from datetime import datetime, timedelta
+import time
+from datetime import datetime, timedelta, timezone
 import logging
+import io
 import json
 
 # Configurar logging
@@ -20,33 +22,149 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Duración de cada fase del arranque (se registra en el log y en /ready)
+STARTUP_STARTED = time.perf_counter()
+STARTUP_TIMINGS = {}
+
 # Librerías para API
-from flask import Flask, request, jsonify
+# pandas, scipy (detección de picos) y SQLite (agregados) solo se importan
+# en los endpoints que los usan, para que la API arranque antes
+from flask import Flask, Response, g, has_request_context, request, jsonify
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
-import pandas as pd
 import numpy as np
 
-# Importar el servicio de predicción entrenado
+from metrics import metrics
+from micro_batcher import MicroBatcher
+from process_memory import process_memory_mb
+from payloads import (NPY_MIMETYPE, PayloadError, binary_mimetypes, decode_columns, encode_json, encode_npy,
+                      epoch_seconds, hours_of_day)
+from streaming_stats import ConsumptionStats, analyze_arrays
+from scenarios import scenario_axes, summarize_scenarios
+
+STARTUP_TIMINGS['imports_seconds'] = round(time.perf_counter() - STARTUP_STARTED, 3)
+
+# Importar el servicio de predicción entrenado (con MODEL_LOADING=background
+# los modelos se cargan después, en un hilo, y /ready indica cuándo están)
+service_started = time.perf_counter()
 try:
-    from prediction_service import prediction_service
+    from prediction_service import prediction_service, APPLIANCES, calendar_feature_matrix
     logger.info("✅ Servicio de predicción cargado exitosamente")
     MODELS_AVAILABLE = True
 except ImportError as e:
     logger.error(f"❌ Error cargando servicio de predicción: {e}")
     prediction_service = None
     MODELS_AVAILABLE = False
+STARTUP_TIMINGS['service_init_seconds'] = round(time.perf_counter() - service_started, 3)
+
+# Agrupador opcional de predicciones individuales (MICRO_BATCHING_ENABLED=true)
+batcher = MicroBatcher.from_env(prediction_service) if MODELS_AVAILABLE else None
+
+def endpoint_label():
+    """Ruta (plantilla) de la petición actual para etiquetar métricas"""
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Serializador JSON de Flask que mide la etapa de serialización"""
+    
+    def dumps(self, obj, **kwargs):
+        if not has_request_context():
+            return super().dumps(obj, **kwargs)
+        with metrics.timer('ml_http_stage_duration_seconds', endpoint=endpoint_label(), stage='serialize'):
+            return super().dumps(obj, **kwargs)
 
 # Configuración de la aplicación Flask
 app = Flask(__name__)
+app.json = TimedJSONProvider(app)
 CORS(app)
 
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    
+    # Con carga en segundo plano, el primer request del proceso la arranca
+    if MODELS_AVAILABLE:
+        prediction_service.ensure_loading()
+    
+    # Parsear aquí el JSON (Flask lo guarda en caché) para medir la etapa
+    if metrics.enabled and request.is_json:
+        with metrics.timer('ml_http_stage_duration_seconds', endpoint=endpoint_label(), stage='parse_json'):
+            request.get_json(silent=True)
+
+@app.after_request
+def record_request_duration(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        metrics.observe('ml_http_request_duration_seconds', time.perf_counter() - started,
+                        endpoint=endpoint_label(), method=request.method,
+                        status=str(response.status_code))
+    return response
+
 # Configuración
 CONFIG = {
     'PORT': int(os.getenv('PORT', 5001)),
     'DEBUG': os.getenv('DEBUG', 'True').lower() == 'true',
-    'HOST': os.getenv('HOST', '0.0.0.0')
+    'HOST': os.getenv('HOST', '0.0.0.0'),
+    'MAX_BATCH_JOBS': int(os.getenv('MAX_BATCH_JOBS', 10000)),
+    # Horizonte máximo de un trabajo y total de horas (filas) de una petición
+    'MAX_HOURS_AHEAD': int(os.getenv('MAX_HOURS_AHEAD', 8760)),
+    'MAX_BATCH_ROWS': int(os.getenv('MAX_BATCH_ROWS', 1000000)),
+    'ADMIN_TOKEN': os.getenv('ML_ADMIN_TOKEN'),
+    'MODEL_WATCH_INTERVAL': float(os.getenv('MODEL_WATCH_INTERVAL', 30)),
+    'STREAM_CHUNK_ROWS': int(os.getenv('STREAM_CHUNK_ROWS', 100000)),
+    'ROLLUP_DB_PATH': os.getenv('ROLLUP_DB_PATH', os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'data', 'rollups.sqlite'))
 }
 
+# Agregados por minuto/hora/día del consumo ingerido por cada hogar
+# (se abren con la primera petición que los usa)
+rollup_store = None
+
+def get_rollup_store():
+    global rollup_store
+    if rollup_store is None:
+        from rollup_store import RollupStore
+        rollup_store = RollupStore(CONFIG['ROLLUP_DB_PATH'])
+    return rollup_store
+
+# Cuerpos que /analyze/consumption procesa por bloques en lugar de como JSON
+STREAMING_MIMETYPES = ('application/x-ndjson', 'application/jsonl', 'text/csv')
+
+def parse_base_features(data):
+    """Características base del usuario/hogar con sus valores por defecto"""
+    return {
+        'temperature': data.get('temperature', 20.0),
+        'humidity': data.get('humidity', 60.0),
+        'occupancy': data.get('occupancy', 2),
+        'house_size': data.get('house_size', 100),
+    }
+
+def hours_ahead_error(hours_ahead):
+    """Mensaje de error si algún horizonte no está en [1, MAX_HOURS_AHEAD] o
+    el total de horas supera MAX_BATCH_ROWS; None si son válidos.
+    
+    Se comprueba antes de construir las matrices de características, cuyo
+    tamaño es la suma de los horizontes.
+    """
+    hours_ahead = np.asarray(hours_ahead, dtype=np.float64)
+    if hours_ahead.size and not (np.isfinite(hours_ahead).all()
+                                 and hours_ahead.min() >= 1
+                                 and hours_ahead.max() <= CONFIG['MAX_HOURS_AHEAD']):
+        return f"hours_ahead debe estar entre 1 y {CONFIG['MAX_HOURS_AHEAD']}"
+    if hours_ahead.sum() > CONFIG['MAX_BATCH_ROWS']:
+        return f"Máximo {CONFIG['MAX_BATCH_ROWS']} horas predichas por petición"
+    return None
+
+def predict_single(features, target='aggregate'):
+    """Predicción de una fila, agrupada con otras peticiones si está activado"""
+    if batcher is not None:
+        return batcher.predict(features, target)
+    return prediction_service.predict_consumption(features, target=target)
+
+def models_ready():
+    """Hay modelos cargados (con carga en segundo plano puede que aún no)"""
+    return MODELS_AVAILABLE and prediction_service.is_ready()
+
 # ==================== RUTAS DE LA API ====================
 
 @app.route('/', methods=['GET'])
@@ -57,14 +175,68 @@ def health_check():
         'service': 'EnergiApp ML API',
         'version': '2.0',
         'models_available': MODELS_AVAILABLE,
+        'models_ready': models_ready(),
         'timestamp': datetime.now().isoformat()
     })
 
+@app.route('/ready', methods=['GET'])
+def readiness_check():
+    """Preparado para predecir: 200 con los modelos cargados, 503 mientras cargan"""
+    state = prediction_service.get_loading_state() if MODELS_AVAILABLE else 'unavailable'
+    return jsonify({
+        'status': 'ready' if models_ready() else state,
+        'startup': STARTUP_TIMINGS,
+        'model_loading': prediction_service.get_load_stats() if MODELS_AVAILABLE else None
+    }), 200 if models_ready() else 503
+
+# Formatos de respuesta de /predict/consumption: una entrada por hora
+# ('records'), columnar {start, step, values} en JSON o array .npy
+FORECAST_FORMATS = ('records', 'columnar', 'npy')
+
+def response_format_of(data):
+    """Formato pedido en ?format=, en el cuerpo o con Accept: application/x-npy"""
+    requested = request.args.get('format') or data.get('format')
+    if requested:
+        return requested
+    if request.accept_mimetypes.best == NPY_MIMETYPE:
+        return 'npy'
+    return 'records'
+
+def forecast_response(consumptions, start, response_format, user_id, device_type):
+    """Previsión horaria como columnas: JSON {start, step, values} o .npy.
+    
+    ``step`` son los segundos entre valores consecutivos. En .npy los
+    metadatos viajan en cabeceras X-Forecast-*.
+    """
+    total_24h = float(consumptions[:24].sum())
+    
+    with metrics.timer('ml_http_stage_duration_seconds', endpoint='/predict/consumption', stage='serialize'):
+        if response_format == 'npy':
+            response = Response(encode_npy(consumptions.astype(np.float32)), mimetype=NPY_MIMETYPE)
+            response.headers['X-Forecast-Start'] = start.isoformat()
+            response.headers['X-Forecast-Step'] = '3600'
+            response.headers['X-Forecast-Device-Type'] = device_type
+            response.headers['X-Forecast-Total-24h'] = str(total_24h)
+            return response
+        
+        body = encode_json({
+            'status': 'success',
+            'user_id': user_id,
+            'device_type': device_type,
+            'model_type': 'uk_dale_trained',
+            'start': start.isoformat(),
+            'step': 3600,
+            'unit': 'watts',
+            'values': consumptions,
+            'total_predicted_24h': total_24h
+        })
+    return Response(body, mimetype='application/json')
+
 @app.route('/predict/consumption', methods=['POST'])
 def predict_consumption():
     """Predice consumo energético usando modelos entrenados"""
     try:
-        if not MODELS_AVAILABLE:
+        if not models_ready():
             return jsonify({
                 'error': 'Modelos ML no disponibles',
                 'status': 'error'
@@ -78,48 +250,38 @@ def predict_consumption():
         
         # Parámetros de entrada
         user_id = data.get('user_id', 1)
-        hours_ahead = data.get('hours_ahead', 24)
+        hours_ahead = int(data.get('hours_ahead', 24))
+        error = hours_ahead_error([hours_ahead])
+        if error:
+            return jsonify({'error': error}), 400
         device_type = data.get('device_type', 'aggregate')
+        response_format = response_format_of(data)
+        if response_format not in FORECAST_FORMATS:
+            return jsonify({'error': f'Formato no soportado: {response_format}',
+                            'available_formats': list(FORECAST_FORMATS)}), 400
         
         # Características base del usuario/hogar
-        base_features = {
-            'temperature': data.get('temperature', 20.0),
-            'humidity': data.get('humidity', 60.0),
-            'occupancy': data.get('occupancy', 2),
-            'house_size': data.get('house_size', 100),
-        }
+        base_features = parse_base_features(data)
         
-        # Generar predicciones para las próximas horas
-        predictions = []
+        # Generar predicciones para las próximas horas (una sola llamada al modelo)
         now = datetime.now()
+        consumptions = prediction_service.predict_horizon(
+            base_features,
+            target=device_type,
+            start=now,
+            hours=hours_ahead
+        )
         
-        for i in range(hours_ahead):
+        if response_format != 'records':
+            return forecast_response(consumptions, now, response_format, user_id, device_type)
+        
+        predictions = []
+        for i, consumption in enumerate(consumptions.tolist()):
             future_time = now + timedelta(hours=i)
-            
-            # Características temporales
-            features = {
-                **base_features,
-                'hour': future_time.hour,
-                'day_of_week': future_time.weekday(),
-                'month': future_time.month,
-                'is_weekend': 1 if future_time.weekday() >= 5 else 0,
-                # Características cíclicas
-                'hour_sin': np.sin(2 * np.pi * future_time.hour / 24),
-                'hour_cos': np.cos(2 * np.pi * future_time.hour / 24),
-                'day_sin': np.sin(2 * np.pi * future_time.weekday() / 7),
-                'day_cos': np.cos(2 * np.pi * future_time.weekday() / 7),
-            }
-            
-            # Realizar predicción
-            consumption = prediction_service.predict_consumption(
-                features, 
-                target=device_type
-            )
-            
             predictions.append({
                 'timestamp': future_time.isoformat(),
                 'hour': future_time.hour,
-                'predicted_consumption': float(consumption),
+                'predicted_consumption': consumption,
                 'device_type': device_type
             })
         
@@ -128,7 +290,7 @@ def predict_consumption():
             'predictions': predictions,
             'user_id': user_id,
             'model_type': 'uk_dale_trained',
-            'total_predicted_24h': sum(p['predicted_consumption'] for p in predictions[:24])
+            'total_predicted_24h': float(consumptions[:24].sum())
         })
         
     except Exception as e:
@@ -138,19 +300,159 @@ def predict_consumption():
             'status': 'error'
         }), 500
 
+def predict_batch_binary():
+    """/predict/batch con los trabajos como columnas binarias.
+    
+    Columnas: target (texto), hours_ahead y, opcionalmente, user_id y las
+    características del hogar (temperature, humidity, occupancy, house_size).
+    """
+    with metrics.timer('ml_http_stage_duration_seconds', endpoint='/predict/batch', stage='decode_binary'):
+        columns = decode_columns(request.get_data(), request.mimetype)
+    
+    if 'target' not in columns:
+        return jsonify({'error': 'Columna target requerida'}), 400
+    
+    targets = columns['target'].astype(str)
+    n_jobs = len(targets)
+    if n_jobs > CONFIG['MAX_BATCH_JOBS']:
+        return jsonify({
+            'error': f"Máximo {CONFIG['MAX_BATCH_JOBS']} trabajos por lote"
+        }), 400
+    
+    unknown = sorted(set(np.unique(targets).tolist()) - set(prediction_service.models))
+    if unknown:
+        return jsonify({'error': f'Modelos no disponibles: {unknown}'}), 400
+    
+    # Valores por defecto de las características que no vengan en el cuerpo
+    defaults = parse_base_features({})
+    features = {
+        name: columns[name] if name in columns else np.full(n_jobs, default, dtype=np.float64)
+        for name, default in defaults.items()
+    }
+    hours_ahead = columns['hours_ahead'] if 'hours_ahead' in columns else np.full(n_jobs, 24)
+    error = hours_ahead_error(hours_ahead)
+    if error:
+        return jsonify({'error': error}), 400
+    user_ids = columns['user_id'].tolist() if 'user_id' in columns else [None] * n_jobs
+    
+    now = datetime.now()
+    predictions = prediction_service.predict_batch_columns(targets, features, hours_ahead, start=now)
+    
+    results = {}
+    for index, (user_id, target, consumptions) in enumerate(zip(user_ids, targets.tolist(), predictions)):
+        results[str(index)] = {
+            'status': 'success',
+            'user_id': user_id,
+            'target': target,
+            'predicted_consumption': consumptions.tolist(),
+            'total_predicted_24h': float(consumptions[:24].sum())
+        }
+    
+    return jsonify({
+        'status': 'success',
+        'results': results,
+        'start': now.isoformat(),
+        'step_hours': 1,
+        'jobs_processed': n_jobs,
+        'models_used': sorted(set(targets.tolist())),
+        'model_type': 'uk_dale_trained'
+    })
+
+@app.route('/predict/batch', methods=['POST'])
+def predict_batch():
+    """Predice en bloque para muchos hogares y modelos en una sola llamada"""
+    try:
+        if not models_ready():
+            return jsonify({
+                'error': 'Modelos ML no disponibles',
+                'status': 'error'
+            }), 503
+        
+        if request.mimetype in binary_mimetypes():
+            return predict_batch_binary()
+        
+        data = request.get_json()
+        
+        # Validar entrada
+        if not data or not isinstance(data.get('jobs'), list):
+            return jsonify({'error': 'Lista de trabajos (jobs) requerida'}), 400
+        
+        if len(data['jobs']) > CONFIG['MAX_BATCH_JOBS']:
+            return jsonify({
+                'error': f"Máximo {CONFIG['MAX_BATCH_JOBS']} trabajos por lote"
+            }), 400
+        
+        # Normalizar trabajos; los de modelos inexistentes se responden con error
+        jobs = []
+        keys = []
+        results = {}
+        for index, job in enumerate(data['jobs']):
+            key = str(job.get('job_id', index))
+            target = job.get('target', 'aggregate')
+            
+            if target not in prediction_service.models:
+                results[key] = {
+                    'status': 'error',
+                    'error': f'Modelo {target} no disponible'
+                }
+                continue
+            
+            jobs.append({
+                'user_id': job.get('user_id'),
+                'target': target,
+                'features': parse_base_features(job.get('features') or {}),
+                'hours_ahead': int(job.get('hours_ahead', 24)),
+            })
+            keys.append(key)
+        
+        error = hours_ahead_error([job['hours_ahead'] for job in jobs])
+        if error:
+            return jsonify({'error': error}), 400
+        
+        # Una llamada a predict por modelo para todo el lote
+        now = datetime.now()
+        predictions = prediction_service.predict_batch(jobs, start=now)
+        
+        for key, job, consumptions in zip(keys, jobs, predictions):
+            results[key] = {
+                'status': 'success',
+                'user_id': job['user_id'],
+                'target': job['target'],
+                'predicted_consumption': consumptions.tolist(),
+                'total_predicted_24h': float(consumptions[:24].sum())
+            }
+        
+        return jsonify({
+            'status': 'success',
+            'results': results,
+            'start': now.isoformat(),
+            'step_hours': 1,
+            'jobs_processed': len(jobs),
+            'models_used': sorted({job['target'] for job in jobs}),
+            'model_type': 'uk_dale_trained'
+        })
+        
+    except PayloadError as e:
+        return jsonify({'error': str(e), 'status': 'error'}), 400
+    except Exception as e:
+        logger.error(f"Error en predicción por lotes: {e}")
+        return jsonify({
+            'error': f'Error interno: {str(e)}',
+            'status': 'error'
+        }), 500
+
 @app.route('/predict/appliance/<appliance_name>', methods=['POST'])
 def predict_appliance(appliance_name):
     """Predice consumo de un electrodoméstico específico"""
     try:
-        if not MODELS_AVAILABLE:
+        if not models_ready():
             return jsonify({
                 'error': 'Modelos ML no disponibles',
                 'status': 'error'
             }), 503
         
         # Verificar que el electrodoméstico tiene modelo
-        available_appliances = ['fridge', 'washing_machine', 'dishwasher', 
-                              'kettle', 'microwave', 'toaster', 'television', 'lighting']
+        available_appliances = list(APPLIANCES)
         
         if appliance_name not in available_appliances:
             return jsonify({
@@ -167,21 +469,15 @@ def predict_appliance(appliance_name):
             'occupancy': data.get('occupancy', 2),
         }
         
-        # Predecir para la próxima hora
+        # Predecir para la próxima hora (calendario de la tabla precalculada)
         now = datetime.now()
+        calendar = calendar_feature_matrix(now, 1)
         features = {
             **base_features,
-            'hour': now.hour,
-            'day_of_week': now.weekday(),
-            'month': now.month,
-            'is_weekend': 1 if now.weekday() >= 5 else 0,
-            'hour_sin': np.sin(2 * np.pi * now.hour / 24),
-            'hour_cos': np.cos(2 * np.pi * now.hour / 24),
-            'day_sin': np.sin(2 * np.pi * now.weekday() / 7),
-            'day_cos': np.cos(2 * np.pi * now.weekday() / 7),
+            **{name: float(values[0]) for name, values in calendar.items()}
         }
         
-        consumption = prediction_service.predict_consumption(features, target=appliance_name)
+        consumption = predict_single(features, target=appliance_name)
         
         return jsonify({
             'status': 'success',
@@ -199,18 +495,65 @@ def predict_appliance(appliance_name):
             'status': 'error'
         }), 500
 
+@app.route('/predict/appliances', methods=['POST'])
+def predict_appliances():
+    """Predice todos los electrodomésticos y el agregado en una sola llamada"""
+    try:
+        if not models_ready():
+            return jsonify({
+                'error': 'Modelos ML no disponibles',
+                'status': 'error'
+            }), 503
+        
+        data = request.get_json(silent=True) or {}
+        started = time.perf_counter()
+        
+        # Bloque de características común: hogar + calendario de la próxima hora
+        now = datetime.now()
+        calendar = calendar_feature_matrix(now, 1)
+        features = {
+            **parse_base_features(data),
+            **{name: float(values[0]) for name, values in calendar.items()}
+        }
+        
+        results = prediction_service.predict_targets(features, ['aggregate', *APPLIANCES])
+        aggregate = results.pop('aggregate', None)
+        
+        return jsonify({
+            'status': 'success',
+            'appliances': results,
+            'aggregate': aggregate,
+            'total_appliances': sum(r['predicted_consumption'] for r in results.values()),
+            'unit': 'watts',
+            'timestamp': now.isoformat(),
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 3),
+            'model_type': 'uk_dale_trained'
+        })
+        
+    except Exception as e:
+        logger.error(f"Error en predicción de electrodomésticos: {e}")
+        return jsonify({
+            'error': f'Error interno: {str(e)}',
+            'status': 'error'
+        }), 500
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Latencias por endpoint y etapa, llamadas a modelos y tamaños de lote"""
+    return Response(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/models/status', methods=['GET'])
 def models_status():
     """Información sobre el estado de los modelos"""
     try:
-        if not MODELS_AVAILABLE:
+        if not models_ready():
             return jsonify({
-                'status': 'unavailable',
+                'status': prediction_service.get_loading_state() if MODELS_AVAILABLE else 'unavailable',
                 'message': 'Modelos ML no cargados'
             })
         
         # Obtener métricas de los modelos
-        metrics = prediction_service.get_model_metrics()
+        model_metrics = prediction_service.get_model_metrics()
         
         # Información de modelos disponibles
         available_models = list(prediction_service.models.keys())
@@ -219,7 +562,13 @@ def models_status():
             'status': 'available',
             'models_loaded': len(available_models),
             'available_models': available_models,
-            'model_metrics': metrics,
+            'model_metrics': model_metrics,
+            'prediction_cache': prediction_service.get_cache_stats(),
+            'micro_batching': batcher.stats() if batcher is not None else None,
+            'model_version': prediction_service.version,
+            'registered_versions': prediction_service.registry.list_versions(),
+            'model_loading': prediction_service.get_load_stats(),
+            'worker_memory': {'pid': os.getpid(), **process_memory_mb()},
             'data_source': 'UK-DALE synthetic dataset',
             'training_samples': '432,000 samples',
             'training_period': '30 days',
@@ -233,17 +582,186 @@ def models_status():
             'status': 'error'
         }), 500
 
+def admin_authorized():
+    """Las operaciones de administración requieren ML_ADMIN_TOKEN"""
+    token = request.headers.get('X-Admin-Token')
+    return CONFIG['ADMIN_TOKEN'] is not None and token == CONFIG['ADMIN_TOKEN']
+
+@app.route('/models/reload', methods=['POST'])
+def reload_models():
+    """Carga una versión de modelos (o la activa del registro) y la activa"""
+    try:
+        if not MODELS_AVAILABLE:
+            return jsonify({
+                'error': 'Modelos ML no disponibles',
+                'status': 'error'
+            }), 503
+        
+        if not admin_authorized():
+            return jsonify({'error': 'No autorizado', 'status': 'error'}), 403
+        
+        data = request.get_json(silent=True) or {}
+        version = data.get('version')
+        
+        # Se activa en el registro (y el resto de workers la carga) solo si
+        # este worker la ha cargado bien
+        if version:
+            loaded = prediction_service.activate(version)
+        else:
+            loaded = prediction_service.load_models()
+        
+        if not loaded:
+            return jsonify({
+                'error': 'No se pudo cargar la versión; se mantienen los modelos actuales',
+                'status': 'error',
+                'model_version': prediction_service.version
+            }), 500
+        
+        return jsonify({
+            'status': 'success',
+            'model_version': prediction_service.version,
+            'model_loading': prediction_service.get_load_stats()
+        })
+        
+    except ValueError as e:
+        return jsonify({'error': str(e), 'status': 'error'}), 400
+    except Exception as e:
+        logger.error(f"Error recargando modelos: {e}")
+        return jsonify({
+            'error': f'Error: {str(e)}',
+            'status': 'error'
+        }), 500
+
+@app.route('/models/rollback', methods=['POST'])
+def rollback_models():
+    """Vuelve a la versión de modelos activa anteriormente"""
+    try:
+        if not MODELS_AVAILABLE:
+            return jsonify({
+                'error': 'Modelos ML no disponibles',
+                'status': 'error'
+            }), 503
+        
+        if not admin_authorized():
+            return jsonify({'error': 'No autorizado', 'status': 'error'}), 403
+        
+        if not prediction_service.rollback():
+            return jsonify({
+                'error': 'No se pudo cargar la versión anterior',
+                'status': 'error',
+                'model_version': prediction_service.version
+            }), 500
+        
+        return jsonify({
+            'status': 'success',
+            'model_version': prediction_service.version
+        })
+        
+    except ValueError as e:
+        return jsonify({'error': str(e), 'status': 'error'}), 400
+    except Exception as e:
+        logger.error(f"Error en rollback de modelos: {e}")
+        return jsonify({
+            'error': f'Error: {str(e)}',
+            'status': 'error'
+        }), 500
+
+def read_consumption_chunks():
+    """Lee el cuerpo NDJSON o CSV de la petición en bloques de DataFrame.
+    
+    Un cuerpo vacío o mal formado lanza PayloadError (respuesta 400).
+    """
+    import pandas as pd
+    
+    stream = io.TextIOWrapper(request.stream, encoding='utf-8')
+    try:
+        if request.mimetype == 'text/csv':
+            yield from pd.read_csv(stream, chunksize=CONFIG['STREAM_CHUNK_ROWS'])
+        else:
+            yield from pd.read_json(stream, lines=True, chunksize=CONFIG['STREAM_CHUNK_ROWS'])
+    except ValueError as e:
+        # EmptyDataError, ParserError y UnicodeDecodeError son ValueError
+        raise PayloadError(f"Cuerpo {request.mimetype} no válido: {e}") from e
+
+def analyze_consumption_stream():
+    """Análisis de una serie enviada por bloques (NDJSON o CSV) con memoria constante"""
+    import pandas as pd
+    from anomaly_detection import PeakDetector
+    
+    stats = ConsumptionStats()
+    detector = PeakDetector.from_params(request.args)
+    
+    for chunk in read_consumption_chunks():
+        if 'consumption' not in chunk.columns:
+            return jsonify({'error': 'Columna consumption requerida'}), 400
+        
+        hours = timestamps = None
+        if 'timestamp' in chunk.columns:
+            parsed = pd.to_datetime(chunk['timestamp'])
+            hours = parsed.dt.hour.to_numpy()
+            timestamps = parsed.values.astype('datetime64[s]')
+        values = chunk['consumption'].to_numpy(dtype=np.float64)
+        stats.update(values, hours)
+        detector.update(values, hours, timestamps)
+    
+    if stats.count == 0:
+        return jsonify({'error': 'Datos de consumo requeridos'}), 400
+    
+    analysis = stats.analysis()
+    analysis['peak_detection'] = detector.result()
+    
+    return jsonify({
+        'status': 'success',
+        'analysis': analysis,
+        'analyzed_samples': stats.count,
+        'mode': 'streaming'
+    })
+
+def analyze_consumption_binary():
+    """Análisis de una serie columnar binaria (.npy estructurado o Arrow IPC)"""
+    from anomaly_detection import detect_peaks
+    
+    with metrics.timer('ml_http_stage_duration_seconds', endpoint='/analyze/consumption', stage='decode_binary'):
+        columns = decode_columns(request.get_data(), request.mimetype)
+    
+    if 'consumption' not in columns or len(columns['consumption']) == 0:
+        return jsonify({'error': 'Datos de consumo requeridos'}), 400
+    
+    timestamps = columns.get('timestamp')
+    hours = hours_of_day(timestamps) if timestamps is not None else None
+    if timestamps is not None and not np.issubdtype(timestamps.dtype, np.datetime64):
+        timestamps = timestamps.astype('datetime64[s]')
+    
+    analysis = analyze_arrays(columns['consumption'], hours)
+    analysis['peak_detection'] = detect_peaks(columns['consumption'], hours, timestamps, request.args)
+    
+    return jsonify({
+        'status': 'success',
+        'analysis': analysis,
+        'analyzed_samples': len(columns['consumption'])
+    })
+
 @app.route('/analyze/consumption', methods=['POST'])
 def analyze_consumption():
     """Análisis avanzado de patrones de consumo"""
+    import pandas as pd
+    from anomaly_detection import detect_peaks
+    
     try:
+        if request.mimetype in STREAMING_MIMETYPES:
+            return analyze_consumption_stream()
+        
+        if request.mimetype in binary_mimetypes():
+            return analyze_consumption_binary()
+        
         data = request.get_json()
         
         if not data or 'consumption_data' not in data:
             return jsonify({'error': 'Datos de consumo requeridos'}), 400
         
         consumption_data = data['consumption_data']
-        df = pd.DataFrame(consumption_data)
+        with metrics.timer('ml_http_stage_duration_seconds', endpoint='/analyze/consumption', stage='dataframe'):
+            df = pd.DataFrame(consumption_data)
         
         # Análisis básico
         analysis = {
@@ -269,12 +787,23 @@ def analyze_consumption():
             analysis['peak_hours'] = peaks['hour'].tolist() if len(peaks) > 0 else []
             analysis['num_peaks'] = len(peaks)
         
+        # Intervalos de pico locales (ventana móvil, estacionalidad horaria y EWMA)
+        with metrics.timer('ml_http_stage_duration_seconds', endpoint='/analyze/consumption', stage='peak_detection'):
+            analysis['peak_detection'] = detect_peaks(
+                df['consumption'].to_numpy(dtype=np.float64),
+                df['hour'].to_numpy() if 'hour' in df.columns else None,
+                df['timestamp'].values.astype('datetime64[s]') if 'hour' in df.columns else None,
+                data.get('peak_detection')
+            )
+        
         return jsonify({
             'status': 'success',
             'analysis': analysis,
             'analyzed_samples': len(df)
         })
         
+    except PayloadError as e:
+        return jsonify({'error': str(e), 'status': 'error'}), 400
     except Exception as e:
         logger.error(f"Error en análisis: {e}")
         return jsonify({
@@ -282,6 +811,113 @@ def analyze_consumption():
             'status': 'error'
         }), 500
 
+def series_epoch_seconds(timestamps):
+    """Segundos epoch (UTC) de una columna de timestamps en texto o datetime"""
+    import pandas as pd
+    
+    timestamps = pd.to_datetime(timestamps, utc=True).dt.tz_localize(None)
+    return epoch_seconds(timestamps.to_numpy())
+
+def ingest_consumption_stream(household_id):
+    """Ingesta por bloques (NDJSON o CSV) sin cargar la serie completa"""
+    ingested = 0
+    for chunk in read_consumption_chunks():
+        if 'consumption' not in chunk.columns or 'timestamp' not in chunk.columns:
+            return None
+        ingested += get_rollup_store().ingest(household_id, series_epoch_seconds(chunk['timestamp']),
+                                        chunk['consumption'].to_numpy(dtype=np.float64))
+    return ingested
+
+@app.route('/consumption/ingest', methods=['POST'])
+def ingest_consumption():
+    """Incorpora lecturas de un hogar a los agregados por minuto, hora y día"""
+    import pandas as pd
+    
+    try:
+        household_id = request.args.get('household_id')
+        
+        if request.mimetype in STREAMING_MIMETYPES:
+            if not household_id:
+                return jsonify({'error': 'Parámetro household_id requerido'}), 400
+            ingested = ingest_consumption_stream(household_id)
+        
+        elif request.mimetype in binary_mimetypes():
+            if not household_id:
+                return jsonify({'error': 'Parámetro household_id requerido'}), 400
+            columns = decode_columns(request.get_data(), request.mimetype)
+            ingested = None
+            if 'consumption' in columns and 'timestamp' in columns:
+                ingested = get_rollup_store().ingest(household_id, epoch_seconds(columns['timestamp']),
+                                               columns['consumption'])
+        
+        else:
+            data = request.get_json() or {}
+            household_id = data.get('household_id', household_id)
+            if not household_id:
+                return jsonify({'error': 'Campo household_id requerido'}), 400
+            
+            df = pd.DataFrame(data.get('consumption_data', []))
+            ingested = None
+            if 'consumption' in df.columns and 'timestamp' in df.columns:
+                ingested = get_rollup_store().ingest(household_id, series_epoch_seconds(df['timestamp']),
+                                               df['consumption'].to_numpy(dtype=np.float64))
+        
+        if ingested is None:
+            return jsonify({'error': 'Columnas timestamp y consumption requeridas'}), 400
+        
+        return jsonify({
+            'status': 'success',
+            'household_id': household_id,
+            'ingested_samples': ingested
+        })
+        
+    except PayloadError as e:
+        return jsonify({'error': str(e), 'status': 'error'}), 400
+    except Exception as e:
+        logger.error(f"Error en ingesta de consumo: {e}")
+        return jsonify({
+            'error': f'Error en ingesta: {str(e)}',
+            'status': 'error'
+        }), 500
+
+@app.route('/analyze/history', methods=['POST'])
+def analyze_history():
+    """Análisis del consumo ingerido de un hogar en [start, end) desde los agregados"""
+    import pandas as pd
+    
+    try:
+        data = request.get_json() or {}
+        
+        if not data.get('household_id') or 'start' not in data or 'end' not in data:
+            return jsonify({'error': 'Campos household_id, start y end requeridos'}), 400
+        
+        start, end = (int(series_epoch_seconds(pd.Series([data[key]]))[0]) for key in ('start', 'end'))
+        if end <= start:
+            return jsonify({'error': 'end debe ser posterior a start'}), 400
+        
+        with metrics.timer('ml_http_stage_duration_seconds', endpoint='/analyze/history', stage='rollup_query'):
+            result = get_rollup_store().analyze(data['household_id'], start, end,
+                                          need_hourly=data.get('hourly', True))
+        
+        if result is None:
+            return jsonify({'error': 'Sin datos para ese hogar y rango'}), 404
+        
+        result['start'] = datetime.fromtimestamp(result['start'], tz=timezone.utc).isoformat()
+        result['end'] = datetime.fromtimestamp(result['end'], tz=timezone.utc).isoformat()
+        
+        return jsonify({
+            'status': 'success',
+            'household_id': data['household_id'],
+            **result
+        })
+        
+    except Exception as e:
+        logger.error(f"Error en análisis histórico: {e}")
+        return jsonify({
+            'error': f'Error en análisis: {str(e)}',
+            'status': 'error'
+        }), 500
+
 @app.route('/recommendations', methods=['POST'])
 def get_recommendations():
     """Genera recomendaciones de eficiencia energética"""
@@ -319,34 +955,46 @@ def get_recommendations():
             })
         
         # Recomendaciones específicas usando predicciones ML
-        if MODELS_AVAILABLE:
-            # Simular diferentes escenarios
-            base_features = {
-                'temperature': 20.0,
-                'humidity': 60.0,
-                'occupancy': occupancy,
-                'house_size': house_size,
-                'hour': datetime.now().hour,
-                'day_of_week': datetime.now().weekday(),
-                'month': datetime.now().month,
-                'is_weekend': 1 if datetime.now().weekday() >= 5 else 0,
-            }
+        scenarios = None
+        if models_ready():
+            # Simular toda la rejilla de escenarios con una sola predicción
+            base_features = parse_base_features(data)
+            start = datetime.now()
+            # Solo se barren los ejes que el modelo usa como característica
+            setpoints, occupancies, offsets, ignored_axes = scenario_axes(
+                data.get('scenarios'), base_features['temperature'], occupancy,
+                prediction_service.feature_columns('aggregate'))
             
-            predicted_current = prediction_service.predict_consumption(base_features, 'aggregate')
+            predictions = prediction_service.predict_scenarios(
+                base_features, setpoints, occupancies, offsets, start=start)
+            scenarios = summarize_scenarios(
+                predictions, setpoints, occupancies, offsets, start,
+                base_features['temperature'], occupancy,
+                top=int(data.get('top_scenarios', 5)), ignored_axes=ignored_axes)
             
-            # Scenario con temperatura optimizada
-            optimized_features = base_features.copy()
-            optimized_features['temperature'] = 18.0  # Temperatura más eficiente
-            predicted_optimized = prediction_service.predict_consumption(optimized_features, 'aggregate')
+            baseline = scenarios['baseline']
             
-            if predicted_current > predicted_optimized:
-                savings = predicted_current - predicted_optimized
+            # Mejor consigna con la ocupación y hora actuales
+            setpoint_curve = scenarios['savings_curves'].get('setpoint')
+            best_setpoint = max(setpoint_curve, key=lambda p: p['savings']) if setpoint_curve else None
+            if best_setpoint and best_setpoint['savings'] > 0:
                 recommendations.append({
                     'type': 'temperature',
                     'priority': 'medium',
                     'title': 'Optimización de temperatura',
-                    'description': f'Reducir 2°C puede ahorrar {savings:.1f}W',
-                    'action': 'Ajusta termostato a 18°C en invierno'
+                    'description': f"Pasar de {baseline['temperature']:.0f}°C a {best_setpoint['temperature']:.0f}°C puede ahorrar {best_setpoint['savings']:.1f}W",
+                    'action': f"Ajusta el termostato a {best_setpoint['temperature']:.0f}°C"
+                })
+            
+            # Mejor hora para desplazar el consumo flexible
+            best_shift = max(scenarios['savings_curves']['load_shift'], key=lambda p: p['savings'])
+            if best_shift['savings'] > 0.05 * baseline['predicted_consumption']:
+                recommendations.append({
+                    'type': 'load_shifting',
+                    'priority': 'medium',
+                    'title': 'Desplazamiento de consumo',
+                    'description': f"Usar los electrodomésticos a las {best_shift['hour']:02d}:00 reduce el consumo previsto en {best_shift['savings']:.1f}W",
+                    'action': f"Programa lavadora y lavavajillas para las {best_shift['hour']:02d}:00"
                 })
         
         # Recomendaciones generales
@@ -362,6 +1010,7 @@ def get_recommendations():
         return jsonify({
             'status': 'success',
             'recommendations': recommendations,
+            'scenarios': scenarios,
             'current_metrics': {
                 'consumption_per_m2': consumption_per_m2,
                 'consumption_per_person': consumption_per_person,
@@ -369,6 +1018,8 @@ def get_recommendations():
             }
         })
         
+    except ValueError as e:
+        return jsonify({'error': str(e), 'status': 'error'}), 400
     except Exception as e:
         logger.error(f"Error generando recomendaciones: {e}")
         return jsonify({
@@ -385,10 +1036,18 @@ def not_found(error):
         'status': 'error',
         'available_endpoints': [
             '/',
+            '/ready',
             '/predict/consumption',
+            '/predict/batch',
             '/predict/appliance/<name>',
+            '/predict/appliances',
             '/models/status',
+            '/metrics',
+            '/models/reload',
+            '/models/rollback',
             '/analyze/consumption',
+            '/analyze/history',
+            '/consumption/ingest',
             '/recommendations'
         ]
     }), 404
@@ -400,6 +1059,9 @@ def internal_error(error):
         'status': 'error'
     }), 500
 
+STARTUP_TIMINGS['app_seconds'] = round(time.perf_counter() - STARTUP_STARTED, 3)
+logger.info(f"⏱️ Arranque de la API: {STARTUP_TIMINGS}")
+
 # ==================== EJECUCIÓN ====================
 
 if __name__ == '__main__':
@@ -408,6 +1070,9 @@ if __name__ == '__main__':
     
     if MODELS_AVAILABLE:
         logger.info("✅ API lista con modelos UK-DALE entrenados")
+        prediction_service.ensure_loading()
+        if CONFIG['MODEL_WATCH_INTERVAL'] > 0:
+            prediction_service.start_watcher(CONFIG['MODEL_WATCH_INTERVAL'])
     else:
         logger.warning("⚠️ API funcionando sin modelos ML")
     
@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+"""
+Benchmark de carga HTTP de la ML API
+
+Lanza peticiones concurrentes contra /predict/consumption (varios
+hours_ahead y formatos de respuesta), /predict/appliance/<name>,
+/analyze/consumption (varios tamaños) y /recommendations, y mide
+rendimiento (peticiones/s) y latencia p50/p95/p99.
+
+Modos:
+    inprocess   cliente de pruebas de Flask en este proceso (sin red; los
+                hilos comparten el GIL, útil para comparar el coste por petición)
+    gunicorn    arranca gunicorn con gunicorn.conf.py en un puerto libre
+    --url       servidor ya en marcha (p. ej. el contenedor Docker)
+
+Los resultados se guardan en JSON (con el commit y la máquina) para comparar
+ejecuciones entre commits con --compare.
+
+Uso:
+    python benchmarks/bench_http.py --mode inprocess --concurrency 1 4 --duration 5
+    python benchmarks/bench_http.py --mode gunicorn --workers 4 --concurrency 8 --output after.json
+    python benchmarks/bench_http.py --compare before.json after.json
+
+Paralelismo de inferencia (p99 con varios workers, INFERENCE_POLICY):
+    python benchmarks/bench_http.py --mode gunicorn --workers 4 --concurrency 8 \
+        --hours-ahead 1 24 8760 --server-env INFERENCE_POLICY=sklearn --output sklearn.json
+    python benchmarks/bench_http.py --mode gunicorn --workers 4 --concurrency 8 \
+        --hours-ahead 1 24 8760 --server-env INFERENCE_POLICY=adaptive --output adaptive.json
+    python benchmarks/bench_http.py --compare sklearn.json adaptive.json
+
+    Con un solo núcleo ambas políticas predicen en un hilo y las diferencias
+    son ruido (en una máquina de 1 CPU, p99 varió hasta un 45 % entre dos
+    ejecuciones con la misma política); el efecto solo se ve con varios
+    núcleos.
+"""
+
+import argparse
+import http.client
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+from urllib.parse import urlparse
+
+import numpy as np
+
+ML_MODELS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+def consumption_body(n_samples, seed=42):
+    """Cuerpo JSON de /analyze/consumption con una serie sintética a 6 s"""
+    rng = np.random.default_rng(seed)
+    timestamps = np.datetime64('2024-01-01T00:00:00') + np.arange(n_samples) * np.timedelta64(6, 's')
+    watts = rng.lognormal(np.log(500), 0.8, n_samples)
+    return {'consumption_data': [
+        {'timestamp': str(ts), 'consumption': float(w)} for ts, w in zip(timestamps, watts)
+    ]}
+
+
+def build_scenarios(hours_ahead, formats, appliances, analyze_sizes):
+    """[(nombre, ruta, cuerpo JSON en bytes)] de cada escenario"""
+    household = {'temperature': 21.0, 'humidity': 55.0, 'occupancy': 3, 'house_size': 90}
+    scenarios = []
+    for hours in hours_ahead:
+        for response_format in formats:
+            # El formato por defecto conserva el nombre para comparar con ejecuciones anteriores
+            suffix = '' if response_format == 'records' else f'_{response_format}'
+            scenarios.append((f'consumption_h{hours}{suffix}', '/predict/consumption',
+                              {**household, 'hours_ahead': hours, 'format': response_format}))
+    for appliance in appliances:
+        scenarios.append((f'appliance_{appliance}', f'/predict/appliance/{appliance}', household))
+    for size in analyze_sizes:
+        scenarios.append((f'analyze_{size}', '/analyze/consumption', consumption_body(size)))
+    scenarios.append(('recommendations', '/recommendations',
+                      {**household, 'current_consumption': 1800}))
+    return [(name, path, json.dumps(body).encode()) for name, path, body in scenarios]
+
+
+class InProcessTransport:
+    """Cliente de pruebas de Flask (uno por hilo)"""
+
+    def __init__(self):
+        sys.path.insert(0, ML_MODELS_DIR)
+        from app import app
+        self.app = app
+        self.local = threading.local()
+
+    def post(self, path, body):
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            client = self.local.client = self.app.test_client()
+        return client.post(path, data=body, content_type='application/json').status_code
+
+    def get_json(self, path):
+        return self.app.test_client().get(path).get_json()
+
+
+class HttpTransport:
+    """Conexiones HTTP keep-alive (una por hilo) contra ``base_url``"""
+
+    def __init__(self, base_url):
+        url = urlparse(base_url)
+        self.host, self.port = url.hostname, url.port or 80
+        self.local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = self.local.connection = http.client.HTTPConnection(self.host, self.port, timeout=60)
+        return connection
+
+    def post(self, path, body):
+        connection = self._connection()
+        try:
+            connection.request('POST', path, body=body, headers={'Content-Type': 'application/json'})
+            response = connection.getresponse()
+            response.read()
+            return response.status
+        except (http.client.HTTPException, OSError):
+            # Conexión cerrada por el servidor: se reabre en la siguiente petición
+            connection.close()
+            self.local.connection = None
+            raise
+
+    def get_json(self, path):
+        connection = http.client.HTTPConnection(self.host, self.port, timeout=10)
+        try:
+            connection.request('GET', path)
+            return json.loads(connection.getresponse().read())
+        finally:
+            connection.close()
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_gunicorn(workers, timeout=120, server_env=None):
+    """Arranca gunicorn con la configuración del repositorio; devuelve (proceso, url)"""
+    port = free_port()
+    env = {**os.environ, 'GUNICORN_WORKERS': str(workers), 'MODEL_WATCH_INTERVAL': '0',
+           **(server_env or {})}
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--config', 'gunicorn.conf.py',
+         '--bind', f'127.0.0.1:{port}', 'app:app'],
+        cwd=ML_MODELS_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    url = f'http://127.0.0.1:{port}'
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn terminó con código {process.returncode}")
+        try:
+            HttpTransport(url).get_json('/')
+            return process, url
+        except OSError:
+            time.sleep(0.2)
+
+    process.terminate()
+    raise RuntimeError(f"gunicorn no respondió en {timeout}s")
+
+
+def run_load(transport, path, body, concurrency, duration, warmup):
+    """``concurrency`` hilos enviando ``body`` a ``path`` durante ``duration`` s"""
+    for _ in range(warmup):
+        transport.post(path, body)
+
+    latencies = [[] for _ in range(concurrency)]
+    errors = [0] * concurrency
+    start_barrier = threading.Barrier(concurrency + 1)
+
+    def worker(i):
+        start_barrier.wait()
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                ok = transport.post(path, body) == 200
+            except (http.client.HTTPException, OSError):
+                ok = False
+            latencies[i].append(time.perf_counter() - started)
+            errors[i] += not ok
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    deadline = time.perf_counter() + duration
+    started = time.perf_counter()
+    start_barrier.wait()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    samples = np.concatenate([np.asarray(l, dtype=np.float64) for l in latencies]) * 1000
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99]) if len(samples) else (np.nan,) * 3
+    return {
+        'requests': int(len(samples)),
+        'errors': int(sum(errors)),
+        'duration_s': round(elapsed, 3),
+        'throughput_rps': round(len(samples) / elapsed, 2),
+        'latency_ms': {
+            'mean': round(float(samples.mean()), 3) if len(samples) else None,
+            'p50': round(float(p50), 3),
+            'p95': round(float(p95), 3),
+            'p99': round(float(p99), 3),
+            'max': round(float(samples.max()), 3) if len(samples) else None,
+        },
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ML_MODELS_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def percent_change(new, old):
+    """Variación en % de ``old`` a ``new``; None si ``old`` no es positivo"""
+    if not old or old <= 0:
+        return None
+    return 100 * (new / old - 1)
+
+
+def format_change(change):
+    return f"{'n/d':>9}" if change is None else f"{change:>+9.1f}"
+
+
+def compare(before_path, after_path, threshold):
+    """Compara dos resultados; devuelve 1 si algún p99 empeora más de ``threshold`` %"""
+    with open(before_path) as f:
+        before = {(r['scenario'], r['concurrency']): r for r in json.load(f)['results']}
+    with open(after_path) as f:
+        after = json.load(f)['results']
+
+    print(f"{'escenario':<24}{'conc':>5}{'rps antes':>11}{'rps ahora':>11}{'p50 Δ%':>9}{'p99 Δ%':>9}")
+    regressions = 0
+    for r in after:
+        old = before.get((r['scenario'], r['concurrency']))
+        if old is None:
+            continue
+        # Sin latencia de referencia (p. ej. ninguna petición completada) no hay variación
+        p50 = percent_change(r['latency_ms']['p50'], old['latency_ms']['p50'])
+        p99 = percent_change(r['latency_ms']['p99'], old['latency_ms']['p99'])
+        regressed = p99 is not None and p99 > threshold
+        flag = '  ⚠️' if regressed else ''
+        regressions += regressed
+        print(f"{r['scenario']:<24}{r['concurrency']:>5}{old['throughput_rps']:>11.1f}"
+              f"{r['throughput_rps']:>11.1f}{format_change(p50)}{format_change(p99)}{flag}")
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mode', choices=['inprocess', 'gunicorn'], default='inprocess')
+    parser.add_argument('--url', help='Servidor ya en marcha (ignora --mode)')
+    parser.add_argument('--workers', type=int, default=4, help='Workers de gunicorn')
+    parser.add_argument('--server-env', nargs='+', default=[], metavar='CLAVE=VALOR',
+                        help='Variables de entorno para gunicorn (p. ej. INFERENCE_POLICY=sklearn)')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4])
+    parser.add_argument('--duration', type=float, default=5.0, help='Segundos por escenario y concurrencia')
+    parser.add_argument('--warmup', type=int, default=5, help='Peticiones previas sin medir')
+    parser.add_argument('--hours-ahead', type=int, nargs='+', default=[1, 24, 168])
+    parser.add_argument('--formats', nargs='+', default=['records', 'columnar'],
+                        choices=['records', 'columnar', 'npy'],
+                        help='Formatos de respuesta de /predict/consumption')
+    parser.add_argument('--appliances', nargs='+', default=['fridge', 'kettle'])
+    parser.add_argument('--analyze-sizes', type=int, nargs='+', default=[100, 1000, 10000])
+    parser.add_argument('--scenarios', nargs='+', help='Solo los escenarios con estos nombres')
+    parser.add_argument('--output', help='Fichero JSON donde guardar los resultados')
+    parser.add_argument('--compare', nargs=2, metavar=('ANTES', 'AHORA'),
+                        help='Compara dos ficheros de resultados y termina')
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help='Empeoramiento de p99 (%%) que se marca como regresión')
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(compare(*args.compare, args.threshold))
+
+    server_env = dict(item.split('=', 1) for item in args.server_env)
+
+    server = None
+    if args.url:
+        transport, mode = HttpTransport(args.url), 'url'
+    elif args.mode == 'gunicorn':
+        server, url = start_gunicorn(args.workers, server_env=server_env)
+        transport, mode = HttpTransport(url), 'gunicorn'
+    else:
+        transport, mode = InProcessTransport(), 'inprocess'
+
+    scenarios = build_scenarios(args.hours_ahead, args.formats, args.appliances, args.analyze_sizes)
+    if args.scenarios:
+        scenarios = [s for s in scenarios if s[0] in args.scenarios]
+
+    results = []
+    try:
+        status = transport.get_json('/models/status') or {}
+        print(f"{'escenario':<24}{'conc':>5}{'peticiones':>11}{'err':>5}{'rps':>9}"
+              f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+        for name, path, body in scenarios:
+            for concurrency in args.concurrency:
+                result = run_load(transport, path, body, concurrency, args.duration, args.warmup)
+                results.append({'scenario': name, 'endpoint': path, 'concurrency': concurrency,
+                                'body_bytes': len(body), **result})
+                latency = result['latency_ms']
+                print(f"{name:<24}{concurrency:>5}{result['requests']:>11}{result['errors']:>5}"
+                      f"{result['throughput_rps']:>9.1f}{latency['p50']:>9.2f}{latency['p95']:>9.2f}"
+                      f"{latency['p99']:>9.2f}")
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(),
+            'commit': git_commit(),
+            'mode': mode,
+            'workers': args.workers if mode == 'gunicorn' else None,
+            'server_env': server_env if mode == 'gunicorn' else None,
+            'inference': (status.get('model_loading') or {}).get('inference'),
+            'duration_s': args.duration,
+            'model_version': status.get('model_version'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
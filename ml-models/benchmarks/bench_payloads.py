@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Benchmark de cargas JSON frente a binarias columnares (.npy) en la ML API
+
+Mide, dentro del proceso (cliente de pruebas de Flask), el tiempo total de
+/analyze/consumption y /predict/batch con el mismo contenido enviado como
+JSON y como array .npy estructurado.
+
+Uso:
+    python benchmarks/bench_payloads.py --sizes 10000 100000 1000000 --repeat 3
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app import app  # noqa: E402
+from payloads import NPY_MIMETYPE, encode_npy  # noqa: E402
+
+
+def consumption_series(n_samples, seed=42):
+    """Serie sintética de consumo a 6 s: (timestamps datetime64[s], watts float32)"""
+    rng = np.random.default_rng(seed)
+    timestamps = np.datetime64('2024-01-01T00:00:00') + np.arange(n_samples) * np.timedelta64(6, 's')
+    watts = rng.lognormal(np.log(500), 0.8, n_samples).astype(np.float32)
+    return timestamps, watts
+
+
+def time_request(client, repeat, **kwargs):
+    """Mejor tiempo (s) de ``repeat`` peticiones POST idénticas"""
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        response = client.post(**kwargs)
+        best = min(best, time.perf_counter() - started)
+        if response.status_code != 200:
+            raise RuntimeError(f"{kwargs['path']}: HTTP {response.status_code} {response.get_data(as_text=True)[:200]}")
+    return best
+
+
+def bench_analysis(client, n_samples, repeat):
+    timestamps, watts = consumption_series(n_samples)
+    
+    json_body = json.dumps({'consumption_data': [
+        {'timestamp': str(ts), 'consumption': float(w)} for ts, w in zip(timestamps, watts)
+    ]})
+    records = np.empty(n_samples, dtype=[('timestamp', '<M8[s]'), ('consumption', '<f4')])
+    records['timestamp'] = timestamps
+    records['consumption'] = watts
+    npy_body = encode_npy(records)
+    
+    return {
+        'endpoint': '/analyze/consumption',
+        'rows': n_samples,
+        'json_bytes': len(json_body),
+        'npy_bytes': len(npy_body),
+        'json_seconds': time_request(client, repeat, path='/analyze/consumption',
+                                     data=json_body, content_type='application/json'),
+        'npy_seconds': time_request(client, repeat, path='/analyze/consumption',
+                                    data=npy_body, content_type=NPY_MIMETYPE),
+    }
+
+
+def bench_batch(client, n_jobs, repeat):
+    rng = np.random.default_rng(7)
+    targets = np.array(['aggregate', 'fridge', 'television', 'lighting'])[rng.integers(0, 4, n_jobs)]
+    temperature = rng.uniform(5, 30, n_jobs).astype(np.float32)
+    
+    json_body = json.dumps({'jobs': [
+        {'user_id': i, 'target': str(t), 'features': {'temperature': float(temp)}, 'hours_ahead': 24}
+        for i, (t, temp) in enumerate(zip(targets, temperature))
+    ]})
+    jobs = np.empty(n_jobs, dtype=[('user_id', '<i8'), ('target', '<U16'),
+                                   ('temperature', '<f4'), ('hours_ahead', '<i4')])
+    jobs['user_id'] = np.arange(n_jobs)
+    jobs['target'] = targets
+    jobs['temperature'] = temperature
+    jobs['hours_ahead'] = 24
+    npy_body = encode_npy(jobs)
+    
+    return {
+        'endpoint': '/predict/batch',
+        'rows': n_jobs,
+        'json_bytes': len(json_body),
+        'npy_bytes': len(npy_body),
+        'json_seconds': time_request(client, repeat, path='/predict/batch',
+                                     data=json_body, content_type='application/json'),
+        'npy_seconds': time_request(client, repeat, path='/predict/batch',
+                                    data=npy_body, content_type=NPY_MIMETYPE),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000],
+                        help='Muestras por serie en /analyze/consumption')
+    parser.add_argument('--jobs', type=int, nargs='+', default=[100, 1000, 5000],
+                        help='Trabajos por lote en /predict/batch')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help='Fichero JSON donde guardar los resultados')
+    args = parser.parse_args()
+    
+    client = app.test_client()
+    results = [bench_analysis(client, n, args.repeat) for n in args.sizes]
+    results += [bench_batch(client, n, args.repeat) for n in args.jobs]
+    
+    print(f"{'endpoint':<22}{'filas':>10}{'JSON MB':>10}{'npy MB':>10}{'JSON s':>10}{'npy s':>10}{'x':>8}")
+    for r in results:
+        print(f"{r['endpoint']:<22}{r['rows']:>10}{r['json_bytes'] / 1e6:>10.2f}{r['npy_bytes'] / 1e6:>10.2f}"
+              f"{r['json_seconds']:>10.3f}{r['npy_seconds']:>10.3f}{r['json_seconds'] / r['npy_seconds']:>8.1f}")
+    
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
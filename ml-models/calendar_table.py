@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Tabla de características de calendario compartida por el entrenador y el servicio
+Precalcula una vez, al importar, las características de cada día (día de la
+semana, mes, trimestre, fin de semana, festivos de España y Reino Unido) y de
+cada hora del día (codificaciones cíclicas) en un rango de años. Las
+características de un timestamp se obtienen indexando esas tablas, sin
+trigonometría por petición, y entrenamiento y predicción usan exactamente
+los mismos valores.
+"""
+
+import os
+from datetime import datetime
+
+import numpy as np
+
+# Festivos opcionales: sin el paquete holidays las columnas de festivo valen 0
+try:
+    import holidays
+except ImportError:
+    holidays = None
+
+# Características de calendario que se derivan del instante (orden de entrenamiento)
+CALENDAR_FEATURES = ('hour', 'day_of_week', 'month', 'quarter', 'is_weekend',
+                     'hour_sin', 'hour_cos', 'day_sin', 'day_cos')
+
+# Festivos nacionales de España e Inglaterra (los hogares UK-DALE están en Londres)
+HOLIDAY_COUNTRIES = {'is_holiday_es': ('ES', None), 'is_holiday_uk': ('GB', 'ENG')}
+HOLIDAY_FEATURES = tuple(HOLIDAY_COUNTRIES)
+
+DAY_COLUMNS = ('day_of_week', 'month', 'quarter', 'is_weekend', 'day_sin', 'day_cos') + HOLIDAY_FEATURES
+HOUR_COLUMNS = ('hour', 'hour_sin', 'hour_cos')
+
+
+def hours_since_epoch(timestamps):
+    """Horas desde 1970-01-01 de timestamps datetime64 (o un datetime suelto)"""
+    if isinstance(timestamps, datetime):
+        timestamps = np.datetime64(timestamps.replace(tzinfo=None))
+    return np.asarray(timestamps).astype('datetime64[h]').astype(np.int64)
+
+
+class CalendarTable:
+    """Tablas por día (años ``first_year``..``last_year``) y por hora del día.
+
+    Ocupan unos pocos cientos de KB; los días fuera del rango se calculan al
+    vuelo con las mismas fórmulas, así que el resultado no depende del rango.
+    """
+
+    def __init__(self, first_year, last_year):
+        self.first_year = first_year
+        self.last_year = last_year
+        self.first_day = np.datetime64(f'{first_year}-01-01', 'D').astype(np.int64)
+        days = np.arange(self.first_day, np.datetime64(f'{last_year + 1}-01-01', 'D').astype(np.int64))
+
+        self.day_table = self._day_features(days)
+        self.hour_table = self._hour_features(np.arange(24))
+        self.day_index = {name: j for j, name in enumerate(DAY_COLUMNS)}
+        self.holidays_available = holidays is not None
+
+    @staticmethod
+    def _day_features(days):
+        """Matriz (días x DAY_COLUMNS) para días desde 1970-01-01"""
+        # 1970-01-01 fue jueves (weekday() == 3)
+        day_of_week = ((days + 3) % 7).astype(np.float64)
+        month = (days.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64) % 12 + 1).astype(np.float64)
+
+        columns = [
+            day_of_week,
+            month,
+            (month - 1) // 3 + 1,
+            (day_of_week >= 5).astype(np.float64),
+            np.sin(2 * np.pi * day_of_week / 7),
+            np.cos(2 * np.pi * day_of_week / 7),
+        ]
+        columns.extend(CalendarTable._holiday_flags(days))
+        return np.column_stack(columns)
+
+    @staticmethod
+    def _holiday_flags(days):
+        """Una columna 0/1 por país de HOLIDAY_COUNTRIES"""
+        if holidays is None or len(days) == 0:
+            return [np.zeros(len(days)) for _ in HOLIDAY_FEATURES]
+
+        dates = days.astype('datetime64[D]')
+        years = range(int(str(dates.min())[:4]), int(str(dates.max())[:4]) + 1)
+        flags = []
+        for country, subdiv in HOLIDAY_COUNTRIES.values():
+            calendar = holidays.country_holidays(country, subdiv=subdiv, years=years)
+            holiday_days = np.array(sorted(calendar), dtype='datetime64[D]')
+            flags.append(np.isin(dates, holiday_days).astype(np.float64))
+        return flags
+
+    @staticmethod
+    def _hour_features(hours):
+        """Matriz (horas x HOUR_COLUMNS) para horas del día"""
+        hour = np.asarray(hours, dtype=np.float64)
+        return np.column_stack([hour, np.sin(2 * np.pi * hour / 24), np.cos(2 * np.pi * hour / 24)])
+
+    def lookup(self, hours):
+        """{característica: array} para ``hours`` (horas desde 1970-01-01)"""
+        hours = np.asarray(hours, dtype=np.int64)
+        day_offset = hours // 24 - self.first_day
+        hour_rows = self.hour_table[hours % 24]
+
+        if len(hours) and (day_offset.min() < 0 or day_offset.max() >= len(self.day_table)):
+            # Fuera del rango precalculado: mismas fórmulas sobre los días pedidos
+            day_rows = self._day_features(hours // 24)
+        else:
+            day_rows = self.day_table[day_offset]
+
+        features = {name: hour_rows[:, j] for j, name in enumerate(HOUR_COLUMNS)}
+        features.update({name: day_rows[:, j] for j, name in enumerate(DAY_COLUMNS)})
+        return features
+
+    def at(self, start, offsets):
+        """Características de ``start`` (truncado a la hora) + ``offsets`` horas"""
+        return self.lookup(hours_since_epoch(start) + np.asarray(offsets, dtype=np.int64))
+
+    def for_timestamps(self, timestamps):
+        """Características de una serie de timestamps datetime64 (p. ej. una columna)"""
+        return self.lookup(hours_since_epoch(timestamps))
+
+
+# Tabla del proceso: UK-DALE (2012-2017) hasta unos años después del actual
+CALENDAR = CalendarTable(
+    int(os.getenv('CALENDAR_FIRST_YEAR', 2012)),
+    int(os.getenv('CALENDAR_LAST_YEAR', datetime.now().year + 5))
+)
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Esquema de características precompilado para EnergiApp
+Asocia cada característica a su columna de entrenamiento y rellena
+buffers NumPy directamente, sin pasar por pandas en cada petición
+"""
+
+import numpy as np
+
+# Características que el entrenador calcula a partir de otras (mismas fórmulas
+# que en data/uk-dale/train_models.py): característica -> (origen, función)
+DERIVED_FEATURES = {
+    'temp_squared': ('temperature', lambda temperature: temperature ** 2),
+    'humidity_normalized': ('humidity', lambda humidity: humidity / 100),
+}
+
+
+class FeatureSchema:
+    """Orden fijo de columnas de un modelo y su índice nombre -> posición"""
+    
+    def __init__(self, columns, dtype=np.float64):
+        self.columns = tuple(columns)
+        self.index = {name: j for j, name in enumerate(self.columns)}
+        self.dtype = np.dtype(dtype)
+        # Fila plantilla: las características no informadas valen 0
+        self._template = np.zeros(len(self.columns), dtype=self.dtype)
+        # (origen, columna derivada, columna origen, función) de las derivadas del modelo
+        self.derived = [
+            (source, self.index[name], self.index[source], function)
+            for name, (source, function) in DERIVED_FEATURES.items()
+            if name in self.index and source in self.index
+        ]
+    
+    def __len__(self):
+        return len(self.columns)
+    
+    @classmethod
+    def for_model(cls, model, columns=None, default_columns=()):
+        """Compila el esquema de un modelo cargado.
+        
+        Usa ``columns`` (p. ej. las de ``*_model_info.json``) si coinciden con
+        el número de características del modelo; si no, las columnas que
+        scikit-learn guardó al entrenar (``feature_names_in_``) y, en último
+        caso, ``default_columns``.
+        """
+        n_features = getattr(model, 'n_features_in_', None)
+        names = getattr(model, 'feature_names_in_', None)
+        
+        if columns and (n_features is None or len(columns) == n_features):
+            chosen = columns
+        elif names is not None:
+            chosen = list(names)
+        else:
+            chosen = default_columns
+        
+        # Los árboles de scikit-learn trabajan internamente en float32: darles
+        # el buffer ya en ese tipo evita una conversión por llamada
+        dtype = np.float32 if hasattr(model, 'estimators_') or hasattr(model, 'tree_') else np.float64
+        return cls(chosen, dtype=dtype)
+    
+    def matrix(self, rows):
+        """Buffer (rows x columnas) inicializado a 0"""
+        return np.zeros((rows, len(self.columns)), dtype=self.dtype)
+    
+    def fill(self, X, features):
+        """Escribe ``features`` en sus columnas de ``X``.
+        
+        Los valores pueden ser escalares (se repiten en todas las filas) o
+        arrays de longitud ``len(X)``. Las claves desconocidas se ignoran.
+        Las características derivadas de las escritas se recalculan.
+        """
+        index = self.index
+        for name, value in features.items():
+            j = index.get(name)
+            if j is not None:
+                X[:, j] = value
+        for source, j, j_source, function in self.derived:
+            if source in features:
+                X[:, j] = function(X[:, j_source])
+        return X
+    
+    def derive(self, X):
+        """Recalcula todas las características derivadas de ``X`` (p. ej. tras
+        cuantizar sus columnas de origen)"""
+        for _, j, j_source, function in self.derived:
+            X[:, j] = function(X[:, j_source])
+        return X
+    
+    def row(self, features):
+        """Matriz de una fila con ``features`` en el orden de entrenamiento"""
+        out = self._template.copy()
+        index = self.index
+        for name, value in features.items():
+            j = index.get(name)
+            if j is not None:
+                out[j] = value
+        for source, j, j_source, function in self.derived:
+            if source in features:
+                out[j] = function(out[j_source])
+        return out.reshape(1, -1)
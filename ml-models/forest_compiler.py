@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Compilador de ensembles de árboles para EnergiApp
+Convierte bosques de scikit-learn en arrays planos de nodos y los evalúa con
+NumPy vectorizando sobre filas y árboles, sin la validación de entrada, el
+despacho por estimador ni el paralelismo de joblib de ``model.predict``
+"""
+
+import numpy as np
+
+# Marca de hoja en sklearn.tree._tree (TREE_LEAF)
+TREE_LEAF = -1
+
+
+class CompiledForest:
+    """Árboles concatenados en arrays planos (feature, threshold, left, right, value).
+
+    Las hojas apuntan a sí mismas con umbral +inf, así que basta con recorrer
+    ``max_depth`` niveles para que todas las filas lleguen a su hoja. La
+    predicción es ``offset + scale * suma(valores de hoja)``: media para
+    bosques aleatorios y ``init + learning_rate * suma`` para gradient boosting.
+    """
+
+    def __init__(self, feature, threshold, left, right, value, roots, max_depth,
+                 n_features, offset=0.0, scale=1.0):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.roots = roots
+        self.max_depth = max_depth
+        self.n_features = n_features
+        self.offset = offset
+        self.scale = scale
+
+    @property
+    def n_nodes(self):
+        return len(self.feature)
+
+    @classmethod
+    def from_estimator(cls, model):
+        """Compila un modelo de árboles de regresión ya entrenado"""
+        # Importación diferida: scikit-learn tarda en importarse y solo hace
+        # falta al cargar modelos, no al arrancar la API
+        from sklearn.ensemble import ExtraTreesRegressor, GradientBoostingRegressor, RandomForestRegressor
+        from sklearn.tree import DecisionTreeRegressor
+
+        if isinstance(model, (RandomForestRegressor, ExtraTreesRegressor)):
+            trees = [estimator.tree_ for estimator in model.estimators_]
+            offset, scale = 0.0, 1.0 / len(trees)
+        elif isinstance(model, GradientBoostingRegressor):
+            trees = [estimator.tree_ for estimator in model.estimators_[:, 0]]
+            offset = cls._gradient_boosting_offset(model)
+            scale = model.learning_rate
+        elif isinstance(model, DecisionTreeRegressor):
+            trees = [model.tree_]
+            offset, scale = 0.0, 1.0
+        else:
+            raise TypeError(f"Modelo no compilable: {type(model).__name__}")
+
+        if any(tree.n_outputs != 1 for tree in trees):
+            raise TypeError("Solo se compilan árboles de una salida")
+
+        features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+        offset_nodes = 0
+        for tree in trees:
+            nodes = np.arange(tree.node_count)
+            is_leaf = tree.children_left == TREE_LEAF
+
+            # Índices globales; las hojas se apuntan a sí mismas
+            left = np.where(is_leaf, nodes, tree.children_left) + offset_nodes
+            right = np.where(is_leaf, nodes, tree.children_right) + offset_nodes
+
+            features.append(np.where(is_leaf, 0, tree.feature))
+            thresholds.append(np.where(is_leaf, np.inf, tree.threshold))
+            lefts.append(left)
+            rights.append(right)
+            values.append(tree.value[:, 0, 0])
+            roots.append(offset_nodes)
+            offset_nodes += tree.node_count
+
+        return cls(
+            feature=np.concatenate(features).astype(np.intp),
+            threshold=np.concatenate(thresholds).astype(np.float64),
+            left=np.concatenate(lefts).astype(np.intp),
+            right=np.concatenate(rights).astype(np.intp),
+            value=np.concatenate(values).astype(np.float64),
+            roots=np.asarray(roots, dtype=np.intp),
+            max_depth=max(tree.max_depth for tree in trees),
+            n_features=model.n_features_in_,
+            offset=offset,
+            scale=scale
+        )
+
+    @staticmethod
+    def _gradient_boosting_offset(model):
+        """Predicción inicial (constante) de un GradientBoostingRegressor"""
+        if model.init_ == 'zero':
+            return 0.0
+        zero_row = np.zeros((1, model.n_features_in_))
+        return float(np.ravel(model.init_.predict(zero_row))[0])
+
+    def predict(self, X):
+        """Predicción para cada fila de ``X`` (n_filas x n_features)"""
+        # scikit-learn evalúa los árboles en float32 comparando con umbrales float64
+        X = np.asarray(X, dtype=np.float32)
+        rows = np.arange(X.shape[0])[:, None]
+        nodes = np.broadcast_to(self.roots, (X.shape[0], len(self.roots)))
+
+        for _ in range(self.max_depth):
+            go_left = X[rows, self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+
+        return self.offset + self.scale * self.value[nodes].sum(axis=1)
+
+    def probe_matrix(self, rows=64, seed=0):
+        """Filas sintéticas que recorren ambas ramas de los nodos del bosque.
+
+        Cada valor se toma de los umbrales reales de su característica con un
+        pequeño desplazamiento, para verificar la compilación en la carga.
+        """
+        rng = np.random.default_rng(seed)
+        X = rng.normal(size=(rows, self.n_features))
+
+        split = np.isfinite(self.threshold)
+        for j in range(self.n_features):
+            thresholds = self.threshold[split & (self.feature == j)]
+            if len(thresholds):
+                X[:, j] = rng.choice(thresholds, rows) + rng.normal(scale=1e-3, size=rows)
+        return X
+
+    def matches(self, model, rtol=1e-7, atol=1e-6):
+        """Comprueba que la versión compilada reproduce ``model.predict``"""
+        X = self.probe_matrix()
+        return bool(np.allclose(self.predict(X), model.predict(X), rtol=rtol, atol=atol))
+
+
+def compile_model(model):
+    """Compila ``model`` si es un ensemble de árboles; devuelve None si no lo es"""
+    try:
+        return CompiledForest.from_estimator(model)
+    except TypeError:
+        return None
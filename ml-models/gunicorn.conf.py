@@ -0,0 +1,97 @@
+"""
+Configuración de gunicorn para la ML API de EnergiApp
+
+Los modelos se cargan una sola vez en el proceso maestro (preload_app) y los
+workers los heredan al hacer fork, compartiendo las páginas copy-on-write en
+lugar de deserializar cada uno su propia copia.
+
+Con MODEL_LOADING=background el maestro no carga modelos: cada worker los
+carga en un hilo tras el fork (arranque más rápido, sin compartir páginas).
+
+Con MICRO_BATCHING_ENABLED=true los workers usan hilos (gthread): con
+workers sync cada proceso atiende una petición a la vez y cada lote sería de
+una fila tras esperar MICRO_BATCH_MAX_WAIT_MS.
+
+Las métricas de /metrics se suman entre workers a través de
+METRICS_MULTIPROC_DIR (por defecto, un directorio temporal por arranque).
+"""
+
+import os
+import sys
+import tempfile
+
+from process_memory import process_memory_mb
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv('GUNICORN_WORKERS', 4))
+timeout = 120
+preload_app = os.getenv('GUNICORN_PRELOAD', 'true').lower() == 'true'
+
+micro_batching = os.getenv('MICRO_BATCHING_ENABLED', 'false').lower() == 'true'
+threads = int(os.getenv('GUNICORN_THREADS', 8 if micro_batching else 1))
+worker_class = 'gthread' if threads > 1 else 'sync'
+
+# Se define antes de que el maestro importe la aplicación (preload_app)
+metrics_dir = os.environ.setdefault('METRICS_MULTIPROC_DIR', tempfile.mkdtemp(prefix='energiapp-metrics-'))
+metrics_flush_interval = float(os.getenv('METRICS_FLUSH_INTERVAL', 5))
+
+
+def on_starting(server):
+    from metrics import clear_directory
+
+    # Los contadores empiezan de cero en cada arranque del servidor
+    clear_directory(metrics_dir)
+
+
+def when_ready(server):
+    memory = process_memory_mb()
+    server.log.info(f"📦 Maestro listo (preload={preload_app}): RSS {memory['rss_mb']} MB")
+
+
+def post_fork(server, worker):
+    from metrics import metrics
+    from prediction_service import prediction_service
+
+    # Lo registrado por el maestro (p. ej. el warm-up) no es de este worker;
+    # sus series se vuelcan a METRICS_MULTIPROC_DIR para sumarlas en /metrics
+    metrics.reset()
+    metrics.start_flusher(metrics_flush_interval)
+
+    # Sin peticiones concurrentes en el worker no hay nada que agrupar
+    # (p. ej. GUNICORN_THREADS=1 o --threads 1): se desactiva el agrupador
+    if os.getenv('MICRO_BATCHING_ENABLED', 'false').lower() == 'true' and worker.cfg.threads <= 1:
+        worker.log.warning("⚠️ Micro-batching desactivado: el worker atiende una sola petición a la vez")
+        os.environ['MICRO_BATCHING_ENABLED'] = 'false'
+        app_module = sys.modules.get('app')
+        if app_module is not None:
+            app_module.batcher = None
+
+    # Con MODEL_LOADING=background cada worker carga los modelos en un hilo
+    # y atiende /ready (503) y / mientras tanto
+    prediction_service.ensure_loading()
+
+    # Los hilos del maestro no sobreviven al fork: cada worker vigila el
+    # manifiesto del registro y recarga en segundo plano cuando cambia
+    interval = float(os.getenv('MODEL_WATCH_INTERVAL', 30))
+    if interval > 0:
+        prediction_service.start_watcher(interval)
+
+
+def post_worker_init(worker):
+    memory = process_memory_mb()
+    worker.log.info(
+        f"👷 Worker {worker.pid}: RSS {memory['rss_mb']} MB, privada {memory['private_mb']} MB"
+    )
+
+
+def worker_exit(server, worker):
+    from metrics import metrics
+
+    metrics.flush()
+
+
+def child_exit(server, worker):
+    from metrics import archive_process
+
+    # Los contadores de un worker terminado se siguen sumando
+    archive_process(metrics_dir, worker.pid)
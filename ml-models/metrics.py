@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+Métricas en proceso para la ML API de EnergiApp
+Histogramas de cubetas fijas y contadores, baratos de actualizar desde
+cualquier hilo y exportables en /metrics con formato Prometheus
+
+Con varios workers (gunicorn) cada proceso tiene su propio registro. Si
+METRICS_MULTIPROC_DIR está definido, cada proceso vuelca sus series a
+``<dir>/metrics_<pid>_<inicio>.json`` (periódicamente y al responder
+/metrics) y /metrics devuelve la suma de todos los ficheros, así que el
+worker que responda da igual. Los ficheros de workers terminados se
+acumulan en ``metrics_archive.json`` (``archive_process``) para que los
+contadores nunca retrocedan.
+"""
+
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+
+ARCHIVE_FILE = 'metrics_archive.json'
+
+
+class Histogram:
+    """Histograma acumulativo con límites superiores fijos (semántica 'le')"""
+    
+    def __init__(self, buckets):
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)  # última cubeta: +Inf
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+    
+    def observe(self, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+            self._count += 1
+    
+    def reset(self):
+        with self._lock:
+            self._counts = [0] * (len(self.buckets) + 1)
+            self._sum = 0.0
+            self._count = 0
+    
+    def state(self):
+        """(recuento por cubeta no acumulado, suma, número) para volcar a disco"""
+        with self._lock:
+            return list(self._counts), self._sum, self._count
+    
+    def snapshot(self):
+        """{'buckets': {le: acumulado}, 'count': n, 'sum': total}"""
+        with self._lock:
+            counts = list(self._counts)
+            total, count = self._sum, self._count
+        
+        cumulative = {}
+        running = 0
+        for bound, n in zip(self.buckets + (float('inf'),), counts):
+            running += n
+            cumulative['+Inf' if bound == float('inf') else f'{bound:g}'] = running
+        return {'buckets': cumulative, 'count': count, 'sum': total}
+
+
+# Latencias en segundos y tamaños de lote en filas
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+ROWS_BUCKETS = (1, 8, 24, 64, 168, 512, 1024, 4096, 16384)
+
+
+class _Timer:
+    """Cronómetro de ``with`` que registra la duración en un histograma"""
+    
+    __slots__ = ('histogram', 'started')
+    
+    def __init__(self, histogram):
+        self.histogram = histogram
+    
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+    
+    def __exit__(self, *exc):
+        if self.histogram is not None:
+            self.histogram.observe(time.perf_counter() - self.started)
+        return False
+
+
+class MetricsRegistry:
+    """Histogramas y contadores etiquetados, exportables en formato Prometheus"""
+    
+    def __init__(self, enabled=True, directory=None):
+        self.enabled = enabled
+        self._meta = {}     # nombre -> (tipo, ayuda, cubetas)
+        self._series = {}   # (nombre, etiquetas) -> Histogram | [valor]
+        self._lock = threading.Lock()
+        # Directorio compartido entre procesos (None: solo este proceso)
+        self.directory = directory
+        self._file = None
+        self._file_pid = None
+        self._flusher = None
+    
+    def describe(self, name, kind, help_text, buckets=None):
+        """Declara una métrica ('histogram' o 'counter')"""
+        self._meta[name] = (kind, help_text, buckets)
+    
+    def _get(self, name, labels, factory):
+        key = (name, tuple(sorted(labels.items())))
+        series = self._series.get(key)
+        if series is None:
+            with self._lock:
+                series = self._series.setdefault(key, factory())
+        return series
+    
+    def histogram(self, name, **labels):
+        """Histograma de la serie ``name{labels}`` (se crea al primer uso)"""
+        return self._get(name, labels, lambda: Histogram(self._meta[name][2]))
+    
+    def observe(self, name, value, **labels):
+        if self.enabled:
+            self.histogram(name, **labels).observe(value)
+    
+    def inc(self, name, amount=1, **labels):
+        if self.enabled:
+            counter = self._get(name, labels, lambda: [0])
+            with self._lock:
+                counter[0] += amount
+    
+    def timer(self, name, **labels):
+        """``with metrics.timer(...)``: mide el bloque si las métricas están activas"""
+        return _Timer(self.histogram(name, **labels) if self.enabled else None)
+    
+    def reset(self):
+        """Pone a cero todas las series (conservando los objetos, que otros
+        módulos pueden tener guardados). Se llama en cada worker tras el fork
+        para no heredar lo que registró el maestro."""
+        with self._lock:
+            series = list(self._series.values())
+        for value in series:
+            if isinstance(value, Histogram):
+                value.reset()
+            else:
+                value[0] = 0
+    
+    def state(self):
+        """Series de este proceso en un formato serializable a JSON"""
+        with self._lock:
+            series = list(self._series.items())
+        
+        state = []
+        for (name, labels), value in series:
+            entry = {'name': name, 'labels': [list(label) for label in labels]}
+            if isinstance(value, Histogram):
+                entry['counts'], entry['sum'], entry['count'] = value.state()
+            else:
+                entry['value'] = value[0]
+            state.append(entry)
+        return state
+    
+    def process_file(self):
+        """Fichero de este proceso en ``directory`` (nuevo tras cada fork)"""
+        if self._file_pid != os.getpid():
+            self._file_pid = os.getpid()
+            self._file = os.path.join(self.directory, f'metrics_{os.getpid()}_{time.time_ns()}.json')
+        return self._file
+    
+    def flush(self):
+        """Vuelca las series de este proceso a su fichero (escritura atómica)"""
+        if self.directory is None:
+            return
+        _write_json(self.process_file(), self.state())
+    
+    def start_flusher(self, interval):
+        """Hilo que llama a ``flush`` cada ``interval`` s (uno por proceso)"""
+        if self.directory is None or (self._flusher is not None and self._flusher.is_alive()):
+            return self._flusher
+        
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.flush()
+                except OSError:
+                    pass
+        
+        self._flusher = threading.Thread(target=run, name='metrics-flusher', daemon=True)
+        self._flusher.start()
+        return self._flusher
+    
+    def merged_state(self):
+        """Suma de las series de todos los procesos que escriben en ``directory``"""
+        self.flush()
+        merged = {}
+        archived = _read_archive(self.directory)
+        _merge_into(merged, archived['series'])
+        for path in glob.glob(os.path.join(self.directory, 'metrics_*.json')):
+            name = os.path.basename(path)
+            # Los ficheros ya acumulados en el archivo (a punto de borrarse) no cuentan dos veces
+            if name == ARCHIVE_FILE or name in archived['files']:
+                continue
+            try:
+                with open(path) as f:
+                    entries = json.load(f)
+            except (OSError, ValueError):
+                continue
+            _merge_into(merged, entries)
+        return list(merged.values())
+    
+    def render_prometheus(self):
+        """Todas las series en el formato de texto de Prometheus (de todos los
+        procesos si hay ``directory``)"""
+        state = self.merged_state() if self.directory is not None else self.state()
+        series = sorted(((entry['name'], tuple(tuple(label) for label in entry['labels'])), entry)
+                        for entry in state)
+        
+        lines = []
+        described = set()
+        for (name, labels), entry in series:
+            if name not in self._meta:
+                continue
+            kind, help_text, buckets = self._meta[name]
+            if name not in described:
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {kind}')
+                described.add(name)
+            
+            if kind == 'counter':
+                lines.append(f'{name}{_format_labels(labels)} {entry["value"]}')
+                continue
+            
+            running = 0
+            for bound, count in zip(tuple(buckets) + (float('inf'),), entry['counts']):
+                running += count
+                le = '+Inf' if bound == float('inf') else f'{bound:g}'
+                lines.append(f'{name}_bucket{_format_labels(labels + (("le", le),))} {running}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {entry["sum"]}')
+            lines.append(f'{name}_count{_format_labels(labels)} {entry["count"]}')
+        
+        return '\n'.join(lines) + '\n'
+
+
+def _merge_into(merged, entries):
+    """Suma ``entries`` (formato de ``state``) en ``merged`` {clave: entrada}"""
+    for entry in entries:
+        key = (entry['name'], tuple(tuple(label) for label in entry['labels']))
+        current = merged.get(key)
+        if current is None:
+            merged[key] = {**entry, 'counts': list(entry['counts'])} if 'counts' in entry else dict(entry)
+        elif 'counts' in entry:
+            current['counts'] = [a + b for a, b in zip(current['counts'], entry['counts'])]
+            current['sum'] += entry['sum']
+            current['count'] += entry['count']
+        else:
+            current['value'] += entry['value']
+
+
+def _write_json(path, data):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.metrics-', suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def clear_directory(directory):
+    """Borra los ficheros de métricas de una ejecución anterior"""
+    os.makedirs(directory, exist_ok=True)
+    for path in glob.glob(os.path.join(directory, 'metrics_*.json')):
+        os.remove(path)
+
+
+def _read_archive(directory):
+    try:
+        with open(os.path.join(directory, ARCHIVE_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {'files': [], 'series': []}
+
+
+def archive_process(directory, pid):
+    """Acumula los ficheros del proceso ``pid`` (terminado) en el archivo
+    común y los borra: sus contadores siguen sumando en /metrics.
+    
+    El archivo lista los ficheros que ya incluye, para que quien lea entre
+    la escritura del archivo y el borrado no los sume dos veces.
+    """
+    paths = glob.glob(os.path.join(directory, f'metrics_{pid}_*.json'))
+    if not paths:
+        return
+    merged = {}
+    _merge_into(merged, _read_archive(directory)['series'])
+    for path in paths:
+        try:
+            with open(path) as f:
+                _merge_into(merged, json.load(f))
+        except (OSError, ValueError):
+            continue
+    _write_json(os.path.join(directory, ARCHIVE_FILE),
+                {'files': [os.path.basename(path) for path in paths], 'series': list(merged.values())})
+    for path in paths:
+        os.remove(path)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"') for _, value in labels)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + '}'
+
+
+# Registro global del proceso (METRICS_ENABLED=false lo desactiva)
+metrics = MetricsRegistry(enabled=os.getenv('METRICS_ENABLED', 'true').lower() == 'true',
+                          directory=os.getenv('METRICS_MULTIPROC_DIR') or None)
+
+metrics.describe('ml_http_request_duration_seconds', 'histogram',
+                 'Duración de las peticiones HTTP por endpoint', LATENCY_BUCKETS)
+metrics.describe('ml_http_stage_duration_seconds', 'histogram',
+                 'Duración de cada etapa de un endpoint (json, dataframe, serialización)', LATENCY_BUCKETS)
+metrics.describe('ml_inference_stage_duration_seconds', 'histogram',
+                 'Duración de cada etapa de inferencia por modelo (features, scale, predict)', LATENCY_BUCKETS)
+metrics.describe('ml_model_calls_total', 'counter',
+                 'Llamadas a predict por modelo y motor')
+metrics.describe('ml_model_batch_rows', 'histogram',
+                 'Filas por llamada a predict', ROWS_BUCKETS)
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Agrupador de peticiones (micro-batching) para EnergiApp
+Acumula filas individuales por modelo durante unos milisegundos y las evalúa
+con una sola llamada vectorizada, devolviendo a cada petición su resultado
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+from metrics import metrics
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+QUEUE_WAIT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.002, 0.005, 0.01, 0.025, 0.05, 0.1)
+
+metrics.describe('ml_microbatch_batch_size', 'histogram',
+                 'Filas por lote del agrupador de peticiones', BATCH_SIZE_BUCKETS)
+metrics.describe('ml_microbatch_queue_wait_seconds', 'histogram',
+                 'Espera en cola de cada fila hasta su lote', QUEUE_WAIT_BUCKETS)
+
+
+class MicroBatcher:
+    """Cola por modelo que se vacía al llenarse o al vencer la espera máxima"""
+    
+    def __init__(self, service, max_batch_size=64, max_wait_ms=2.0):
+        self.service = service
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queues = {}  # target -> [(encolado_en, características, future)]
+        self._cond = threading.Condition()
+        self._thread = None
+        self._pid = None
+        self.batch_sizes = metrics.histogram('ml_microbatch_batch_size')
+        self.queue_wait = metrics.histogram('ml_microbatch_queue_wait_seconds')
+    
+    @classmethod
+    def from_env(cls, service):
+        """Crea el agrupador si MICRO_BATCHING_ENABLED=true; si no, devuelve None"""
+        if os.getenv('MICRO_BATCHING_ENABLED', 'false').lower() != 'true':
+            return None
+        
+        return cls(
+            service,
+            max_batch_size=int(os.getenv('MICRO_BATCH_MAX_SIZE', 64)),
+            max_wait_ms=float(os.getenv('MICRO_BATCH_MAX_WAIT_MS', 2.0))
+        )
+    
+    def _ensure_dispatcher(self):
+        # El hilo se crea en el proceso que atiende peticiones (no sobrevive a un fork)
+        if self._thread is None or self._pid != os.getpid():
+            self._queues = {}
+            self._thread = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+            self._pid = os.getpid()
+            self._thread.start()
+    
+    def submit(self, features_dict, target='aggregate'):
+        """Encola una fila y devuelve un Future con su predicción (W)"""
+        if target not in self.service.models:
+            raise ValueError(f"Modelo {target} no disponible")
+        
+        future = Future()
+        with self._cond:
+            self._ensure_dispatcher()
+            queue = self._queues.setdefault(target, [])
+            queue.append((time.monotonic(), features_dict, future))
+            
+            # Despertar al despachador al abrir un lote o al completarlo
+            if len(queue) == 1 or len(queue) >= self.max_batch_size:
+                self._cond.notify()
+        return future
+    
+    def predict(self, features_dict, target='aggregate', timeout=None):
+        """Versión bloqueante de ``submit``"""
+        return self.submit(features_dict, target).result(timeout)
+    
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queues:
+                    self._cond.wait()
+                
+                now = time.monotonic()
+                ready = [target for target, queue in self._queues.items()
+                         if len(queue) >= self.max_batch_size or now - queue[0][0] >= self.max_wait]
+                
+                if not ready:
+                    oldest = min(queue[0][0] for queue in self._queues.values())
+                    self._cond.wait(oldest + self.max_wait - now)
+                    continue
+                
+                batches = {}
+                for target in ready:
+                    queue = self._queues.pop(target)
+                    batches[target] = queue[:self.max_batch_size]
+                    if len(queue) > self.max_batch_size:
+                        self._queues[target] = queue[self.max_batch_size:]
+            
+            for target, items in batches.items():
+                self._flush(target, items)
+    
+    def _flush(self, target, items):
+        """Evalúa un lote con una sola llamada a predict y reparte los resultados"""
+        started = time.monotonic()
+        for enqueued_at, _, _ in items:
+            self.queue_wait.observe(started - enqueued_at)
+        self.batch_sizes.observe(len(items))
+        
+        try:
+            model_set = self.service.active
+            schema = model_set.schemas[target]
+            X = np.vstack([schema.row(features) for _, features, _ in items])
+            predictions = self.service.predict_matrix(X, target, model_set)
+        except Exception as e:
+            for _, _, future in items:
+                future.set_exception(e)
+            return
+        
+        for (_, _, future), prediction in zip(items, predictions.tolist()):
+            future.set_result(prediction)
+    
+    def stats(self):
+        """Configuración e histogramas para /models/status"""
+        return {
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000,
+            'batch_size': self.batch_sizes.snapshot(),
+            'queue_wait_seconds': self.queue_wait.snapshot()
+        }
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Registro versionado de modelos para EnergiApp
+
+Estructura en disco:
+    models/
+        manifest.json           {"current": "<versión>", "history": [...]}
+        versions/<versión>/     pickles y *_model_info.json de esa versión
+        staging/<tmp>/          versiones en preparación (aún no visibles)
+
+Una versión solo aparece en ``versions/`` cuando está completa (se mueve
+desde ``staging/`` con un rename atómico) y el manifiesto se reescribe con
+``os.replace``, así que el servicio nunca lee ficheros a medio escribir.
+Si no hay manifiesto se usan los ficheros sueltos de ``models/`` (versión
+'legacy'), como antes de existir el registro.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime
+
+LEGACY_VERSION = 'legacy'
+
+
+def check_version_name(version):
+    """Valida que ``version`` sea un nombre simple (sin rutas) de versión"""
+    if (not isinstance(version, str) or not version or version in ('.', '..')
+            or '/' in version or (os.altsep and os.altsep in version) or os.sep in version):
+        raise ValueError(f"Nombre de versión de modelos no válido: {version!r}")
+    return version
+
+
+class ModelRegistry:
+    """Versiones de modelos publicadas en un directorio y su manifiesto"""
+
+    def __init__(self, root):
+        self.root = root
+        self.manifest_path = os.path.join(root, 'manifest.json')
+        self.versions_dir = os.path.join(root, 'versions')
+        self.staging_dir = os.path.join(root, 'staging')
+
+    def read_manifest(self):
+        """Manifiesto actual o None si el registro no se ha inicializado"""
+        try:
+            with open(self.manifest_path, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _write_manifest(self, manifest):
+        # Escribir a un temporal del mismo directorio y sustituir de forma atómica
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, prefix='.manifest-', suffix='.json')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def current_version(self):
+        """Versión activa según el manifiesto ('legacy' si no hay manifiesto)"""
+        manifest = self.read_manifest()
+        return manifest['current'] if manifest else LEGACY_VERSION
+
+    def list_versions(self):
+        """Versiones publicadas, de la más antigua a la más reciente"""
+        if not os.path.isdir(self.versions_dir):
+            return []
+        return sorted(name for name in os.listdir(self.versions_dir)
+                      if os.path.isdir(os.path.join(self.versions_dir, name)))
+
+    def version_dir(self, version):
+        """Directorio con los ficheros de ``version``.
+
+        Solo se aceptan versiones publicadas (``list_versions``): el nombre
+        llega de peticiones HTTP y nunca se usa como ruta arbitraria.
+        """
+        if version == LEGACY_VERSION:
+            return self.root
+
+        check_version_name(version)
+        if version not in self.list_versions():
+            raise ValueError(f"Versión de modelos {version} no encontrada")
+        return os.path.join(self.versions_dir, version)
+
+    def resolve(self, version=None):
+        """(directorio, versión) de ``version`` o de la versión activa"""
+        version = version or self.current_version()
+        return self.version_dir(version), version
+
+    def new_staging_dir(self):
+        """Directorio temporal donde el entrenador escribe una nueva versión"""
+        os.makedirs(self.staging_dir, exist_ok=True)
+        return tempfile.mkdtemp(dir=self.staging_dir)
+
+    def publish(self, staging_path, version=None, activate=True):
+        """Publica una versión preparada en ``staging_path`` y (por defecto) la activa"""
+        version = check_version_name(version or datetime.now().strftime('%Y%m%dT%H%M%S'))
+        os.makedirs(self.versions_dir, exist_ok=True)
+
+        target = os.path.join(self.versions_dir, version)
+        if os.path.exists(target):
+            raise ValueError(f"La versión de modelos {version} ya existe")
+
+        os.rename(staging_path, target)
+        if activate:
+            self.activate(version)
+        return version
+
+    def activate(self, version):
+        """Marca ``version`` como activa guardando la anterior en el historial.
+
+        Los workers vigilan el manifiesto: activar solo versiones que ya se
+        han cargado bien (``EnergiaPredictionService.activate``).
+        """
+        self.version_dir(version)
+
+        manifest = self.read_manifest() or {'current': None, 'history': []}
+        if manifest['current'] == version:
+            return manifest
+
+        if manifest['current'] is not None:
+            manifest['history'].append(manifest['current'])
+        manifest['current'] = version
+        manifest['activated_at'] = datetime.now().isoformat()
+        self._write_manifest(manifest)
+        return manifest
+
+    def previous_version(self):
+        """Versión a la que volvería ``rollback`` (sin modificar el manifiesto)"""
+        manifest = self.read_manifest()
+        if not manifest or not manifest['history']:
+            raise ValueError("No hay versión anterior a la que volver")
+        return manifest['history'][-1]
+
+    def rollback(self, expected=None):
+        """Vuelve a la versión activa anterior; devuelve la versión restaurada.
+
+        El llamador debe haber cargado antes esa versión (``previous_version``)
+        para no dejar en el manifiesto una versión que no se puede servir; si
+        se pasa ``expected`` y la anterior ya no es esa, no se modifica nada.
+        """
+        manifest = self.read_manifest()
+        if not manifest or not manifest['history']:
+            raise ValueError("No hay versión anterior a la que volver")
+        if expected is not None and manifest['history'][-1] != expected:
+            raise ValueError(f"El historial de versiones cambió; la anterior ya no es {expected}")
+
+        manifest['current'] = manifest['history'].pop()
+        manifest['activated_at'] = datetime.now().isoformat()
+        self._write_manifest(manifest)
+        return manifest['current']
+
+    def discard_staging(self, staging_path):
+        """Elimina una versión en preparación que no se llegó a publicar"""
+        shutil.rmtree(staging_path, ignore_errors=True)
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Cargas binarias columnares para la ML API de EnergiApp
+Decodifica cuerpos .npy (array estructurado) o Arrow IPC a columnas NumPy
+sin copiar los datos numéricos del cuerpo de la petición, y codifica
+respuestas columnares en JSON compacto o .npy
+"""
+
+import io
+import json
+
+import numpy as np
+
+# Arrow es opcional: si pyarrow no está instalado solo se acepta .npy
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+# orjson es opcional: serializa arrays NumPy sin convertirlos a listas
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+NPY_MIMETYPE = 'application/x-npy'
+ARROW_MIMETYPE = 'application/vnd.apache.arrow.stream'
+
+# Errores de un cuerpo truncado o mal formado (ArrowInvalid ya es ValueError)
+DECODE_ERRORS = (ValueError, OSError, EOFError) + ((pa.ArrowException,) if pa is not None else ())
+
+
+class PayloadError(ValueError):
+    """Cuerpo de la petición que no se puede decodificar (respuesta 400)"""
+
+
+def binary_mimetypes():
+    """Tipos de contenido binario aceptados con las dependencias instaladas"""
+    return (NPY_MIMETYPE, ARROW_MIMETYPE) if pa is not None else (NPY_MIMETYPE,)
+
+
+def decode_npy(buffer):
+    """Array de un fichero .npy como vista sobre ``buffer`` (sin copia)"""
+    header = io.BytesIO(buffer)
+    version = np.lib.format.read_magic(header)
+    if version == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(header)
+    else:
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(header)
+    
+    if dtype.hasobject:
+        raise ValueError("Los arrays .npy con objetos Python no están permitidos")
+    
+    count = int(np.prod(shape))
+    array = np.frombuffer(buffer, dtype=dtype, count=count, offset=header.tell())
+    return array.reshape(shape, order='F' if fortran_order else 'C')
+
+
+def decode_arrow(buffer):
+    """Columnas de un stream Arrow IPC (sin copia si no hay nulos)"""
+    table = pa.ipc.open_stream(pa.py_buffer(buffer)).read_all().combine_chunks()
+    return {name: table.column(name).to_numpy() for name in table.column_names}
+
+
+def decode_columns(buffer, mimetype):
+    """{columna: array} de un cuerpo binario.
+    
+    En .npy se espera un array estructurado (un campo por columna), p. ej.
+    dtype [('timestamp', '<M8[s]'), ('consumption', '<f4')]. Un cuerpo
+    vacío, truncado o mal formado lanza ``PayloadError``.
+    """
+    try:
+        if mimetype == ARROW_MIMETYPE and pa is not None:
+            return decode_arrow(buffer)
+        array = decode_npy(buffer)
+    except DECODE_ERRORS as e:
+        raise PayloadError(f"Cuerpo {mimetype} no válido: {e}") from e
+    
+    if array.dtype.names is None:
+        raise PayloadError("Se esperaba un array .npy estructurado con una columna por campo")
+    return {name: array[name] for name in array.dtype.names}
+
+
+def hours_of_day(timestamps):
+    """Hora del día de timestamps datetime64 o enteros epoch en segundos (UTC)"""
+    timestamps = np.asarray(timestamps)
+    if np.issubdtype(timestamps.dtype, np.datetime64):
+        return timestamps.astype('datetime64[h]').astype(np.int64) % 24
+    return (timestamps.astype(np.int64) // 3600) % 24
+
+
+def encode_npy(array):
+    """Serializa un array (p. ej. estructurado) en formato .npy"""
+    buffer = io.BytesIO()
+    np.save(buffer, array, allow_pickle=False)
+    return buffer.getvalue()
+
+
+def epoch_seconds(timestamps):
+    """Timestamps datetime64 o enteros epoch como segundos epoch int64 (UTC)"""
+    timestamps = np.asarray(timestamps)
+    if np.issubdtype(timestamps.dtype, np.datetime64):
+        return timestamps.astype('datetime64[s]').astype(np.int64)
+    return timestamps.astype(np.int64)
+
+
+def _json_default(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Tipo no serializable en JSON: {type(value).__name__}")
+
+
+def encode_json(obj):
+    """JSON compacto (bytes) de ``obj``, que puede contener arrays NumPy"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(obj, default=_json_default, separators=(',', ':')).encode()
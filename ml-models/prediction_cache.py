@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Caché de predicciones para EnergiApp
+LRU acotada en memoria, con TTL y claves construidas sobre entradas cuantizadas
+
+Guarda filas sueltas (clave: modelo + fila de características cuantizada,
+para cualquier matriz que llegue a ``predict_matrix``) y horizontes completos
+(clave: modelo + hogar cuantizado + hora de inicio + horas).
+"""
+
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+# Tamaño de intervalo por característica: el modelo apenas varía por debajo
+DEFAULT_BINS = {
+    'temperature': 0.5,   # °C
+    'humidity': 5.0,      # %
+    'occupancy': 1.0,     # personas
+    'house_size': 10.0,   # m²
+}
+
+
+def parse_bins(spec):
+    """Convierte 'temperature=0.5,humidity=5' en {'temperature': 0.5, ...}"""
+    bins = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        name, _, step = item.partition('=')
+        bins[name.strip()] = float(step)
+    return bins
+
+
+class PredictionCache:
+    """Caché LRU con TTL de predicciones (W) por modelo: escalares por fila o
+    arrays de un horizonte completo"""
+    
+    def __init__(self, max_bytes=16 * 1024 * 1024, ttl_seconds=300, bins=None, clock=time.monotonic,
+                 max_rows=10000):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        # Las matrices más largas van directas al modelo: buscar fila a fila
+        # cuesta más que predecirlas
+        self.max_rows = max_rows
+        self.bins = {**DEFAULT_BINS, **(bins or {})}
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # clave -> (caduca_en, valor, bytes)
+        self._bytes = 0
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+    
+    @classmethod
+    def from_env(cls):
+        """Crea la caché si PREDICTION_CACHE_ENABLED=true; si no, devuelve None"""
+        if os.getenv('PREDICTION_CACHE_ENABLED', 'false').lower() != 'true':
+            return None
+        
+        return cls(
+            max_bytes=int(os.getenv('PREDICTION_CACHE_MAX_BYTES', 16 * 1024 * 1024)),
+            ttl_seconds=float(os.getenv('PREDICTION_CACHE_TTL', 300)),
+            bins=parse_bins(os.getenv('PREDICTION_CACHE_BINS', '')),
+            max_rows=int(os.getenv('PREDICTION_CACHE_MAX_ROWS', 10000))
+        )
+    
+    def quantize(self, features):
+        """Redondea cada característica con intervalo configurado a su centro"""
+        quantized = {}
+        for name, value in features.items():
+            step = self.bins.get(name)
+            if step:
+                value = round(round(float(value) / step) * step, 6)
+            quantized[name] = value
+        return quantized
+    
+    def quantize_matrix(self, X, columns):
+        """Copia float64 de ``X`` con las columnas con intervalo redondeadas
+        como en ``quantize`` (``columns`` son los nombres de las columnas)"""
+        X = np.array(X, dtype=np.float64, order='C')
+        for j, name in enumerate(columns):
+            step = self.bins.get(name)
+            if step:
+                X[:, j] = np.round(np.round(X[:, j] / step) * step, 6)
+        return X
+    
+    def make_key(self, target, features):
+        """Clave hashable independiente del orden de ``features``"""
+        return (target,) + tuple(sorted(features.items()))
+    
+    def row_keys(self, target, X):
+        """Una clave por fila de ``X`` (salida de ``quantize_matrix``)"""
+        data = X.tobytes()
+        width = X.shape[1] * X.itemsize
+        return [(target, data[start:start + width]) for start in range(0, len(data), width)]
+    
+    def horizon_key(self, target, features, start, hours):
+        """Clave de un horizonte: el calendario solo depende de la hora de inicio"""
+        return self.make_key(target, features) + (('start', start.strftime('%Y-%m-%dT%H')), ('hours', hours))
+    
+    def get(self, key):
+        """Devuelve el valor almacenado o None (y cuenta acierto/fallo)"""
+        with self._lock:
+            return self._get(key)
+    
+    def get_many(self, keys):
+        """``get`` de varias claves con una sola toma del lock"""
+        with self._lock:
+            return [self._get(key) for key in keys]
+    
+    def _get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        
+        expires_at, value, size = entry
+        if expires_at <= self._clock():
+            del self._entries[key]
+            self._bytes -= size
+            self.expirations += 1
+            self.misses += 1
+            return None
+        
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+    
+    def put(self, key, value, generation=None):
+        """Almacena ``value``; se descarta si los modelos cambiaron entretanto"""
+        self.put_many([key], [value], generation)
+    
+    def put_many(self, keys, values, generation=None):
+        """Almacena ``values`` con una sola toma del lock.
+        
+        ``generation`` es la de los modelos que calcularon los valores: si
+        la caché se vació después (recarga), se descartan.
+        """
+        # getsizeof de un array NumPy propietario incluye sus datos
+        sizes = [sys.getsizeof(key) + sum(sys.getsizeof(item) for item in key) + sys.getsizeof(value)
+                 for key, value in zip(keys, values)]
+        
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            
+            expires_at = self._clock() + self.ttl_seconds
+            for key, value, size in zip(keys, values, sizes):
+                previous = self._entries.pop(key, None)
+                if previous is not None:
+                    self._bytes -= previous[2]
+                
+                self._entries[key] = (expires_at, value, size)
+                self._bytes += size
+            
+            # Expulsar las entradas menos usadas hasta respetar el límite de memoria
+            while self._bytes > self.max_bytes and self._entries:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+    
+    def clear(self):
+        """Invalida todo el contenido (p. ej. al recargar los modelos)"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.generation += 1
+    
+    def stats(self):
+        """Contadores para /models/status"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'ttl_seconds': self.ttl_seconds,
+                'max_rows': self.max_rows,
+                'bins': self.bins,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'generation': self.generation
+            }
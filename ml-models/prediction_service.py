@@ -5,112 +5,640 @@ Modelos entrenados con datos UK-DALE reales
 """
 
 import joblib
-import pandas as pd
 import numpy as np
 import json
-from datetime import datetime, timedelta
+from datetime import datetime
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import time
+import warnings
+
+from calendar_table import CALENDAR, CALENDAR_FEATURES
+from feature_schema import FeatureSchema
+from forest_compiler import compile_model
+from metrics import metrics
+from model_registry import ModelRegistry
+from prediction_cache import PredictionCache
+from process_memory import process_memory_mb
+
+# Los modelos se entrenaron con DataFrames; en la ruta vectorizada se les pasan
+# matrices NumPy con las columnas ya ordenadas, así que el aviso es irrelevante
+warnings.filterwarnings('ignore', message='X does not have valid feature names')
+
+# Electrodomésticos con modelo propio
+APPLIANCES = ('fridge', 'washing_machine', 'dishwasher', 'kettle',
+              'microwave', 'toaster', 'television', 'lighting')
+
+# Características del hogar que envía el cliente
+BASE_FEATURES = ('temperature', 'humidity', 'occupancy', 'house_size')
+
+def calendar_feature_matrix(start, hours):
+    """Calcula las características de calendario de ``hours`` horas consecutivas
+    a partir de ``start`` en una sola operación vectorizada.
+    
+    Devuelve un diccionario {característica: array de longitud ``hours``}.
+    """
+    return calendar_features_at(start, np.arange(hours))
+
+def calendar_features_at(start, offsets):
+    """Características de calendario de ``start`` + ``offsets`` horas (array),
+    leídas de la tabla precalculada que también usa el entrenador"""
+    return CALENDAR.at(start, offsets)
+
+class ModelSet:
+    """Modelos, scalers, metadatos y esquemas de una versión concreta.
+    
+    Nunca se modifica una vez construido: recargar crea un ModelSet nuevo y
+    lo activa sustituyendo una sola referencia, de modo que las predicciones
+    en curso terminan con la versión con la que empezaron.
+    """
+    
+    def __init__(self, version, models, scalers, model_info, schemas, engines=None, timings=None):
+        self.version = version
+        self.models = models
+        self.scalers = scalers
+        self.model_info = model_info
+        self.schemas = schemas
+        # Versiones compiladas (forest_compiler) de los ensembles de árboles
+        self.engines = engines or {}
+        # Duración (s) de cada fase de la carga de esta versión
+        self.timings = timings or {}
+        # Generación de la caché de predicciones al activarse: lo que calcula
+        # este ModelSet solo se guarda si la caché no se ha vaciado después
+        self.generation = 0
 
 class EnergiaPredictionService:
     def __init__(self):
-        self.models = {}
-        self.scalers = {}
-        self.model_info = {}
-        self.load_models()
-    
-    def load_models(self):
-        """Carga todos los modelos entrenados"""
-        # Determinar la ruta base del directorio de modelos
         script_dir = os.path.dirname(os.path.abspath(__file__))
-        model_dir = os.path.join(script_dir, 'models')
+        self.registry = ModelRegistry(os.getenv('MODEL_DIR', os.path.join(script_dir, 'models')))
+        self.active = ModelSet(None, {}, {}, {}, {})
+        self.cache = PredictionCache.from_env()
+        # Con MODEL_MMAP=true los arrays NumPy de los pickles se mapean en
+        # memoria de solo lectura y se comparten entre procesos
+        self.mmap_mode = 'r' if os.getenv('MODEL_MMAP', 'false').lower() == 'true' else None
+        self.compile_trees = os.getenv('COMPILED_TREES', 'true').lower() == 'true'
+        # Por encima de este número de filas el predict de sklearn (en C) gana
+        self.compiled_max_rows = int(os.getenv('COMPILED_TREES_MAX_ROWS', 256))
+        self.load_stats = {}
+        # Reentrante: reload_if_changed lee el manifiesto y carga sin soltarlo
+        self._reload_lock = threading.RLock()
+        self._watcher = None
+        # Presupuesto de hilos de inferencia del proceso (la predicción de
+        # árboles libera el GIL): por defecto los núcleos se reparten entre
+        # los workers de gunicorn en lugar de sobresuscribirlos
+        workers = int(os.getenv('GUNICORN_WORKERS', 1))
+        self.inference_threads = int(os.getenv(
+            'INFERENCE_THREADS', max(1, (os.cpu_count() or 1) // max(workers, 1))
+        ))
+        # INFERENCE_POLICY=adaptive: los modelos predicen en un solo hilo y
+        # solo los lotes de al menos PARALLEL_PREDICT_MIN_ROWS filas se
+        # reparten en el pool; 'sklearn' conserva el n_jobs guardado al entrenar
+        self.inference_policy = os.getenv('INFERENCE_POLICY', 'adaptive').lower()
+        self.parallel_min_rows = int(os.getenv('PARALLEL_PREDICT_MIN_ROWS', 2048))
+        self._threads_limited = False
+        self._executor = None
+        self._executor_pid = None
+        # MODEL_LOADING=background: la API arranca sin esperar a los modelos,
+        # que se cargan en un hilo (ensure_loading) mientras /ready responde 503
+        self.background_loading = os.getenv('MODEL_LOADING', 'eager').lower() == 'background'
+        self.warmup_enabled = os.getenv('MODEL_WARMUP', 'true').lower() == 'true'
+        self.loading_state = 'pending'
+        self._loader = None
+        self._loader_pid = None
+        self._loader_lock = threading.Lock()
+        if not self.background_loading:
+            self.load_models()
+    
+    @property
+    def models(self):
+        return self.active.models
+    
+    @property
+    def scalers(self):
+        return self.active.scalers
+    
+    @property
+    def model_info(self):
+        return self.active.model_info
+    
+    @property
+    def schemas(self):
+        return self.active.schemas
+    
+    @property
+    def version(self):
+        return self.active.version
+    
+    def read_model_set(self, model_dir, version):
+        """Lee del disco todos los modelos de una versión sin activarlos"""
+        started = time.perf_counter()
+        models = {}
+        scalers = {}
+        model_info = {}
         
-        try:
-            # Modelo agregado principal
-            aggregate_model_path = os.path.join(model_dir, 'aggregate_predictor.pkl')
-            if os.path.exists(aggregate_model_path):
-                self.models['aggregate'] = joblib.load(aggregate_model_path)
+        # Modelo agregado principal
+        aggregate_model_path = os.path.join(model_dir, 'aggregate_predictor.pkl')
+        if os.path.exists(aggregate_model_path):
+            models['aggregate'] = joblib.load(aggregate_model_path, mmap_mode=self.mmap_mode)
+            
+            aggregate_scaler_path = os.path.join(model_dir, 'aggregate_scaler.pkl')
+            if os.path.exists(aggregate_scaler_path):
+                scalers['aggregate'] = joblib.load(aggregate_scaler_path, mmap_mode=self.mmap_mode)
+            
+            aggregate_info_path = os.path.join(model_dir, 'aggregate_model_info.json')
+            if os.path.exists(aggregate_info_path):
+                with open(aggregate_info_path, 'r') as f:
+                    model_info['aggregate'] = json.load(f)
+        
+        # Modelos de electrodomésticos
+        for appliance in APPLIANCES:
+            model_path = os.path.join(model_dir, f'{appliance}_predictor.pkl')
+            if os.path.exists(model_path):
+                models[appliance] = joblib.load(model_path, mmap_mode=self.mmap_mode)
                 
-                aggregate_scaler_path = os.path.join(model_dir, 'aggregate_scaler.pkl')
-                if os.path.exists(aggregate_scaler_path):
-                    self.scalers['aggregate'] = joblib.load(aggregate_scaler_path)
+                info_path = os.path.join(model_dir, f'{appliance}_model_info.json')
+                if os.path.exists(info_path):
+                    with open(info_path, 'r') as f:
+                        model_info[appliance] = json.load(f)
+        
+        # Compilar una vez el esquema de características de cada modelo
+        schemas = {
+            target: FeatureSchema.for_model(
+                model,
+                model_info.get(target, {}).get('feature_columns'),
+                default_columns=BASE_FEATURES + CALENDAR_FEATURES
+            )
+            for target, model in models.items()
+        }
+        
+        if self.inference_policy == 'adaptive':
+            self.limit_model_threads(models)
+        
+        unpickled = time.perf_counter()
+        
+        engines = self.compile_engines(models) if self.compile_trees else {}
+        timings = {
+            'unpickle_seconds': round(unpickled - started, 3),
+            'compile_seconds': round(time.perf_counter() - unpickled, 3),
+        }
+        return ModelSet(version, models, scalers, model_info, schemas, engines, timings)
+    
+    def limit_model_threads(self, models):
+        """Fija ``n_jobs=1`` en los modelos y limita BLAS/OpenMP a un hilo.
+        
+        Los RandomForest se entrenan con ``n_jobs=-1``: sin esto cada
+        ``predict`` de una fila lanzaría hilos de joblib en todos los núcleos
+        desde cada worker. El paralelismo lo gestiona ``predict_matrix``.
+        """
+        for model in models.values():
+            if hasattr(model, 'n_jobs'):
+                model.n_jobs = 1
+        
+        if not self._threads_limited:
+            try:
+                from threadpoolctl import threadpool_limits
+                threadpool_limits(limits=1)
+            except ImportError:
+                pass
+            self._threads_limited = True
+    
+    def warm_up(self, model_set):
+        """Predicción sintética con cada modelo antes de activarlo.
+        
+        La primera llamada a ``predict`` de scikit-learn (validación, hilos
+        de joblib, cachés de NumPy) es mucho más lenta que las siguientes;
+        así la paga la carga y no la primera petición. No registra métricas.
+        """
+        for target, model in model_set.models.items():
+            X = model_set.schemas[target].matrix(8)
+            if target in model_set.scalers:
+                X = model_set.scalers[target].transform(X)
+            model.predict(X)
+            engine = model_set.engines.get(target)
+            if engine is not None:
+                engine.predict(X)
+    
+    def compile_engines(self, models):
+        """Compila los ensembles de árboles y verifica que predicen lo mismo"""
+        engines = {}
+        for target, model in models.items():
+            engine = compile_model(model)
+            if engine is None:
+                continue
+            
+            if engine.matches(model):
+                engines[target] = engine
+            else:
+                print(f"⚠️ El modelo compilado de {target} no coincide con el original; se usa predict")
+        
+        if engines:
+            print(f"🌲 Árboles compilados: {list(engines.keys())}")
+        return engines
+    
+    def load_models(self, version=None, on_loaded=None):
+        """Carga la versión indicada (o la activa del registro) y la activa.
+        
+        La lectura se hace fuera del camino de las peticiones; si falla, se
+        conservan los modelos que estuvieran activos. ``on_loaded`` (p. ej.
+        actualizar el manifiesto) se llama solo si la carga fue bien, antes
+        del intercambio y sin soltar el lock de recarga. Devuelve True si se
+        activó la nueva versión.
+        """
+        started = time.perf_counter()
+        model_dir = self.registry.root
+        
+        with self._reload_lock:
+            try:
+                model_dir, version = self.registry.resolve(version)
+                model_set = self.read_model_set(model_dir, version)
+                if not model_set.models:
+                    raise FileNotFoundError(f"La versión {version} no contiene modelos")
+                
+                if self.warmup_enabled:
+                    warmup_started = time.perf_counter()
+                    self.warm_up(model_set)
+                    model_set.timings['warmup_seconds'] = round(time.perf_counter() - warmup_started, 3)
                 
-                aggregate_info_path = os.path.join(model_dir, 'aggregate_model_info.json')
-                if os.path.exists(aggregate_info_path):
-                    with open(aggregate_info_path, 'r') as f:
-                        self.model_info['aggregate'] = json.load(f)
+            except Exception as e:
+                print(f"❌ Error cargando modelos: {e}")
+                print(f"📁 Directorio de modelos: {model_dir}")
+                print(f"📂 Archivos en directorio: {os.listdir(model_dir) if os.path.exists(model_dir) else 'No existe'}")
+                return False
             
-            # Modelos de electrodomésticos
-            appliances = ['fridge', 'washing_machine', 'dishwasher', 'kettle', 
-                         'microwave', 'toaster', 'television', 'lighting']
+            if on_loaded is not None:
+                on_loaded()
             
-            for appliance in appliances:
-                model_path = os.path.join(model_dir, f'{appliance}_predictor.pkl')
-                if os.path.exists(model_path):
-                    self.models[appliance] = joblib.load(model_path)
+            # Las predicciones en caché pertenecen a los modelos anteriores; se
+            # vacía antes del intercambio, así que lo que calculen los modelos
+            # anteriores a partir de aquí lleva su generación y se descarta
+            if self.cache is not None:
+                self.cache.clear()
+                model_set.generation = self.cache.generation
             
-            print(f"✅ Modelos cargados: {list(self.models.keys())}")
+            # Intercambio atómico: una única asignación de referencia
+            self.active = model_set
+        
+        self.load_stats = {
+            'version': version,
+            'load_seconds': round(time.perf_counter() - started, 3),
+            'phases': model_set.timings,
+            'mmap_mode': self.mmap_mode,
+            'inference': {
+                'policy': self.inference_policy,
+                'threads': self.inference_threads,
+                'parallel_min_rows': self.parallel_min_rows,
+            },
+            'pid': os.getpid(),
+            'loaded_at': datetime.now().isoformat(),
+            **process_memory_mb()
+        }
+        
+        print(f"✅ Modelos cargados (versión {version}): {list(model_set.models.keys())}")
+        print(f"⏱️ Carga en {self.load_stats['load_seconds']}s {model_set.timings} "
+              f"(mmap={self.mmap_mode}), RSS {self.load_stats['rss_mb']} MB")
+        return True
+    
+    def is_ready(self):
+        """Hay una versión de modelos cargada y lista para predecir"""
+        return bool(self.active.models)
+    
+    def ensure_loading(self):
+        """Arranca (una vez por proceso) la carga de modelos en segundo plano.
+        
+        Solo actúa con MODEL_LOADING=background; se llama en cada worker tras
+        el fork y antes de cada petición, así que debe ser barata.
+        """
+        if not self.background_loading or self._loader_pid == os.getpid():
+            return self._loader
+        
+        def load():
+            self.loading_state = 'loading'
+            self.loading_state = 'ready' if self.load_models() else 'failed'
+        
+        with self._loader_lock:
+            if self._loader_pid != os.getpid():
+                self._loader_pid = os.getpid()
+                self._loader = threading.Thread(target=load, name='model-loader', daemon=True)
+                self._loader.start()
+        return self._loader
+    
+    def get_loading_state(self):
+        """'pending', 'loading', 'ready' o 'failed' (carga en segundo plano)"""
+        if not self.background_loading:
+            return 'ready' if self.is_ready() else 'failed'
+        return self.loading_state
+    
+    def reload_if_changed(self):
+        """Recarga si la versión activa del registro ya no es la servida"""
+        if self.loading_state == 'loading':
+            return False
+        
+        # Con el lock, una activación en curso en este proceso termina (carga
+        # y manifiesto) antes de leer el manifiesto
+        with self._reload_lock:
+            try:
+                current = self.registry.current_version()
+            except (OSError, ValueError) as e:
+                print(f"⚠️ No se pudo leer el manifiesto de modelos: {e}")
+                return False
             
-        except Exception as e:
-            print(f"❌ Error cargando modelos: {e}")
-            print(f"📁 Directorio de modelos: {model_dir}")
-            print(f"📂 Archivos en directorio: {os.listdir(model_dir) if os.path.exists(model_dir) else 'No existe'}")
+            if current == self.active.version:
+                return False
+            return self.load_models(current)
+    
+    def activate(self, version):
+        """Carga ``version`` y, solo si la carga va bien, la activa en el registro"""
+        # Una versión inexistente es un error del llamador (ValueError), no de carga
+        self.registry.version_dir(version)
+        return self.load_models(version, on_loaded=lambda: self.registry.activate(version))
+    
+    def rollback(self):
+        """Carga la versión anterior y, solo si la carga va bien, vuelve a ella en el registro"""
+        with self._reload_lock:
+            version = self.registry.previous_version()
+            return self.load_models(version, on_loaded=lambda: self.registry.rollback(expected=version))
+    
+    def start_watcher(self, interval):
+        """Hilo en segundo plano que vigila el manifiesto cada ``interval`` s.
+        
+        Se arranca en cada proceso que sirve peticiones (los hilos no
+        sobreviven al fork de los workers de gunicorn).
+        """
+        if self._watcher is not None and self._watcher.is_alive():
+            return self._watcher
+        
+        def watch():
+            while True:
+                time.sleep(interval)
+                self.reload_if_changed()
+        
+        self._watcher = threading.Thread(target=watch, name='model-watcher', daemon=True)
+        self._watcher.start()
+        return self._watcher
     
     def predict_consumption(self, features_dict, target='aggregate', hours_ahead=24):
-        """Predice consumo energético"""
-        if target not in self.models:
+        """Predice consumo energético para una fila de características.
+        
+        ``hours_ahead`` se mantiene por compatibilidad; para varias horas usar
+        ``predict_horizon``. La caché (si está activa) la aplica ``predict_matrix``.
+        """
+        model_set = self.active
+        if target not in model_set.models:
             raise ValueError(f"Modelo {target} no disponible")
         
-        # Preparar características
-        df_input = pd.DataFrame([features_dict])
-        
-        # Características temporales básicas
-        now = datetime.now()
-        for i in range(hours_ahead):
-            future_time = now + timedelta(hours=i)
-            hour_features = {
-                'hour': future_time.hour,
-                'day_of_week': future_time.weekday(),
-                'month': future_time.month,
-                'is_weekend': 1 if future_time.weekday() >= 5 else 0,
-                'hour_sin': np.sin(2 * np.pi * future_time.hour / 24),
-                'hour_cos': np.cos(2 * np.pi * future_time.hour / 24),
-                'day_sin': np.sin(2 * np.pi * future_time.weekday() / 7),
-                'day_cos': np.cos(2 * np.pi * future_time.weekday() / 7),
-            }
-            
-            # Combinar con características base
-            prediction_features = {**features_dict, **hour_features}
-            
-            # Completar características faltantes con valores por defecto
-            if target == 'aggregate' and 'aggregate' in self.model_info:
-                required_features = self.model_info['aggregate']['feature_columns']
-                for feature in required_features:
-                    if feature not in prediction_features:
-                        prediction_features[feature] = 0
+        with metrics.timer('ml_inference_stage_duration_seconds', target=target, stage='features'):
+            X = model_set.schemas[target].row(features_dict)
+        return float(self.predict_matrix(X, target, model_set)[0])
+    
+    def feature_columns(self, target):
+        """Columnas (en orden de entrenamiento) que espera el modelo ``target``"""
+        return list(self.schemas[target].columns)
+    
+    def horizon_matrix(self, base_features, target, start, hours, model_set=None):
+        """Matriz (hours x columnas) con las características del hogar y del
+        calendario para ``hours`` horas consecutivas desde ``start``."""
+        schema = (model_set or self.active).schemas[target]
+        
+        with metrics.timer('ml_inference_stage_duration_seconds', target=target, stage='features'):
+            # Las columnas que no aportan ni el hogar ni el calendario quedan a 0
+            X = schema.matrix(hours)
+            schema.fill(X, base_features)
+            schema.fill(X, calendar_feature_matrix(start, hours))
+        return X
+    
+    def predict_matrix(self, X, target='aggregate', model_set=None):
+        """Aplica el scaler (si existe) y el modelo ``target`` a una matriz ya
+        ordenada según ``feature_columns(target)``. Una única llamada a predict.
+        
+        Con la caché activa las filas se cuantizan (como las claves) y se
+        buscan en ella; solo las que faltan llegan al modelo.
+        """
+        model_set = model_set or self.active
+        cache = self.cache
+        if cache is None or not 0 < len(X) <= cache.max_rows:
+            return self.model_predict(X, target, model_set)[0]
         
-        model = self.models[target]
+        # Se predice sobre las filas cuantizadas para que el valor almacenado
+        # sea el mismo sin importar qué petición lo calculó
+        schema = model_set.schemas[target]
+        X = schema.derive(cache.quantize_matrix(X, schema.columns))
+        keys = cache.row_keys(target, X)
+        cached = cache.get_many(keys)
+        missing = [i for i, value in enumerate(cached) if value is None]
+        predictions = np.array([0.0 if value is None else value for value in cached])
         
-        # Hacer predicción
+        if missing:
+            computed, ok = self.model_predict(X[missing], target, model_set)
+            predictions[missing] = computed
+            if ok:
+                cache.put_many([keys[i] for i in missing], computed.tolist(), model_set.generation)
+        return predictions
+    
+    def model_predict(self, X, target, model_set):
+        """Scaler + modelo sobre ``X``, sin caché. Devuelve (predicciones, ok):
+        si el modelo falla, ceros y ok=False (no deben guardarse en la caché)"""
         try:
-            # Preparar datos para predicción
-            feature_df = pd.DataFrame([prediction_features])
+            if target in model_set.scalers:
+                with metrics.timer('ml_inference_stage_duration_seconds', target=target, stage='scale'):
+                    X = model_set.scalers[target].transform(X)
             
-            # Aplicar scaler si existe
-            if target in self.scalers:
-                feature_values = self.scalers[target].transform(feature_df)
-                prediction = model.predict(feature_values)[0]
+            engine = model_set.engines.get(target)
+            if engine is not None and len(X) <= self.compiled_max_rows:
+                engine_name, predict = 'compiled', engine.predict
+            elif self.parallel_chunks(len(X)) > 1:
+                engine_name, predict = 'sklearn_parallel', self.parallel_predict(model_set.models[target])
             else:
-                prediction = model.predict(feature_df)[0]
+                engine_name, predict = 'sklearn', model_set.models[target].predict
             
-            return max(0, float(prediction))  # No valores negativos
+            with metrics.timer('ml_inference_stage_duration_seconds', target=target, stage='predict'):
+                predictions = predict(X)
+            metrics.inc('ml_model_calls_total', target=target, engine=engine_name)
+            metrics.observe('ml_model_batch_rows', len(X), target=target)
+            return np.maximum(predictions, 0), True  # No valores negativos
             
         except Exception as e:
             print(f"Error en predicción: {e}")
-            return 0.0
+            return np.zeros(len(X)), False
+    
+    def parallel_chunks(self, rows):
+        """Número de bloques en que repartir un lote de ``rows`` filas.
+        
+        Los lotes pequeños se predicen en el hilo de la petición: repartirlos
+        cuesta más que lo que se gana. Dentro del pool (p. ej. desde
+        ``predict_targets``) tampoco se reparte, para no esperar a hilos del
+        mismo pool.
+        """
+        if (self.inference_policy != 'adaptive' or self.inference_threads < 2
+                or rows < self.parallel_min_rows
+                or threading.current_thread().name.startswith('inference')):
+            return 1
+        return min(self.inference_threads, rows // (self.parallel_min_rows // 2 or 1))
+    
+    def parallel_predict(self, model):
+        """``predict`` que reparte las filas entre los hilos del pool"""
+        def predict(X):
+            chunks = np.array_split(X, self.parallel_chunks(len(X)))
+            return np.concatenate(list(self.executor().map(model.predict, chunks)))
+        return predict
+    
+    def predict_horizon(self, base_features, target='aggregate', start=None, hours=24):
+        """Predice el consumo de ``hours`` horas consecutivas desde ``start``.
+        
+        Construye la matriz completa de características (base del hogar +
+        calendario) de una vez y realiza una única llamada a ``model.predict``.
+        Devuelve un array NumPy con una predicción (W) por hora.
+        
+        Con la caché activa el horizonte completo se guarda bajo modelo +
+        hogar cuantizado + hora de inicio + horas (array de solo lectura).
+        """
+        if hours < 1:
+            raise ValueError("hours debe ser al menos 1")
+        model_set = self.active
+        if target not in model_set.models:
+            raise ValueError(f"Modelo {target} no disponible")
+        start = start or datetime.now()
+        
+        if self.cache is None:
+            X = self.horizon_matrix(base_features, target, start, hours, model_set)
+            return self.model_predict(X, target, model_set)[0]
+        
+        base_features = self.cache.quantize(base_features)
+        key = self.cache.horizon_key(target, base_features, start, hours)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        
+        X = self.horizon_matrix(base_features, target, start, hours, model_set)
+        predictions, ok = self.model_predict(X, target, model_set)
+        if ok:
+            predictions.setflags(write=False)
+            self.cache.put(key, predictions, model_set.generation)
+        return predictions
+    
+    def predict_batch(self, jobs, start=None):
+        """Predice muchos trabajos {target, features, hours_ahead} a la vez.
+        
+        Agrupa los trabajos por modelo, apila sus matrices de características
+        y hace una sola llamada a ``predict`` por modelo. Devuelve una lista,
+        en el orden de ``jobs``, con el array de predicciones de cada trabajo.
+        """
+        names = sorted({name for job in jobs for name in job['features']})
+        features = {
+            name: np.array([job['features'].get(name, 0.0) for job in jobs], dtype=np.float64)
+            for name in names
+        }
+        return self.predict_batch_columns(
+            [job['target'] for job in jobs],
+            features,
+            [job['hours_ahead'] for job in jobs],
+            start
+        )
+    
+    def predict_batch_columns(self, targets, features, hours_ahead, start=None):
+        """Versión columnar de ``predict_batch``.
+        
+        ``targets`` y ``hours_ahead`` tienen un elemento por trabajo y
+        ``features`` es {característica: array por trabajo}. Las filas de
+        cada modelo se construyen con operaciones NumPy sobre las columnas,
+        sin recorrer los trabajos en Python.
+        """
+        start = start or datetime.now()
+        model_set = self.active
+        targets = np.asarray(targets)
+        hours_ahead = np.asarray(hours_ahead, dtype=np.int64)
+        if hours_ahead.size and hours_ahead.min() < 1:
+            raise ValueError("hours_ahead debe ser al menos 1")
+        features = {name: np.asarray(values) for name, values in features.items()}
+        results = [None] * len(targets)
+        
+        for target in np.unique(targets).tolist():
+            if target not in model_set.models:
+                raise ValueError(f"Modelo {target} no disponible")
+            
+            jobs = np.flatnonzero(targets == target)
+            hours = hours_ahead[jobs]
+            ends = np.cumsum(hours)
+            
+            # Trabajo y hora dentro del horizonte de cada fila de la matriz
+            rows = np.repeat(jobs, hours)
+            offsets = np.arange(ends[-1] if len(ends) else 0) - np.repeat(ends - hours, hours)
+            
+            schema = model_set.schemas[target]
+            with metrics.timer('ml_inference_stage_duration_seconds', target=target, stage='features'):
+                X = schema.matrix(len(rows))
+                schema.fill(X, {name: values[rows] for name, values in features.items()})
+                schema.fill(X, calendar_features_at(start, offsets))
+            predictions = self.predict_matrix(X, target, model_set)
+            
+            # Repartir las filas de vuelta a cada trabajo
+            for job, block in zip(jobs.tolist(), np.split(predictions, ends[:-1])):
+                results[job] = block
+        
+        return results
+    
+    def predict_scenarios(self, base_features, setpoints, occupancies, offsets,
+                          target='aggregate', start=None):
+        """Predice una rejilla consigna x ocupación x hora en una sola llamada.
+        
+        Cada fila de la matriz es un escenario: las características del hogar
+        con la temperatura y ocupación candidatas y el calendario de la hora
+        ``start`` + offset. Devuelve un array (consignas, ocupaciones, horas).
+        """
+        model_set = self.active
+        if target not in model_set.models:
+            raise ValueError(f"Modelo {target} no disponible")
+        
+        S, O, H = np.meshgrid(setpoints, occupancies, offsets, indexing='ij')
+        schema = model_set.schemas[target]
+        with metrics.timer('ml_inference_stage_duration_seconds', target=target, stage='features'):
+            X = schema.matrix(S.size)
+            schema.fill(X, base_features)
+            schema.fill(X, {'temperature': S.ravel(), 'occupancy': O.ravel()})
+            schema.fill(X, calendar_features_at(start or datetime.now(), H.ravel()))
+        
+        return self.predict_matrix(X, target, model_set).reshape(S.shape)
+    
+    def executor(self):
+        """Pool de hilos del proceso actual (se recrea tras un fork)"""
+        if self._executor is None or self._executor_pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=self.inference_threads,
+                                                thread_name_prefix='inference')
+            self._executor_pid = os.getpid()
+        return self._executor
+    
+    def predict_targets(self, features_dict, targets=None):
+        """Predice la misma fila de características con varios modelos.
+        
+        Los modelos se evalúan en paralelo en el pool de hilos. Devuelve
+        {target: {'predicted_consumption', 'elapsed_ms'}} para los modelos
+        disponibles de ``targets`` (por defecto, todos).
+        """
+        model_set = self.active
+        targets = [t for t in (targets or model_set.models) if t in model_set.models]
+        
+        def run(target):
+            started = time.perf_counter()
+            X = model_set.schemas[target].row(features_dict)
+            prediction = float(self.predict_matrix(X, target, model_set)[0])
+            return {
+                'predicted_consumption': prediction,
+                'elapsed_ms': round((time.perf_counter() - started) * 1000, 3)
+            }
+        
+        return dict(zip(targets, self.executor().map(run, targets)))
     
     def get_model_metrics(self):
         """Retorna métricas de los modelos"""
         return {name: info.get('metrics', {}) for name, info in self.model_info.items()}
+    
+    def get_load_stats(self):
+        """Tiempo de carga y memoria del proceso que cargó los modelos"""
+        return self.load_stats
+    
+    def get_cache_stats(self):
+        """Contadores de la caché de predicciones (None si está desactivada)"""
+        return self.cache.stats() if self.cache is not None else None
 
 # Instancia global
 prediction_service = EnergiaPredictionService()
@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+"""
+Memoria del proceso actual para los registros de arranque de EnergiApp
+"""
+
+import resource
+
+
+def process_memory_mb():
+    """Memoria residente (RSS) y privada del proceso en MB.
+    
+    La memoria privada excluye las páginas compartidas con otros procesos
+    (modelos precargados en el maestro de gunicorn o mapeados con mmap), que
+    es lo que realmente cuesta cada worker adicional. Fuera de Linux solo se
+    dispone del pico de RSS.
+    """
+    try:
+        values = {}
+        with open('/proc/self/smaps_rollup', 'r') as f:
+            for line in f:
+                name, _, rest = line.partition(':')
+                if name in ('Rss', 'Private_Clean', 'Private_Dirty'):
+                    values[name] = int(rest.split()[0])  # kB
+        return {
+            'rss_mb': round(values['Rss'] / 1024, 1),
+            'private_mb': round((values['Private_Clean'] + values['Private_Dirty']) / 1024, 1)
+        }
+    except (OSError, KeyError, ValueError):
+        # ru_maxrss está en kB en Linux y en bytes en macOS; aquí solo Linux
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return {'rss_mb': round(peak / 1024, 1), 'private_mb': None}
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Almacén de agregados multirresolución del consumo histórico de EnergiApp
+
+Guarda en SQLite, por hogar, agregados por minuto, hora y día (número de
+muestras, suma, suma de cuadrados, mínimo y máximo). Se actualizan de forma
+incremental en cada ingesta y los análisis se responden desde el nivel más
+grueso que cubre el rango pedido, así que su coste depende del rango y no
+del número de muestras originales.
+"""
+
+import os
+import sqlite3
+import threading
+
+import numpy as np
+
+# (nivel, segundos por cubeta), del más fino al más grueso
+TIERS = (('minute', 60), ('hour', 3600), ('day', 86400))
+TIER_SECONDS = dict(TIERS)
+
+
+class RollupStore:
+    """Agregados de consumo por hogar y nivel temporal en un fichero SQLite"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._create_tables()
+
+    def _connection(self):
+        # Una conexión por hilo y proceso (las conexiones no sobreviven a un fork)
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def _create_tables(self):
+        connection = self._connection()
+        with connection:
+            for tier, _ in TIERS:
+                connection.execute(f'''
+                    CREATE TABLE IF NOT EXISTS rollup_{tier} (
+                        household_id TEXT NOT NULL,
+                        bucket_start INTEGER NOT NULL,
+                        count INTEGER NOT NULL,
+                        sum REAL NOT NULL,
+                        sumsq REAL NOT NULL,
+                        min REAL NOT NULL,
+                        max REAL NOT NULL,
+                        PRIMARY KEY (household_id, bucket_start)
+                    ) WITHOUT ROWID
+                ''')
+
+    def ingest(self, household_id, epoch_seconds, values):
+        """Incorpora muestras (timestamps epoch en s, consumo en W) a todos los niveles.
+
+        Cada bloque se agrega primero con NumPy y luego se fusiona con las
+        cubetas existentes (las muestras pueden llegar en cualquier orden).
+        Devuelve el número de muestras ingeridas.
+        """
+        epoch_seconds = np.asarray(epoch_seconds, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float64)
+        if len(values) == 0:
+            return 0
+
+        order = np.argsort(epoch_seconds, kind='stable')
+        epoch_seconds = epoch_seconds[order]
+        values = values[order]
+        squares = values * values
+
+        connection = self._connection()
+        with connection:
+            for tier, seconds in TIERS:
+                buckets = epoch_seconds - epoch_seconds % seconds
+                starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+                counts = np.diff(np.r_[starts, len(buckets)])
+
+                rows = zip(
+                    [str(household_id)] * len(starts),
+                    buckets[starts].tolist(),
+                    counts.tolist(),
+                    np.add.reduceat(values, starts).tolist(),
+                    np.add.reduceat(squares, starts).tolist(),
+                    np.minimum.reduceat(values, starts).tolist(),
+                    np.maximum.reduceat(values, starts).tolist()
+                )
+                connection.executemany(f'''
+                    INSERT INTO rollup_{tier} (household_id, bucket_start, count, sum, sumsq, min, max)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (household_id, bucket_start) DO UPDATE SET
+                        count = count + excluded.count,
+                        sum = sum + excluded.sum,
+                        sumsq = sumsq + excluded.sumsq,
+                        min = MIN(min, excluded.min),
+                        max = MAX(max, excluded.max)
+                ''', rows)
+
+        return len(values)
+
+    @staticmethod
+    def choose_tier(start, end, need_hourly=True):
+        """Nivel más grueso cuyas cubetas encajan exactamente en [start, end).
+
+        Con ``need_hourly`` no se pasa del nivel horario (el diario no
+        permite reconstruir el patrón por hora del día).
+        """
+        for tier, seconds in reversed(TIERS):
+            if need_hourly and seconds > TIER_SECONDS['hour']:
+                continue
+            if start % seconds == 0 and end % seconds == 0:
+                return tier
+        return 'minute'
+
+    def analyze(self, household_id, start, end, need_hourly=True):
+        """Análisis de [start, end) (epoch en s) con la forma de /analyze/consumption.
+
+        Los picos se detectan por cubeta: una hora del día aparece en
+        ``peak_hours`` si alguna de sus cubetas tiene un máximo por encima de
+        media + 2·desviación.
+        """
+        tier = self.choose_tier(start, end, need_hourly)
+        seconds = TIER_SECONDS[tier]
+        # Rango alineado a las cubetas del nivel elegido (solo afecta al nivel minuto)
+        start -= start % seconds
+        end += -end % seconds
+
+        connection = self._connection()
+        count, total, sumsq, minimum, maximum, buckets = connection.execute(f'''
+            SELECT SUM(count), SUM(sum), SUM(sumsq), MIN(min), MAX(max), COUNT(*)
+            FROM rollup_{tier}
+            WHERE household_id = ? AND bucket_start >= ? AND bucket_start < ?
+        ''', (str(household_id), start, end)).fetchone()
+
+        if not count:
+            return None
+
+        mean = total / count
+        variance = max(sumsq - count * mean * mean, 0.0) / (count - 1) if count > 1 else float('nan')
+        std = float(np.sqrt(variance))
+        analysis = {
+            'total_consumption': float(total),
+            'average_consumption': float(mean),
+            'max_consumption': float(maximum),
+            'min_consumption': float(minimum),
+            'std_consumption': std,
+        }
+
+        if need_hourly:
+            threshold = mean + 2 * std
+            hourly = connection.execute(f'''
+                SELECT (bucket_start / 3600) % 24 AS hour, SUM(sum) / SUM(count),
+                       SUM(CASE WHEN max > ? THEN 1 ELSE 0 END)
+                FROM rollup_{tier}
+                WHERE household_id = ? AND bucket_start >= ? AND bucket_start < ?
+                GROUP BY hour ORDER BY hour
+            ''', (threshold, str(household_id), start, end)).fetchall()
+
+            analysis['hourly_patterns'] = {str(hour): float(avg) for hour, avg, _ in hourly}
+            analysis['peak_hours'] = [hour for hour, _, peaks in hourly if peaks]
+            analysis['num_peak_buckets'] = sum(peaks for _, _, peaks in hourly)
+
+        return {
+            'analysis': analysis,
+            'analyzed_samples': int(count),
+            'resolution': tier,
+            'buckets_scanned': int(buckets),
+            'start': start,
+            'end': end
+        }
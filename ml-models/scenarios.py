@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Barrido de escenarios para las recomendaciones de EnergiApp
+Define la rejilla de ajustes candidatos (consigna del termostato, ocupación
+y hora a la que se desplaza el consumo) y resume las predicciones de toda la
+rejilla, que el servicio obtiene con una única llamada a ``predict``
+"""
+
+import numpy as np
+
+# Consignas de termostato (°C) evaluadas por defecto
+DEFAULT_SETPOINTS = tuple(np.arange(16.0, 24.5, 1.0))
+
+# Horas hacia delante a las que se puede desplazar el consumo
+DEFAULT_SHIFT_HOURS = 24
+
+# Tamaño máximo de la rejilla (filas de la matriz de características)
+MAX_SCENARIOS = 20000
+
+# Eje de la rejilla -> característica del modelo que modifica
+AXIS_FEATURES = {'setpoint': 'temperature', 'occupancy': 'occupancy'}
+
+
+def scenario_axes(options, temperature, occupancy, model_features=None):
+    """Ejes (consignas, ocupaciones, horas) de la rejilla de escenarios y los
+    ejes ignorados.
+
+    ``options`` son los parámetros 'scenarios' de la petición. Los valores
+    actuales del hogar siempre forman parte de la rejilla para poder medir
+    el ahorro frente a ellos. Un eje cuya característica no está entre las
+    del modelo (``model_features``) no cambiaría la predicción: se reduce al
+    valor actual y se devuelve en la lista de ejes ignorados.
+    """
+    options = options or {}
+    setpoints = options.get('setpoints', DEFAULT_SETPOINTS)
+    # Por defecto: de una persona a la ocupación actual (menos gente en casa)
+    occupancies = options.get('occupancy', range(1, max(int(occupancy), 1) + 1))
+    shift_hours = int(options.get('shift_hours', DEFAULT_SHIFT_HOURS))
+
+    ignored = []
+    if model_features is not None:
+        ignored = [axis for axis, feature in AXIS_FEATURES.items() if feature not in model_features]
+    if 'setpoint' in ignored:
+        setpoints = []
+    if 'occupancy' in ignored:
+        occupancies = []
+
+    setpoints = np.union1d(np.asarray(setpoints, dtype=np.float64), [temperature])
+    occupancies = np.union1d(np.asarray(occupancies, dtype=np.float64), [occupancy])
+    if not 1 <= shift_hours <= 168:
+        raise ValueError("shift_hours debe estar entre 1 y 168")
+
+    size = len(setpoints) * len(occupancies) * shift_hours
+    if size > MAX_SCENARIOS:
+        raise ValueError(f"La rejilla tiene {size} escenarios (máximo {MAX_SCENARIOS})")
+    return setpoints, occupancies, np.arange(shift_hours), ignored
+
+
+def summarize_scenarios(predictions, setpoints, occupancies, offsets, start,
+                        temperature, occupancy, top=5, ignored_axes=()):
+    """Curvas de ahorro y mejores escenarios de una rejilla ya predicha.
+
+    ``predictions`` tiene forma (consignas, ocupaciones, horas). El escenario
+    de referencia es el actual: consigna y ocupación del hogar, hora 0. Los
+    ejes de ``ignored_axes`` (ver ``scenario_axes``) no tienen curva.
+    """
+    s0 = int(np.searchsorted(setpoints, temperature))
+    o0 = int(np.searchsorted(occupancies, occupancy))
+    baseline = float(predictions[s0, o0, 0])
+    savings = baseline - predictions
+    clock_hours = (start.hour + offsets) % 24
+
+    def curve(axis_name, axis_values, predicted):
+        return [
+            {axis_name: float(value), 'predicted_consumption': float(p), 'savings': float(baseline - p)}
+            for value, p in zip(axis_values, predicted)
+        ]
+
+    load_shift = curve('hours_ahead', offsets, predictions[s0, o0, :])
+    for point, hour in zip(load_shift, clock_hours):
+        point['hours_ahead'] = int(point['hours_ahead'])
+        point['hour'] = int(hour)
+
+    # Mejores escenarios de toda la rejilla (selección parcial, sin ordenar todo)
+    flat = savings.ravel()
+    top = min(top, flat.size)
+    best = np.argpartition(-flat, top - 1)[:top]
+    best = best[np.argsort(-flat[best])]
+    s, o, h = np.unravel_index(best, savings.shape)
+
+    best_scenarios = [
+        {
+            'temperature': float(setpoints[i]),
+            'occupancy': float(occupancies[j]),
+            'hours_ahead': int(offsets[k]),
+            'hour': int(clock_hours[k]),
+            'predicted_consumption': float(predictions[i, j, k]),
+            'savings': float(savings[i, j, k]),
+            'savings_pct': float(100 * savings[i, j, k] / baseline) if baseline > 0 else 0.0,
+        }
+        for i, j, k in zip(s, o, h)
+    ]
+
+    curves = {
+        'setpoint': curve('temperature', setpoints, predictions[:, o0, 0]),
+        'occupancy': curve('occupancy', occupancies, predictions[s0, :, 0]),
+        'load_shift': load_shift,
+    }
+
+    return {
+        'baseline': {
+            'temperature': float(temperature),
+            'occupancy': float(occupancy),
+            'hour': int(start.hour),
+            'predicted_consumption': baseline,
+        },
+        'savings_curves': {axis: points for axis, points in curves.items() if axis not in ignored_axes},
+        'ignored_axes': list(ignored_axes),
+        'best_scenarios': best_scenarios,
+        'evaluated_scenarios': int(predictions.size),
+    }
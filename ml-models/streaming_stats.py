@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Estadísticas incrementales de consumo para EnergiApp
+Procesa series de cualquier longitud por bloques con memoria constante:
+media y varianza (Welford/Chan), mínimo, máximo, acumuladores por hora y un
+histograma por hora para contar picos cuando el umbral ya es conocido
+"""
+
+import numpy as np
+
+# Límites del histograma de picos: escala logarítmica de 0.1 W a 1 MW
+# (resolución relativa < 1%); la primera cubeta recoge todo lo inferior
+PEAK_BIN_EDGES = np.geomspace(0.1, 1e6, 2047)
+PEAK_BINS = len(PEAK_BIN_EDGES) + 1
+
+
+class ConsumptionStats:
+    """Acumula bloques de consumo (W) y produce el mismo 'analysis' que
+    /analyze/consumption calcula con pandas sobre la serie completa"""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.total = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+        self.has_hours = False
+        self.hourly_count = np.zeros(24, dtype=np.int64)
+        self.hourly_sum = np.zeros(24, dtype=np.float64)
+        self.peak_histogram = np.zeros((24, PEAK_BINS), dtype=np.int64)
+
+    def update(self, values, hours=None):
+        """Incorpora un bloque de consumos y, opcionalmente, su hora del día"""
+        values = np.asarray(values, dtype=np.float64)
+        n = len(values)
+        if n == 0:
+            return
+
+        # Combinación de Chan de (n, media, M2) del bloque con la acumulada
+        chunk_mean = values.mean()
+        chunk_m2 = np.square(values - chunk_mean).sum()
+        combined = self.count + n
+        delta = chunk_mean - self.mean
+        self.mean += delta * n / combined
+        self.m2 += chunk_m2 + delta * delta * self.count * n / combined
+        self.count = combined
+
+        self.total += values.sum()
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+
+        if hours is not None:
+            hours = np.asarray(hours, dtype=np.int64)
+            self.has_hours = True
+            self.hourly_count += np.bincount(hours, minlength=24)
+            self.hourly_sum += np.bincount(hours, weights=values, minlength=24)
+
+            bins = np.searchsorted(PEAK_BIN_EDGES, values, side='right')
+            self.peak_histogram += np.bincount(
+                hours * PEAK_BINS + bins, minlength=24 * PEAK_BINS
+            ).reshape(24, PEAK_BINS)
+
+    @property
+    def std(self):
+        # Desviación muestral (ddof=1), como pandas
+        return float(np.sqrt(self.m2 / (self.count - 1))) if self.count > 1 else float('nan')
+
+    def peaks_by_hour(self, threshold):
+        """Muestras por hora por encima de ``threshold`` (estimación).
+
+        Las cubetas enteramente por encima del umbral se cuentan exactas; de
+        la cubeta que contiene el umbral se toma la fracción proporcional a la
+        parte de su ancho que lo supera (< 1% del rango de valores).
+        """
+        bin_index = np.searchsorted(PEAK_BIN_EDGES, threshold, side='right')
+        above = self.peak_histogram[:, bin_index + 1:].sum(axis=1).astype(np.float64)
+
+        if 0 < bin_index < len(PEAK_BIN_EDGES):
+            lower, upper = PEAK_BIN_EDGES[bin_index - 1], PEAK_BIN_EDGES[bin_index]
+            above += self.peak_histogram[:, bin_index] * (upper - threshold) / (upper - lower)
+        return np.rint(above).astype(np.int64)
+
+    def analysis(self):
+        """Diccionario con la forma de 'analysis' de /analyze/consumption"""
+        analysis = {
+            'total_consumption': float(self.total),
+            'average_consumption': float(self.mean) if self.count else float('nan'),
+            'max_consumption': float(self.max) if self.count else float('nan'),
+            'min_consumption': float(self.min) if self.count else float('nan'),
+            'std_consumption': self.std,
+        }
+
+        if self.has_hours:
+            observed = np.flatnonzero(self.hourly_count)
+            analysis['hourly_patterns'] = {
+                str(hour): float(self.hourly_sum[hour] / self.hourly_count[hour]) for hour in observed
+            }
+
+            threshold = analysis['average_consumption'] + 2 * analysis['std_consumption']
+            peaks = self.peaks_by_hour(threshold)
+            analysis['peak_hours'] = [int(hour) for hour in np.flatnonzero(peaks)]
+            analysis['peaks_by_hour'] = {str(hour): int(peaks[hour]) for hour in np.flatnonzero(peaks)}
+            analysis['num_peaks'] = int(peaks.sum())
+
+        return analysis
+
+
+def analyze_arrays(values, hours=None):
+    """Análisis exacto de una serie ya en memoria como arrays NumPy.
+
+    Produce el mismo 'analysis' que la ruta JSON de /analyze/consumption
+    (incluida la lista de horas de cada pico) sin construir un DataFrame.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    analysis = {
+        'total_consumption': float(values.sum()),
+        'average_consumption': float(values.mean()),
+        'max_consumption': float(values.max()),
+        'min_consumption': float(values.min()),
+        'std_consumption': float(values.std(ddof=1)) if len(values) > 1 else float('nan'),
+    }
+
+    if hours is not None:
+        hours = np.asarray(hours, dtype=np.int64)
+        counts = np.bincount(hours, minlength=24)
+        sums = np.bincount(hours, weights=values, minlength=24)
+        analysis['hourly_patterns'] = {
+            str(hour): float(sums[hour] / counts[hour]) for hour in np.flatnonzero(counts)
+        }
+
+        threshold = analysis['average_consumption'] + 2 * analysis['std_consumption']
+        peak_hours = hours[values > threshold]
+        analysis['peak_hours'] = peak_hours.tolist()
+        analysis['num_peaks'] = len(peak_hours)
+
+    return analysis
@@ -0,0 +1,48 @@
+"""Cuerpos binarios y en bloques mal formados: error 400, no 500"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from payloads import NPY_MIMETYPE, PayloadError, decode_columns, encode_npy
+
+
+def consumption_npy():
+    array = np.zeros(24, dtype=[('timestamp', '<M8[s]'), ('consumption', '<f4')])
+    array['timestamp'] = np.datetime64('2024-01-01T00:00:00') + np.arange(24)
+    array['consumption'] = np.arange(24)
+    return encode_npy(array)
+
+
+def test_decode_columns_roundtrip():
+    columns = decode_columns(consumption_npy(), NPY_MIMETYPE)
+    assert sorted(columns) == ['consumption', 'timestamp']
+    assert columns['consumption'][-1] == 23
+
+
+@pytest.mark.parametrize('body', [b'', b'\x93NUMPY', consumption_npy()[:-10]])
+def test_decode_columns_rejects_truncated_body(body):
+    with pytest.raises(PayloadError):
+        decode_columns(body, NPY_MIMETYPE)
+
+
+@pytest.fixture(scope='module')
+def client():
+    app = pytest.importorskip('app')
+    return app.app.test_client()
+
+
+def test_analyze_truncated_npy_is_bad_request(client):
+    response = client.post('/analyze/consumption', data=consumption_npy()[:-10],
+                           content_type=NPY_MIMETYPE)
+    assert response.status_code == 400
+    assert 'no válido' in response.get_json()['error']
+
+
+def test_analyze_empty_csv_is_bad_request(client):
+    response = client.post('/analyze/consumption', data=b'', content_type='text/csv')
+    assert response.status_code == 400